@@ -0,0 +1,36 @@
+"""
+Simulations per second against the depth of the simulations, on the Tiger 
+problem whose simulations always reach max_depth.
+
+    python -m bench.backprop [sims]
+"""
+import sys
+import time
+import random
+from mcts.pomcp import POMCP
+from mcts.tree import Node
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.tiger.model import Tiger, Observation
+
+DEPTHS = [5, 10, 20, 40]
+
+
+def main(sims=300):
+    random.seed(0)
+    proc = Tiger()
+    print("{:>8} {:>10}".format("depth", "sims/s"))
+    for depth in DEPTHS:
+        ctx = POMCP(gamma=1.0, epsilon=0.0, max_depth=depth, timeout=3600, c=2, log=0, seed=0)
+        ctx.params['start_time'] = ctx.clock()
+        h = History()
+        h.add(POMDPAction(), Observation())
+        root = Node(POMDPAction(), h, 0, 0, list())
+        start = time.time()
+        for _ in range(sims):
+            ctx.simulate(proc.initial_belief(), root, proc)
+        print("{:>8} {:>10.1f}".format(depth, sims / (time.time() - start)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
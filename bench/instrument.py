@@ -0,0 +1,53 @@
+"""
+Time split of searches by phase, and cost of the instrumentation: the same searches 
+are timed with params['instrument'] off and on.
+
+    python -m bench.instrument [height width mines [iterations [repeat]]]
+"""
+import sys
+import time
+import random
+from mcts.pomcp import POMCP
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.minesweeper.model import Action, Observation, Minesweeper
+from problems.minesweeper.globals import UNCOV
+from bench.transposition import position
+
+
+def searches(h, w, m, states, iterations, instrument):
+    """
+    Return:
+        (float, POMCP): CPU time of a search from each state, and the context of the last one
+    """
+    elapsed = 0.0
+    for s in states:
+        ctx = POMCP(log=0, timeout=3600, prefs=False, seed=0, instrument=instrument)
+        proc = Minesweeper(h, w, m)
+        proc.set_params(ctx.params)
+        hist = History()
+        hist.add(POMDPAction(), Observation([[UNCOV] * w for _ in range(h)], m))
+        hist.add(Action(0, 0), Observation(s.board.knowledge, m))
+        start = time.process_time()
+        ctx.search(hist, proc, iterations, clean=True)
+        elapsed += time.process_time() - start
+    return elapsed, ctx
+
+
+def main(h=9, w=9, m=10, iterations=500, repeat=3):
+    random.seed(0)
+    states = [position(h, w, m, random.randint(0, 2)) for _ in range(5)]
+    states = [s for s in states if not s.is_goal()]
+    off = on = 0.0
+    for _ in range(repeat):
+        off += searches(h, w, m, states, iterations, False)[0]
+        t, ctx = searches(h, w, m, states, iterations, True)
+        on += t
+    n = repeat * len(states)
+    print("search of {} iterations: {:.1f} ms off, {:.1f} ms on ({:+.1%})".format(
+        iterations, off / n * 1e3, on / n * 1e3, on / off - 1))
+    print(ctx.stats.to_json(indent=2))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,89 @@
+"""
+Memory per node and time of the UCB1 selection, on a tree grown by simulations.
+
+Memory is the size of the allocations made while growing the tree, particles and
+observations included, divided by the number of nodes (children not visited yet
+included). The layout is the size of the node itself: its attributes, belief, children
+container and history object. Selection is timed on each expanded node of the tree.
+
+    python -m bench.node [height width mines [sims [repeat]]]
+"""
+import sys
+import time
+import random
+import tracemalloc
+from mcts.pomcp import POMCP
+from mcts.tree import Node
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.minesweeper.board import Board
+from problems.minesweeper.model import Minesweeper, Observation
+
+
+def nodes(root):
+    """
+    Return:
+        list: the nodes of the subtree of root
+    """
+    found = []
+    fringe = [root]
+    while fringe:
+        node = fringe.pop()
+        found.append(node)
+        fringe.extend(node.children.values())
+    return found
+
+
+def layout(node):
+    """
+    Return:
+        int: size in bytes of the node, its belief, its children container and its history
+    """
+    # the history of a node is owned by the node, or not copied yet (_h)
+    h = node._h if hasattr(node, '_h') else node.h
+    size = 0
+    for o in [node, getattr(node, '__dict__', None), node.B, getattr(node.B, '__dict__', None),
+            node.B.particles, node.B.weights, node.children, h]:
+        if o is not None:
+            size += sys.getsizeof(o)
+    # statistics arrays of the children, if any
+    for a in (getattr(node.children, 'N', None), getattr(node.children, 'V', None)):
+        if a is not None:
+            size += a.nbytes
+    return size
+
+
+def main(h=9, w=9, m=10, sims=2000, repeat=20):
+    random.seed(0)
+    ctx = POMCP(timeout=3600, log=0, c=1.0, seed=0, start_time=time.time())
+    proc = Minesweeper(h, w, m)
+    proc.set_params(ctx.params)
+    hist = History()
+    hist.add(POMDPAction(), Observation(Board(h, w, m).knowledge, m))
+    # observations, particles and rollouts allocated before the tree is measured
+    for _ in range(sims):
+        ctx.simulate(proc.initial_belief(), Node(POMDPAction(), hist.clone(), 0, 0, list()), proc)
+    tracemalloc.start()
+    root = Node(POMDPAction(), hist.clone(), 0, 0, list())
+    start = time.time()
+    with ctx.activate():
+        for _ in range(sims):
+            ctx.simulate(proc.initial_belief(), root, proc)
+    elapsed = time.time() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tree = nodes(root)
+    expanded = [node for node in tree if node.inTree and node.children]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for node in expanded:
+            ctx.UCB1_action_selection(node)
+    selection = (time.perf_counter() - start) / (repeat * len(expanded))
+    print("{:>10} {:>10} {:>14} {:>14} {:>14} {:>10}".format(
+        "nodes", "expanded", "bytes/node", "layout/node", "selection/us", "sims/s"))
+    print("{:>10} {:>10} {:>14.0f} {:>14.0f} {:>14.2f} {:>10.0f}".format(len(tree), len(expanded), 
+        size / len(tree), sum(map(layout, tree)) / len(tree), selection * 1e6, sims / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,41 @@
+"""
+Scaling of root-parallel search: simulations per second from 1 to N worker 
+processes, each running a fixed number of simulations from the first move.
+
+    python -m bench.parallel [max_workers [sims]]
+"""
+import sys
+import time
+import random
+import multiprocessing
+from mcts.pomcp import params, search
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.minesweeper.board import Board
+from problems.minesweeper.model import Minesweeper, Observation
+
+
+def main(max_workers=multiprocessing.cpu_count(), sims=500, h=9, w=9, m=10):
+    random.seed(0)
+    proc = Minesweeper(h, w, m, bitboard=True)
+    proc.set_params(params)
+    params.update({'timeout': 3600, 'log': 0, 'prefs': False})
+    hist = History()
+    hist.add(POMDPAction(), Observation(Board(h, w, m).knowledge, m))
+    workers = 1
+    print("{:>8} {:>10} {:>8}".format("workers", "sims/s", "speedup"))
+    base = None
+    while workers <= max_workers:
+        if workers > 1:
+            # fork the pool before timing
+            search(hist.clone(), proc, sims, workers=workers)
+        start = time.time()
+        search(hist.clone(), proc, sims, workers=workers)
+        rate = workers * sims / (time.time() - start)
+        base = base or rate
+        print("{:>8} {:>10.1f} {:>7.2f}x".format(workers, rate, rate / base))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
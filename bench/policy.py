@@ -0,0 +1,84 @@
+"""
+Quality of the value estimates of each rollout policy, for a fixed CPU time.
+
+On positions reached by a few safe probes, the value Q(a) of each covered cell is
+estimated by playouts after probing it, from boards drawn from the exact posterior
+of the observation. Estimates are good when they rank cells as their exact mine
+probabilities do: the table reports the correlation between Q(a) and P(safe), the
+exact mine probability of the cell of highest Q(a) (the cell of lowest probability
+for reference) and the number of playouts per CPU second.
+
+    python -m bench.policy [height width mines [positions [budget]]]
+"""
+import sys
+import time
+import random
+import numpy as np
+from problems.minesweeper.model import Action, Observation
+from problems.minesweeper.solver import Solver
+from problems.minesweeper.policy import POLICIES
+from problems.minesweeper.globals import UNCOV
+from problems.minesweeper import batch
+from bench.transposition import position
+
+# boards drawn per cell at each round
+BATCH = 8
+
+
+def estimate(s, policy, budget, rng):
+    """
+    Return:
+        (dict, int): estimate of the value of each covered cell and number of playouts, 
+        within budget CPU seconds
+    """
+    b = s.board
+    solver = Solver(b.knowledge, b.m)
+    cells = [(r, c) for r in range(b.h) for c in range(b.w) if b.knowledge[r][c] == UNCOV]
+    total = {cell: 0.0 for cell in cells}
+    count = {cell: 0 for cell in cells}
+    playouts = 0
+    start = time.process_time()
+    while time.process_time() - start < budget:
+        for cell in cells:
+            particles = []
+            rewards = []
+            for _ in range(BATCH):
+                p = s.with_mines(solver.sample())
+                o, r = Action(*cell).do_on(p)
+                particles.append(p)
+                rewards.append(r)
+            R = batch.rollouts(particles, 1, 1.0, 0.0, b.h * b.w / 2, rng, policy)
+            total[cell] += sum(rewards) + float(np.sum(R))
+            count[cell] += BATCH
+            playouts += BATCH
+    return {cell: total[cell] / count[cell] for cell in cells}, playouts
+
+
+def main(h=9, w=9, m=10, positions=10, budget=1.0):
+    random.seed(0)
+    states = [position(h, w, m, random.randint(1, 3)) for _ in range(positions)]
+    states = [s for s in states if not s.is_goal()]
+    oracle = np.mean([min(P[r][c] for r in range(h) for c in range(w) if s.board.knowledge[r][c] == UNCOV)
+        for s, P in ((s, Observation(s.board.knowledge, m).mine_probabilities()) for s in states)])
+    print("{} positions, {:.1f} CPU s each, lowest P(mine) {:.3f}".format(len(states), budget, oracle))
+    print("{:>10} {:>12} {:>14} {:>12}".format("policy", "playouts/s", "corr(Q, safe)", "P(mine)"))
+    for name, policy in POLICIES.items():
+        rng = np.random.default_rng(0)
+        corr = risk = playouts = 0.0
+        for s in states:
+            P = Observation(s.board.knowledge, m).mine_probabilities()
+            Q, n = estimate(s, policy, budget, rng)
+            cells = list(Q)
+            q = np.array([Q[cell] for cell in cells])
+            safe = np.array([1 - P[r][c] for r, c in cells])
+            corr += np.corrcoef(q, safe)[0, 1] if q.std() > 0 and safe.std() > 0 else 0.0
+            best = max(cells, key=Q.get)
+            risk += P[best[0]][best[1]]
+            playouts += n
+        k = len(states)
+        print("{:>10} {:>12.0f} {:>14.3f} {:>12.3f}".format(name, playouts / (k * budget), corr / k, risk / k))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]], *[int(arg) for arg in sys.argv[4:5]],
+        *[float(arg) for arg in sys.argv[5:6]])
@@ -0,0 +1,47 @@
+"""
+Profile of State.probe (random playouts) and Minesweeper.invigoration on the
+list backend, sorted by own time.
+
+    python -m bench.profile [height width mines [playouts [top]]]
+"""
+import sys
+import random
+import cProfile
+import pstats
+from mcts.pomcp import params
+from mcts.tree import Belief
+from problems.minesweeper.board import Board
+from problems.minesweeper.model import State, Action, Minesweeper
+
+
+def playouts(state, n):
+    for _ in range(n):
+        s = state.clone()
+        o, r = Action(0, 0).do_on(s)
+        while not o.is_terminal():
+            a = random.choice(list(o.available_actions()))
+            o, r = a.do_on(s)
+
+
+def invigorations(state, n):
+    proc = Minesweeper(state.board.h, state.board.w, state.board.m)
+    proc.set_params(params)
+    s = state.clone()
+    Action(0, 0).do_on(s)
+    for _ in range(n):
+        B = Belief([s], params['K'])
+        proc.invigoration(B, params['K'] ** 2)
+
+
+def main(h=16, w=16, m=40, n=50, top=12):
+    random.seed(0)
+    state = State(Board(h, w, m))
+    for name, kernel in [('probe', playouts), ('invigoration', invigorations)]:
+        print("-- {} --".format(name))
+        profiler = cProfile.Profile()
+        profiler.runcall(kernel, state, n)
+        pstats.Stats(profiler).sort_stats('tottime').print_stats(top)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
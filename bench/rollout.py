@@ -0,0 +1,48 @@
+"""
+Random playouts per second, one at a time with mcts.pomcp.rollout and 
+batched with Minesweeper.rollouts.
+
+    python -m bench.rollout [batch [playouts]]
+"""
+import sys
+import time
+import random
+from mcts.pomcp import params, rollout
+from mcts.tree import Node
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.minesweeper.model import Minesweeper, Action
+
+BOARDS = [(5, 5, 10), (9, 9, 10)]
+
+
+def main(size=64, playouts=1024):
+    random.seed(0)
+    print("{:>8} {:>10} {:>12} {:>12} {:>8}".format("board", "backend", "single/s", "batch/s", "gain"))
+    for h, w, m in BOARDS:
+        for bitboard in [False, True]:
+            proc = Minesweeper(h, w, m, bitboard)
+            proc.set_params(params)
+            params.update({'timeout': 3600, 'log': 0, 'start_time': time.time()})
+            # start from the position reached after a first probe in the corner
+            s = proc.initial_belief()
+            o, r = Action(0, 0).do_on(s)
+            hist = History()
+            hist.add(Action(0, 0), o)
+            node = Node(POMDPAction(), hist, 0, 0, list())
+
+            start = time.time()
+            for _ in range(playouts // 8):
+                rollout(s, node, 1)
+            single = (playouts // 8) / (time.time() - start)
+
+            start = time.time()
+            for _ in range(playouts // size):
+                proc.rollouts([s] * size, 1, params['gamma'], params['epsilon'], params['max_depth'])
+            batched = (playouts // size * size) / (time.time() - start)
+            print("{:>8} {:>10} {:>12.1f} {:>12.1f} {:>7.1f}x".format(
+                "{}x{}m{}".format(h, w, m), "bitboard" if bitboard else "list", single, batched, batched / single))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,87 @@
+"""
+Particles per millisecond of the exact sampler (problems.minesweeper.solver) against
+the uniform resampling of uncovs, how many of them agree with the observation and 
+how many distinct layouts of the fringe they cover.
+
+    python -m bench.sampler [height width mines [particles]]
+"""
+import sys
+import time
+import random
+from problems.minesweeper.board import Board
+from problems.minesweeper.bitboard import BitBoard
+from problems.minesweeper.model import State, BitState, Action
+from problems.minesweeper.solver import Solver
+from problems.minesweeper.globals import UNCOV, MINE
+
+
+def opening(state, probes=6):
+    """
+    Probe safe cells at random until a few hints are revealed
+    """
+    b = state.board
+    Action(0, 0).do_on(state)
+    for _ in range(probes):
+        safe = [(r, c) for r in range(b.h) for c in range(b.w)
+            if b.knowledge[r][c] == UNCOV and b.minefield[r][c] is not MINE]
+        Action(*random.choice(safe)).do_on(state)
+    return state
+
+
+def valid(particle, state):
+    # every revealed hint must count the mines around it
+    m = particle.board.minefield
+    k = state.board.knowledge
+    for r in range(len(k)):
+        for c in range(len(k[0])):
+            if isinstance(k[r][c], int):
+                if k[r][c] != sum(1 for R, C in particle.board.neighbourhood(r, c) if m[R][C] is MINE):
+                    return False
+    return True
+
+
+def fringe(particle, state):
+    return tuple(sorted(cell for cell in state.fringe if particle.board.minefield[cell[0]][cell[1]] is MINE))
+
+
+def main(h=16, w=16, m=40, n=2000):
+    random.seed(0)
+    state = opening(State(Board(h, w, m)))
+    bitstate = BitState(BitBoard(h, w, m))
+    bitstate.board.place_mines(sum(1 << (r * w + c) for r in range(h) for c in range(w)
+        if state.board.minefield[r][c] is MINE))
+    for r in range(h):
+        for c in range(w):
+            if state.board.knowledge[r][c] != UNCOV:
+                bitstate.board.revealed |= 1 << (r * w + c)
+
+    start = time.time()
+    solver = Solver(state.board.knowledge, m)
+    print("{:>24} {:>10.3f} ms".format("solver setup", (time.time() - start) * 1000))
+
+    start = time.time()
+    Solver(state.board.knowledge, m).probabilities()
+    print("{:>24} {:>10.3f} ms".format("mine probabilities", (time.time() - start) * 1000))
+
+    start = time.time()
+    masks = [solver.sample() for _ in range(n)]
+    print("{:>24} {:>10.1f} /ms".format("boards (masks)", n / ((time.time() - start) * 1000)))
+
+    particles = dict()
+    for name, s in [('list', state), ('bitboard', bitstate)]:
+        start = time.time()
+        particles[name] = [s.with_mines(mask) for mask in masks]
+        print("{:>24} {:>10.1f} /ms".format("with_mines " + name, n / ((time.time() - start) * 1000)))
+
+    start = time.time()
+    resampled = [state.resample() for _ in range(n)]
+    print("{:>24} {:>10.1f} /ms".format("resample list", n / ((time.time() - start) * 1000)))
+
+    print("{:>24} {:>10.1%}".format("valid exact", sum(valid(p, state) for p in particles['list']) / n))
+    print("{:>24} {:>10.1%}".format("valid resample", sum(valid(p, state) for p in resampled) / n))
+    print("{:>24} {:>10}".format("fringe layouts exact", len({fringe(p, state) for p in particles['list']})))
+    print("{:>24} {:>10}".format("fringe layouts resample", len({fringe(p, state) for p in resampled})))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,71 @@
+"""
+Time of the selection among the children of the expanded nodes of a tree, for each 
+selection strategy, against the former loop computing UCB1 child by child. Timed on 
+all the expanded nodes, then on those whose children were all visited (scored by 
+every strategy).
+
+    python -m bench.selection [height width mines [sims [repeat]]]
+"""
+import sys
+import math
+import time
+import random
+from mcts.pomcp import POMCP
+from mcts.selection import SELECTIONS
+from mcts.tree import Node
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.minesweeper.board import Board
+from problems.minesweeper.model import Minesweeper, Observation
+from bench.node import nodes
+
+
+def loop(node, c):
+    """
+    UCB1 of each child in a Python loop, as before the selection strategies
+    """
+    def UCB1(child, N):
+        try:
+            return child.V + c * math.sqrt(math.log(N) / child.N)
+        except (ZeroDivisionError, ValueError):
+            return math.inf
+    return max([(a, UCB1(child, node.N)) for a, child in node.children.items()], key=lambda t: t[1])
+
+
+def main(h=16, w=16, m=40, sims=300, repeat=20):
+    random.seed(0)
+    ctx = POMCP(timeout=3600, log=0, seed=0, start_time=time.time())
+    proc = Minesweeper(h, w, m)
+    proc.set_params(ctx.params)
+    hist = History()
+    hist.add(POMDPAction(), Observation(Board(h, w, m).knowledge, m))
+    root = Node(POMDPAction(), hist, 0, 0, list())
+    with ctx.activate():
+        for _ in range(sims):
+            ctx.simulate(proc.initial_belief(), root, proc)
+    expanded = [node for node in nodes(root) if node.inTree and node.children]
+    # nodes whose children are all scored
+    visited = [node for node in expanded if node.N > 0 and node.children.first_unvisited() is None]
+    c = ctx.params['c']
+    print("{:>12} {:>10} {:>10} {:>14}".format("selection", "nodes", "children", "time/us"))
+    for group in (expanded, visited):
+        if not group:
+            continue
+        children = sum(len(node.children) for node in group) / len(group)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for node in group:
+                loop(node, c)
+        elapsed = (time.perf_counter() - start) / (repeat * len(group))
+        print("{:>12} {:>10} {:>10.0f} {:>14.2f}".format("loop", len(group), children, elapsed * 1e6))
+        for name in SELECTIONS:
+            ctx.params['selection'] = name
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for node in group:
+                    ctx.UCB1_action_selection(node)
+            elapsed = (time.perf_counter() - start) / (repeat * len(group))
+            print("{:>12} {:>10} {:>10.0f} {:>14.2f}".format(name, len(group), children, elapsed * 1e6))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,32 @@
+"""
+Random playouts per second with the list and the bitboard state backends.
+
+    python -m bench.state [height width mines [playouts]]
+"""
+import sys
+import time
+import random
+from problems.minesweeper.board import Board
+from problems.minesweeper.bitboard import BitBoard
+from problems.minesweeper.model import State, BitState, Action
+
+
+def playout(state):
+    s = state.clone()
+    o, r = Action(0, 0).do_on(s)
+    while not o.is_terminal():
+        a = random.choice(list(o.available_actions()))
+        o, r = a.do_on(s)
+
+
+def main(h=16, w=16, m=40, playouts=50):
+    random.seed(0)
+    for name, state in [('list', State(Board(h, w, m))), ('bitboard', BitState(BitBoard(h, w, m)))]:
+        start = time.time()
+        for _ in range(playouts):
+            playout(state)
+        print("{:>10} {:>10.1f} playouts/s".format(name, playouts / (time.time() - start)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,263 @@
+"""
+Benchmark suite of the hot paths of the search, on 5x5, 9x9 and 16x16 boards, with
+fixed seeds. Each kernel is measured REPEATS times over the run, each time called until
+it ran for a minimum time, and the distribution of the duration of its calls is saved to JSON. 
+Results can be compared against a stored baseline (bench/baseline.json), in which case
+the suite fails when the fastest call of a kernel got slower than the baseline by more
+than the threshold, and by more than NOISE_FLOOR.
+
+    python -m bench.suite [-o results.json] [-b baseline.json] [-t threshold] [-k kernel,...] [-s size,...]
+
+Save a new baseline (on the machine that runs the comparisons) with
+    python -m bench.suite -o bench/baseline.json
+"""
+import sys
+import json
+import time
+import getopt
+import random
+import platform
+import statistics
+from collections import OrderedDict
+import numpy as np
+from mcts.pomcp import POMCP
+from mcts.tree import Node, Belief
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.minesweeper.model import Action, Observation, Minesweeper
+from problems.minesweeper.globals import UNCOV, MINE
+from bench.transposition import position
+from bench.node import nodes
+
+SIZES = OrderedDict([('5x5', (5, 5, 3)), ('9x9', (9, 9, 10)), ('16x16', (16, 16, 40))])
+SEED = 0
+# minimum number of calls and running time of each kernel, the minimum number of calls
+# is not enforced past MAX_TIME
+ROUNDS = 25
+MIN_TIME = 0.2
+MAX_TIME = 2.0
+# measures of each kernel, in as many passes over the suite
+REPEATS = 3
+# slowdown in seconds always ignored, as noise of the kernels of a few microseconds
+NOISE_FLOOR = 2e-6
+# simulations growing the tree of the fixture, iterations of the timed searches
+SIMULATIONS = 200
+ITERATIONS = 50
+BASELINE = 'bench/baseline.json'
+
+class Fixture(object):
+    """
+    Position, search context and tree of a board size, all built from SEED.
+
+    Attributes:
+        state (State): board after a first probe in the corner and two safe probes
+        knowledge (list): knowledge matrix of the state
+        history (History): history of the first probe, ending with the observation of the state
+        ctx (POMCP): search context
+        proc (Minesweeper): decision process
+        root (Node): tree grown by SIMULATIONS simulations from the history
+    """
+    def __init__(self, h, w, m):
+        random.seed(SEED)
+        self.h, self.w, self.m = h, w, m
+        self.state = position(h, w, m, 2)
+        self.knowledge = self.state.board.knowledge
+        self.history = History()
+        self.history.add(POMDPAction(), Observation([[UNCOV] * w for _ in range(h)], m))
+        self.history.add(Action(0, 0), Observation(self.knowledge, m))
+        self.ctx, self.proc = self.context()
+        self.root = Node(POMDPAction(), self.history.clone(), 0, 0, list(), capacity=self.ctx.params['K'])
+        self.proc.empty_belief(self.root.B, self.history)
+        with self.ctx.activate():
+            for _ in range(SIMULATIONS):
+                self.ctx.simulate(self.root.B.sample(self.ctx.rng), self.root, self.proc)
+        self.expanded = [node for node in nodes(self.root) if node.inTree and node.children]
+        self.safe = [(r, c) for r in range(h) for c in range(w)
+            if self.knowledge[r][c] == UNCOV and self.state.board.minefield[r][c] is not MINE]
+
+    def context(self):
+        """
+        Return:
+            (POMCP, Minesweeper): a new search context and decision process, seeded
+        """
+        ctx = POMCP(log=0, timeout=3600, prefs=False, seed=SEED, start_time=time.time())
+        proc = Minesweeper(self.h, self.w, self.m, seed=SEED)
+        proc.set_params(ctx.params)
+        return ctx, proc
+
+# kernels by name: functions of a fixture returning (setup, run), where run(setup())
+# is one timed call (setup is not timed and may be None)
+KERNELS = OrderedDict()
+
+def kernel(name):
+    def register(f):
+        KERNELS[name] = f
+        return f
+    return register
+
+def cycle(items):
+    """
+    Return:
+        callable: returns the items in turn
+    """
+    items = list(items)
+    i = [0]
+    def next_item():
+        i[0] = (i[0] + 1) % len(items)
+        return items[i[0]]
+    return next_item
+
+@kernel('State.clone')
+def state_clone(f):
+    return None, lambda _: f.state.clone()
+
+@kernel('State.probe')
+def state_probe(f):
+    cell = cycle(f.safe)
+    return (lambda: (f.state.clone(), cell())), lambda args: args[0].probe(*args[1], log=False)
+
+@kernel('Observation.hash')
+def observation_hash(f):
+    return None, lambda _: hash(Observation(f.knowledge, f.m))
+
+@kernel('History.clone')
+def history_clone(f):
+    return None, lambda _: f.history.clone()
+
+@kernel('Node.find')
+def node_find(f):
+    history = cycle(node.h.clone() for node in nodes(f.root) if node.inTree)
+    return history, lambda h: f.root.find(h)
+
+@kernel('UCB1_action_selection')
+def ucb1(f):
+    return cycle(f.expanded), lambda node: f.ctx.UCB1_action_selection(node)
+
+@kernel('rollout')
+def rollout(f):
+    return cycle(f.root.B), lambda s: f.ctx.rollout(s, f.root, 0)
+
+@kernel('simulate')
+def simulate(f):
+    return cycle(f.root.B), lambda s: f.ctx.simulate(s, f.root, f.proc)
+
+@kernel('search')
+def search(f):
+    return f.context, lambda args: args[0].search(f.history.clone(), args[1], ITERATIONS, clean=True)
+
+@kernel('Minesweeper.invigoration')
+def invigoration(f):
+    K = f.ctx.params['K']
+    # K particles added to a copy of the belief of the root
+    return (lambda: Belief(f.root.B, capacity=2 * K)), lambda B: f.proc.invigoration(B, K * K)
+
+def summary(measures):
+    """
+    Return:
+        dict: statistics of the duration of the calls over several measures (see measure)
+    """
+    medians = [m['median'] for m in measures]
+    return {
+        'rounds': sum(m['rounds'] for m in measures),
+        'min': min(m['min'] for m in measures),
+        'median': statistics.median(medians),
+        'mean': statistics.mean(m['mean'] for m in measures)
+    }
+
+def measure(setup, run):
+    """
+    Return:
+        dict: statistics of the duration of the calls, in seconds
+    """
+    times = []
+    total = 0.0
+    while (len(times) < ROUNDS or total < MIN_TIME) and (len(times) < 2 or total < MAX_TIME):
+        args = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(args)
+        t = time.perf_counter() - start
+        times.append(t)
+        total += t
+    return {
+        'rounds': len(times),
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': total / len(times)
+    }
+
+def run_suite(kernels, sizes):
+    """
+    Measure the kernels REPEATS times, in passes over the whole suite so that the 
+    measures of a kernel are spread over the run.
+
+    Return:
+        dict: results of each kernel on each size, by 'kernel/size' (see summary)
+    """
+    fixtures = [(size, Fixture(*SIZES[size])) for size in sizes]
+    measures = OrderedDict()
+    for _ in range(REPEATS):
+        for size, f in fixtures:
+            with f.ctx.activate():
+                for name in kernels:
+                    # each measure draws the same numbers
+                    random.seed(SEED)
+                    f.ctx.seed(SEED)
+                    f.proc.seed(SEED)
+                    measures.setdefault('{}/{}'.format(name, size), []).append(measure(*KERNELS[name](f)))
+    return OrderedDict((key, summary(m)) for key, m in measures.items())
+
+def compare(results, baseline, threshold):
+    """
+    Compare the fastest calls of the kernels, which only get slower with the noise of 
+    the machine. A kernel regresses when it is slower than the baseline by more than 
+    threshold and by more than NOISE_FLOOR.
+
+    Return:
+        list: (key, ratio of the fastest calls) of the kernels that regressed
+    """
+    regressions = []
+    for key, r in results.items():
+        if key in baseline:
+            base = baseline[key]['min']
+            ratio = r['min'] / base
+            r['baseline'] = ratio
+            if ratio > 1 + threshold and r['min'] - base > NOISE_FLOOR:
+                regressions.append((key, ratio))
+    return regressions
+
+def main(argv):
+    opts, _ = getopt.getopt(argv, "o:b:t:k:s:")
+    opts = dict(opts)
+    kernels = opts['-k'].split(',') if '-k' in opts else list(KERNELS)
+    sizes = opts['-s'].split(',') if '-s' in opts else list(SIZES)
+    threshold = float(opts.get('-t', 0.2))
+    results = run_suite(kernels, sizes)
+    baseline = None
+    path = opts.get('-b', BASELINE if opts.get('-o') != BASELINE else None)
+    if path is not None:
+        try:
+            with open(path) as f:
+                baseline = json.load(f)['results']
+        except FileNotFoundError:
+            print("no baseline at {}".format(path))
+    regressions = compare(results, baseline, threshold) if baseline else []
+
+    print("{:<36} {:>8} {:>14} {:>14} {:>10}".format("kernel", "rounds", "median/us", "min/us", "baseline"))
+    for key, r in results.items():
+        ratio = "{:.2f}x".format(r['baseline']) if 'baseline' in r else '-'
+        print("{:<36} {:>8} {:>14.2f} {:>14.2f} {:>10}".format(key, r['rounds'], r['median'] * 1e6, r['min'] * 1e6, ratio))
+    if '-o' in opts:
+        with open(opts['-o'], 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'results': results
+            }, f, indent=2)
+    for key, ratio in regressions:
+        print("regression: {} is {:.2f}x slower than the baseline".format(key, ratio))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
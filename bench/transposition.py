@@ -0,0 +1,70 @@
+"""
+Tree size and decision quality of searches with and without the transposition
+table, for a fixed time budget. The quality of a decision is the exact probability
+that the chosen cell is a mine (lower is better, see Observation.mine_probabilities).
+
+    python -m bench.transposition [height width mines [positions [budget]]]
+"""
+import sys
+import random
+from mcts.pomcp import POMCP
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.minesweeper.board import Board
+from problems.minesweeper.model import State, Action, Observation, Minesweeper
+from problems.minesweeper.globals import UNCOV, MINE
+
+CAPACITIES = [0, 1000, 100000]
+
+
+def position(h, w, m, probes):
+    """
+    Return:
+        State: a board after a first probe in the corner and a few random safe probes
+    """
+    s = State(Board(h, w, m))
+    Action(0, 0).do_on(s)
+    for _ in range(probes):
+        if s.is_goal():
+            break
+        b = s.board
+        safe = [(r, c) for r in range(h) for c in range(w)
+            if b.knowledge[r][c] == UNCOV and b.minefield[r][c] is not MINE]
+        Action(*random.choice(safe)).do_on(s)
+    return s
+
+
+def main(h=5, w=5, m=5, positions=10, budget=0.5):
+    random.seed(0)
+    states = [position(h, w, m, random.randint(0, 2)) for _ in range(positions)]
+    states = [s for s in states if not s.is_goal()]
+    print("{:>10} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+        "capacity", "sims/s", "nodes", "table", "hit rate", "P(mine)"))
+    for capacity in CAPACITIES:
+        sims = nodes = table = hits = lookups = 0
+        risk = 0.0
+        for s in states:
+            ctx = POMCP(log=0, timeout=budget, prefs=False, transposition=capacity, seed=0)
+            proc = Minesweeper(h, w, m)
+            proc.set_params(ctx.params)
+            # the clean root gets its belief from the exact posterior (see empty_belief)
+            hist = History()
+            hist.add(POMDPAction(), Observation([[UNCOV] * w for _ in range(h)], m))
+            o = Observation(s.board.knowledge, m)
+            hist.add(Action(0, 0), o)
+            a = ctx.search(hist, proc, 10 ** 9, clean=True)
+            sims += ctx.iterations
+            nodes += ctx.tree_size()
+            if ctx.table is not None:
+                table += len(ctx.table)
+                hits += ctx.table.hits
+                lookups += ctx.table.hits + ctx.table.misses
+            risk += o.mine_probabilities()[a.cell[0]][a.cell[1]]
+        n = len(states)
+        print("{:>10} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.1%} {:>12.3f}".format(
+            capacity, sims / (n * budget), nodes / n, table / n, hits / lookups if lookups else 0, risk / n))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]], *[int(arg) for arg in sys.argv[4:5]],
+        *[float(arg) for arg in sys.argv[5:6]])
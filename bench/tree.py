@@ -0,0 +1,39 @@
+"""
+Simulations per second against the size of the tree.
+
+The membership test performed by simulate at each step of the descent should 
+not depend on the number of nodes in the tree, so the rate should stay flat 
+as the tree grows.
+
+    python -m bench.tree [height width mines [windows [sims]]]
+"""
+import sys
+import time
+import random
+from mcts.pomcp import params, simulate
+from mcts.tree import Node
+from mdp.history import History
+from mdp.pomdp import POMDPAction
+from problems.minesweeper.board import Board
+from problems.minesweeper.model import Minesweeper, Observation
+
+
+def main(h=8, w=8, m=10, windows=10, sims=200):
+    random.seed(0)
+    proc = Minesweeper(h, w, m)
+    proc.set_params(params)
+    params.update({'timeout': 3600, 'log': 0, 'start_time': time.time()})
+    hist = History()
+    hist.add(POMDPAction(), Observation(Board(h, w, m).knowledge, m))
+    root = Node(POMDPAction(), hist, 0, 0, list())
+    print("{:>8} {:>10} {:>10}".format("window", "nodes", "sims/s"))
+    for i in range(windows):
+        start = time.time()
+        for _ in range(sims):
+            simulate(proc.initial_belief(), root, proc)
+        rate = sims / (time.time() - start)
+        print("{:>8} {:>10} {:>10.1f}".format(i, len(root.index), rate))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
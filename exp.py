@@ -1,9 +1,14 @@
 from problems.minesweeper.board import Board
 from problems.minesweeper.player import RandomPlayer, MCPlayer, QPlayer, train_Qplayer
 from problems.minesweeper.play import play_minesweeper
+from mdp import seeding
 import os
 import sys
 import csv
+import shutil
+import glob
+import zlib
+import multiprocessing
 import traceback
 import getopt
 import time
@@ -49,92 +54,333 @@ AGENTS = {
     #'MCP_05': Agent(MCPlayer(INF, 0.5 ), 'MCP_05', 0),
     'MCP_10': Agent(MCPlayer(INF, 1.0 ), 'MCP_10', 1),
     #'MCP_15': Agent(MCPlayer(INF, 1.5 ), 'MCP_15', 2),
-    'MCP_20': Agent(MCPlayer(INF, 2.0 ), 'MCP_20', 3)
+    'MCP_20': Agent(MCPlayer(INF, 2.0 ), 'MCP_20', 3),
+
+    # mcts with logic deductions
+    'MCPD_10': Agent(MCPlayer(INF, 1.0, deduce=True), 'MCPD_10', 1)
 }
 
-def experiment(agents, iterations, boards):
+SHARDS = 'data/shards'
+# result files being merged from the shards (see merge_shards)
+JOURNAL = os.path.join(SHARDS, 'merge.journal')
+# columns of the result files
+COLUMNS = ['win', 'steps', 'seed', 'time', 'iterations', 'tree_size']
+# columns identifying a game in shards
+KEYS = ['agent', 'h', 'w', 'm', 'i']
+
+def filename(agent, b):
+    return "data/{}_{}x{}m{}.csv".format(agent.name, b[0], b[1], b[2])
+
+def rewrite(fname, columns):
+    """
+    Rewrite the csv file with the given header, atomically. Columns missing from the 
+    rows of the file are left empty.
+    """
+    with open(fname, newline='') as f:
+        rows = list(csv.DictReader(f))
+    tmp = fname + '.tmp'
+    with open(tmp, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns, restval='', extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, fname)
+
+class ResultSink(object):
+    """
+    Append-only csv file of game results. Each game is written once: rows are buffered
+    and written every flush_every rows or flush_time seconds, then synced to disk, so that 
+    an interrupted run loses at most one buffer.
+    The header of an existing file missing some of the columns (legacy files only have 
+    the win and steps columns) is migrated first, the old rows leaving them empty.
+
+    Attributes:
+        columns (list): columns of the file
+    """
+    def __init__(self, fname, columns=COLUMNS, flush_every=32, flush_time=60.0):
+        self.flush_every = flush_every
+        self.flush_time = flush_time
+        self.columns = columns
+        new = not os.path.exists(fname) or os.path.getsize(fname) == 0
+        if not new:
+            with open(fname, newline='') as f:
+                header = next(csv.reader(f), [])
+            missing = [c for c in columns if c not in header]
+            self.columns = header + missing
+            if missing:
+                print("{}: adding column(s) {}".format(fname, ', '.join(missing)))
+                rewrite(fname, self.columns)
+        self.f = open(fname, 'a', newline='')
+        self.writer = csv.writer(self.f)
+        if new:
+            self.writer.writerow(self.columns)
+        self.buffer = []
+        self.last_flush = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, **row):
+        """
+        Buffer a row given as column=value, missing columns are left empty
+        """
+        self.buffer.append([row.get(c, '') for c in self.columns])
+        if len(self.buffer) >= self.flush_every or time.time() - self.last_flush >= self.flush_time:
+            self.flush()
+
+    def flush(self):
+        self.writer.writerows(self.buffer)
+        self.buffer = []
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.last_flush = time.time()
 
-    def filename(agent, b):
-        return "data/{}_{}x{}m{}.csv".format(agent.name, b[0], b[1], b[2])
-    # check if csv file exists and generate it otherwise
-    # setup result dict
-    res = dict()
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+def game_seed(seed, name, b, i):
+    """
+    Seed of a game, stable across processes and runs
+    """
+    return zlib.crc32("{}:{}:{}x{}m{}:{}".format(seed, name, b[0], b[1], b[2], i).encode())
+
+def run_game(agent, b, i, seed):
+    """
+    Play one game with the given seed, from which independent seeds of the board 
+    and of the player are spawned.
+
+    Return:
+        dict: the columns of the game, None if the player failed
+    """
+    board_seed, player_seed = seeding.spawn(seed, 2)
+    agent.player.seed(player_seed)
+    start = time.time()
+    try:
+        w, s = play_minesweeper(agent.player, Board(b[0], b[1], b[2], seeding.python_rng(board_seed)), False)
+    except (AssertionError, KeyError, IndexError):
+        with open('err.txt', 'a') as err:
+            err.write("iteration {}\n Agent {}".format(i, agent.name))
+            tb = sys.exc_info()[2]
+            traceback.print_tb(tb, file=err)
+        return None
+    row = dict(win=w, steps=s, seed=seed, time=round(time.time() - start, 4))
+    row.update(agent.player.stats())
+    return row
+
+def experiment(agents, iterations, boards, seed=0):
+    # result file of each agent and board
+    sinks = dict()
     print("output setup")
-    for agent in agents:
-        for b in boards:
-            boardmap = res.get(agent.name, dict())
-            boardmap.update({b:[]})
-            res[agent.name]=boardmap
-            fname = filename(agent, b)
-            try:
-                with open(fname, 'x') as f:
-                    cW = csv.writer(f)
-                    cW.writerow(['win', 'steps'])
-            except FileExistsError:
-                pass
-    
-    
-    def main_loop(res):
+    try:
+        for agent in agents:
+            for b in boards:
+                sinks[(agent.name, b)] = ResultSink(filename(agent, b))
+
         errors = 0
         print("main loop")
-        first_q = False
-        mid = False 
-        third_q = False
+        quarters = 1
         start = time.time()
         for i in range(iterations):
-            if i / iterations > 0.25 and not first_q:
-                print("25% - {} min(s)".format( (time.time()-start)/60 ))
-                first_q = True
-            elif i / iterations > 0.5 and not mid:
-                print("50% - {} min(s)".format( (time.time()-start)/60 ))
-                mid = True
-            elif i / iterations > 0.75 and not third_q:
-                print("75% - {} min(s)".format( (time.time()-start)/60 ))
-                third_q = False
+            if i / iterations > quarters * 0.25:
+                print("{}% - {} min(s)".format(quarters * 25, (time.time()-start)/60 ))
+                quarters += 1
             for agent in agents:
                 for b in boards:
-                    try:
-                        w, s = play_minesweeper(agent.player, Board(b[0], b[1], b[2]), False)
-                        res[agent.name][b].append((w,s))
-                    except (AssertionError, KeyError, IndexError):
+                    row = run_game(agent, b, i, game_seed(seed, agent.name, b, i))
+                    if row is None:
                         errors += 1
-                        with open('err.txt', 'a') as err:
-                            err.write("iteration {}\n Agent {}".format(i, agent.name))
-                            tb = sys.exc_info()[2]
-                            traceback.print_tb(tb, file=err)      
-
-            for aname, b_res_list in res.items():
-                for b, res in b_res_list.items():
-                    with open(filename(AGENTS[aname], b), 'a') as f:
-                        cW = csv.writer(f)
-                        cW.writerows(res)  
+                    else:
+                        sinks[(agent.name, b)].write(**row)
         print("{} error(s)".format(errors))
         print("100% - {} min(s)".format( (time.time()-start)/60 ))
+    except KeyboardInterrupt:
+        print("interrupted")
+    finally:
+        for sink in sinks.values():
+            sink.close()
 
+# sink of the shard of a worker process
+_shard = None
+# agents of a worker process, by name
+_agents = dict()
 
+def init_worker(agents):
+    """
+    Set the agents played by a worker process.
+    """
+    global _agents
+    _agents = {agent.name: agent for agent in agents}
 
-    try:
-        main_loop(res)
-    except:
-        pass
-    finally:
-        for aname, b_res_list in res.items():
-            for b, res in b_res_list.items():
-                with open(filename(AGENTS[aname], b), 'a') as f:
-                    cW = csv.writer(f)
-                    cW.writerows(res)
+def play_game(task):
+    """
+    Play one game in a worker process and append its result to the shard of the worker.
+
+    Args:
+        task (tuple): agent name, board size, iteration and seed of the game
+    """
+    global _shard
+    name, b, i, seed = task
+    row = run_game(_agents[name], b, i, seed)
+    if row is None:
+        return False
+    if _shard is None:
+        # workers can be terminated at any time: do not buffer
+        _shard = ResultSink(os.path.join(SHARDS, "{}.csv".format(os.getpid())), KEYS + COLUMNS, flush_every=1)
+    _shard.write(agent=name, h=b[0], w=b[1], m=b[2], i=i, **row)
+    return True
+
+def read_shards():
+    """
+    Return:
+        dict: (agent name, board, iteration) -> columns of the games stored in shards
+    """
+    games = dict()
+    for shard in glob.glob(os.path.join(SHARDS, '*.csv')):
+        with open(shard, newline='') as f:
+            for row in csv.DictReader(f):
+                if None in row.values():
+                    # row cut by a crash
+                    continue
+                key = (row.pop('agent'), (int(row.pop('h')), int(row.pop('w')), int(row.pop('m'))), int(row.pop('i')))
+                games[key] = row
+    return games
 
+def prune_shard(shard, merged):
+    """
+    Remove from the shard the games of the merged agents and boards, and the shard 
+    itself once it is empty.
+
+    Args:
+        merged (set): (agent name, h, w, m) of the games merged into result files
+    """
+    with open(shard, newline='') as f:
+        reader = csv.DictReader(f)
+        columns = reader.fieldnames
+        rows = [row for row in reader if None not in row.values() 
+            and (row['agent'], int(row['h']), int(row['w']), int(row['m'])) not in merged]
+    if not rows:
+        os.remove(shard)
+        return
+    tmp = shard + '.tmp'
+    with open(tmp, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, shard)
+
+def finish_merge():
+    """
+    Complete a merge of the shards interrupted after its journal was written (see 
+    merge_shards): remove the merged games from the shards, then replace the result 
+    files by their merged copies. Does nothing if there is no journal.
+    """
+    if not os.path.exists(JOURNAL):
+        return
+    with open(JOURNAL, newline='') as f:
+        # result file, agent name, h, w, m
+        entries = [(fname, (name, int(h), int(w), int(m))) for fname, name, h, w, m in csv.reader(f)]
+    merged = {key for _, key in entries}
+    for shard in glob.glob(os.path.join(SHARDS, '*.csv')):
+        prune_shard(shard, merged)
+    for fname, _ in entries:
+        if os.path.exists(fname + '.merge'):
+            os.replace(fname + '.merge', fname)
+    os.remove(JOURNAL)
+
+def merge_shards(agents, boards):
+    """
+    Append the games stored in shards to the result file of each agent and board,
+    in iteration order, then remove them from the shards. Games of other agents and 
+    boards stay in the shards.
+    The merge can be interrupted at any time: the games are appended to copies of the 
+    result files, which only replace them once the journal listing them is on disk. 
+    Before that, the next run merges the shards again from the start, after that it 
+    completes the merge (see finish_merge).
+    """
+    finish_merge()
+    games = read_shards()
+    entries = []
+    for agent in agents:
+        for b in boards:
+            rows = sorted((i, row) for (name, board, i), row in games.items() if name == agent.name and board == tuple(b[:3]))
+            if not rows:
+                continue
+            fname = filename(agent, b)
+            if os.path.exists(fname):
+                shutil.copyfile(fname, fname + '.merge')
+            elif os.path.exists(fname + '.merge'):
+                os.remove(fname + '.merge')
+            with ResultSink(fname + '.merge') as sink:
+                for i, row in rows:
+                    sink.write(**row)
+            entries.append([fname, agent.name] + list(b[:3]))
+    with open(JOURNAL + '.tmp', 'w', newline='') as f:
+        csv.writer(f).writerows(entries)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(JOURNAL + '.tmp', JOURNAL)
+    finish_merge()
+
+def parallel_experiment(agents, iterations, boards, workers=multiprocessing.cpu_count(), seed=0):
+    """
+    Same as experiment, with games spread over a pool of processes. Each worker streams 
+    its results to its own shard in data/shards, merged into the result files at the end.
+    Games found in shards are skipped, so that an interrupted run can be resumed.
+
+    Args:
+        agents (list): agents to evaluate
+        iterations (int): number of games per agent and board
+        boards (list): board sizes (h, w, m)
+        workers (int): number of processes
+        seed (int): seed from which the seed of each game is derived
+    """
+    os.makedirs(SHARDS, exist_ok=True)
+    # shards of an interrupted merge are already in the result files
+    finish_merge()
+    done = read_shards()
+    tasks = [(agent.name, tuple(b[:3]), i, game_seed(seed, agent.name, b, i))
+        for i in range(iterations) for agent in agents for b in boards
+        if (agent.name, tuple(b[:3]), i) not in done]
+    print("{} game(s) to play, {} already done".format(len(tasks), len(done)))
+    start = time.time()
+    errors = 0
+    with multiprocessing.Pool(workers, init_worker, (agents,)) as pool:
+        for n, ok in enumerate(pool.imap_unordered(play_game, tasks), 1):
+            errors += 0 if ok else 1
+            if n % max(1, len(tasks) // 4) == 0:
+                print("{}% - {} min(s)".format(100 * n // len(tasks), (time.time()-start)/60 ))
+    print("{} error(s)".format(errors))
+    merge_shards(agents, boards)
 
 
 if __name__=='__main__' :
     it = 2
-    if len(sys.argv) > 1:
-        try: 
-            it = int(sys.argv[1])
-        except:
-            print("pyhon exp.py [iterations]")
-            sys.exit(2)
+    workers = 1
+    seed = 0
+    try: 
+        opts, args = getopt.getopt(sys.argv[1:], "j:s:")
+        for opt, val in opts:
+            if opt == '-j':
+                workers = int(val)
+            elif opt == '-s':
+                seed = int(val)
+        if len(args) > 0:
+            it = int(args[0])
+    except:
+        print("pyhon exp.py [-j workers] [-s seed] [iterations]")
+        sys.exit(2)
     ag = [AGENTS['MCNP_10'], AGENTS['MCP_10'], AGENTS['MCP_20'], AGENTS['RND']]
-    experiment(ag, it, ALL)
+    if workers > 1:
+        parallel_experiment(ag, it, ALL, workers, seed)
+    else:
+        experiment(ag, it, ALL, seed)
     
         
\ No newline at end of file
@@ -1,77 +1,53 @@
-from mdp.pomdp import POMDPAction, POMDPObservation, POMDPState, DecisionProcess
+from mdp.pomdp import POMDPAction, POMDPState, DecisionProcess
 from mdp.history import History
+from mdp import seeding
 from mcts.tree import Node, create_node
+from mcts.transposition import TranspositionTable
+from mcts.selection import selection
+from mcts.stats import SearchStats, install, uninstall
+from collections import namedtuple
 import scipy.signal as signal
+import numpy as np
+import multiprocessing
 import math
-import random
 import time
 import os
+from contextlib import contextmanager
+from time import perf_counter
+from contextvars import ContextVar
 
 
-params = {
-    'K': 50,            # number of particles (size of the belief state space)
-    'c': 0,             # exploration / exploitation ratio scalar constant (domain specific)
-    'epsilon': 0.0,     # history discount factor
-    'gamma': 1,         # reward discount factor
-    'R_lo': 0,          # lowest value V(h) reached 
-    'R_hi': 1,          # highest value V(h) reached
-    'timeout':120,      # timeout for each iteration in seconds
-    'start_time': 0,    # start time in seconds
-    'max_depth': 20,    # max depth
-    'log': 1,           # level of logs printed on console [0,2]
-    'prefs': True,      # enable/disable prefered actions
-    'root': Node(POMDPAction(), History(), 0, 0, list())
-}
-
-
-# start time
-start_time = 0
-
-
-def UCB1_action_selection(node, greedy=False):
+def default_params():
     """
-    Implementation of the UCB1 algorithm for solving a multi-armed bandit problem.
-
-    https://homes.di.unimi.it/~cesabian/Pubblicazioni/ml-02.pdf
-
-    Each action a available from the history h are assigned a value V(ha), 
-    computed from simulations of the POMDP from the history h.
-    In non-greedy mode, this value is augmented by an exploration bonus for rarely-tried actions.
-
-    Args:
-        node (Node): root node of the tree, containing history h
-        greedy (bool): enable/disable greedy mode
-
     Return:
-        (POMDPAction, float): best action and its UCB1 value 
+        dict: a new set of parameters with default values
     """
-    assert isinstance(node, Node)
-    assert node.inTree, "{} child(ren), {}".format(len(node.children), node.h)
-
-    def UCB1(child, N):
-        """
-        UCB1 formula, return infinity if N == 0
-        """
-        assert isinstance(child, Node)
-        v = child.V
-        if greedy:
-            return v
-        try:
-            v+= params['c']*math.sqrt(math.log(N)  /child.N) 
-        except ZeroDivisionError:
-            v = math.inf
-        except ValueError:
-            v = math.inf
-        finally:
-            return v
-             
-    # (action, UCB1val) list 
-    l = [ (a, UCB1(child, node.N)) for a, child in node.children.items() ]
-    a,f = max(l, key=lambda t: t[1])
-    if greedy and params['log'] >= 2:
-        print("tree history {}".format(node.h))
-        print( [(a, (child.N, child.V)) for a, child in node.children.items() ]  )
-    return (a,f)
+    return {
+        'K': 50,            # number of particles (size of the belief state space)
+        'c': 0,             # exploration / exploitation ratio scalar constant (domain specific)
+        'epsilon': 0.0,     # history discount factor
+        'gamma': 1,         # reward discount factor
+        'R_lo': 0,          # lowest value V(h) reached 
+        'R_hi': 1,          # highest value V(h) reached
+        'timeout':120,      # timeout for each iteration in seconds
+        'start_time': 0,    # start time in seconds
+        'max_depth': 20,    # max depth
+        'log': 1,           # level of logs printed on console [0,2]
+        'prefs': True,      # enable/disable prefered actions
+        'batch': 0,         # number of playouts per expansion, batched (0 for a single rollout)
+        'reuse': False,     # keep the subtree of the real action-observation between moves
+        'check_every': 16,  # number of simulations (or rollout steps) between two clock checks
+        'snapshot_every': 100, # number of simulations between two snapshots sent to the callback
+        'transposition': 0, # capacity of the transposition table (0 to disable it)
+        'selection': 'ucb1',# selection strategy of the children, in selection.SELECTIONS
+        'rollout': 'uniform', # rollout policy (see DecisionProcess.rollout_policy)
+        'instrument': False,# count and time the phases of searches (see mcts.stats)
+        'root': Node(POMDPAction(), History(), 0, 0, list())
+    }
+
+# progress of a search: number of simulations done, current best action 
+# and number of visits of each child of the root
+Snapshot = namedtuple('Snapshot', ['iterations', 'action', 'visits'])
 
 def discount_calc(rewards, discount):
     """
@@ -88,190 +64,605 @@ def discount_calc(rewards, discount):
     y = signal.lfilter(b, a, x=r)
     return y[::-1]
 
-def end_rollout(depth, h):
-    """
-    Predicate to test simulations ending criterion 
-    """
-    assert isinstance(h, History)
-    if params['gamma']**depth < params['epsilon'] or depth >= params['max_depth']:
-        #print("max depth")
-        return True
-    elif len(h) > 0 and h.last_obs().is_terminal():
-        #print("terminal obs")
-        return True
-    elif (time.time() - params['start_time']) >= params['timeout']:
-        if params['log'] >= 2:
-            print("time out")
-        #print(time.time() - params['start_time'])
-        return True
-    else:
-        return False
+# process pools, by number of workers
+_pools = dict()
 
-def rollout(state, node, depth, policy=None):
+def _pool(workers):
+    if workers not in _pools:
+        _pools[workers] = multiprocessing.Pool(workers)
+    return _pools[workers]
+
+def _search_worker(args):
     """
-    This function simulates the process with a defined action policy (random by default), 
-    from the given start state until a depth threshold is met (controlled by the epsilon param)
-    Args:
-        state (POMDPState): the start state
-        node (Node): node with current history h
-        depth (int): current depth in the tree
-        policy (History -> POMDPAction): function that takes a History as argument and return 
-        a POMDPAction
+    Build an independent tree in a worker process.
+
     Return:
-        float: the final reward of the random playout 
+        (int, dict): number of simulations and (N, V, B) of each child of the root, by action
     """
-    assert isinstance(node, Node)
-    assert isinstance(state, POMDPState)
-
-    s = state.clone()
-    h = node.h.clone()
-    d = depth
-    rewards = []
-    while not end_rollout(d, h):
-        # iterative implementation
-        if policy:
-            a = policy(h)
+    h, proc, max_iter, worker_params, belief, seed, deadline_ns = args
+    ctx_seed, proc_seed = seeding.spawn(seed, 2)
+    ctx = POMCP(worker_params, seed=ctx_seed)
+    # the copy of the process (and of the particles sharing its generators) would 
+    # otherwise draw the same numbers in every worker
+    proc.seed(proc_seed)
+    root = Node(h.last_action(), h, 0, 0, belief)
+    ctx.params['root'] = root
+    ite = ctx.run(root, proc, max_iter, deadline_ns)
+    return ite, {a: (c.N, c.V, list(c.B)) for a, c in root.children.items()}
+
+class POMCP(object):
+    """
+    Search context of POMCP. It owns the parameters, the tree, the random generator
+    and the clock of a search, so that several searches can run at the same time
+    without sharing any state.
+
+    Attributes:
+        params (dict): parameters of the search and root of the tree (see default_params)
+        rng (random.Random): random generator used by the search
+        seeds (np.random.SeedSequence): seed of the context, from which the seeds of the workers are spawned
+        clock (callable): returns the current time in seconds
+        clock_ns (callable): returns the current monotonic time in nanoseconds, for deadlines
+        iterations (int): number of simulations of the last search
+        table (TranspositionTable): transposition table, if params['transposition'] is set
+        stats (SearchStats): counters and timers of the last search, if params['instrument'] is set
+        recording (SearchStats): stats of the running search, if instrumented, None otherwise
+    """
+    def __init__(self, params=None, seed=None, clock=time.time, clock_ns=time.monotonic_ns, **kwargs):
+        self.params = default_params()
+        self.params.update(params or dict())
+        self.params.update(kwargs)
+        self.seed(seed)
+        self.clock = clock
+        self.clock_ns = clock_ns
+        self.deadline_ns = None
+        self.iterations = 0
+        self.table = None
+        self.stats = None
+        self.recording = None
+        self.__ticks = 0
+        self.__expired = False
+
+    def seed(self, seed=None):
+        """
+        Reseed the random generators of the context.
+
+        Args:
+            seed: None, int or np.random.SeedSequence (see mdp.seeding)
+        """
+        self.seeds = seeding.sequence(seed)
+        self.rng = seeding.python_rng(seed)
+
+    @property
+    def root(self):
+        return self.params['root']
+
+    def transpositions(self):
+        """
+        Return:
+            TranspositionTable: the table of the context, None if transpositions are disabled
+        """
+        capacity = self.params['transposition']
+        if not capacity:
+            return None
+        if self.table is None or self.table.capacity != capacity:
+            self.table = TranspositionTable(capacity)
+        return self.table
+
+    def tree_size(self):
+        """
+        Return:
+            int: number of nodes in the tree
+        """
+        return len(self.params['root'].index)
+
+    @contextmanager
+    def activate(self):
+        """
+        Make the context the active one (see active) in the current thread or task, 
+        so that domain code reads its parameters.
+        """
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def timed_out(self):
+        """
+        Test the timeout and the deadline of the search. The clock is only read once 
+        every params['check_every'] calls, or at each call once the time is out.
+
+        Return:
+            bool: True if the time is out
+        """
+        if self.__expired or self.__ticks >= self.params['check_every']:
+            self.__ticks = 0
+            self.__expired = (self.clock() - self.params['start_time']) >= self.params['timeout'] or \
+                (self.deadline_ns is not None and self.clock_ns() >= self.deadline_ns)
+        else:
+            self.__ticks += 1
+        return self.__expired
+
+    def best_action(self):
+        """
+        Return:
+            POMDPAction: current best action from the root of the tree, None if the 
+            root has not been expanded yet. Can be called at any moment of the search.
+        """
+        root = self.params['root']
+        if not root.inTree or not root.children:
+            return None
+        return self.UCB1_action_selection(root, greedy=True)[0]
+
+    def snapshot(self, root, ite):
+        """
+        Return:
+            Snapshot: progress of the search from the given root
+        """
+        visits = {a: child.N for a, child in root.children.items()}
+        a = self.UCB1_action_selection(root, greedy=True)[0] if root.inTree and visits else None
+        return Snapshot(ite, a, visits)
+
+    def UCB1_action_selection(self, node, greedy=False):
+        """
+        Implementation of the UCB1 algorithm for solving a multi-armed bandit problem.
+
+        https://homes.di.unimi.it/~cesabian/Pubblicazioni/ml-02.pdf
+
+        Each action a available from the history h are assigned a value V(ha), 
+        computed from simulations of the POMDP from the history h.
+        In non-greedy mode, this value is augmented by an exploration bonus for rarely-tried actions, 
+        with the strategy of params['selection'] (UCB1 by default, see mcts.selection).
+
+        Args:
+            node (Node): root node of the tree, containing history h
+            greedy (bool): enable/disable greedy mode
+
+        Return:
+            (POMDPAction, float): best action and its value (V in greedy mode)
+        """
+        assert isinstance(node, Node)
+        assert node.inTree, "{} child(ren), {}".format(len(node.children), node.h)
+
+        children = node.children
+        if greedy:
+            i = int(np.argmax(children.V[:len(children)]))
+            a = children.actions[i]
+            f = children[a].V
         else:
-            action_pool = [action for action in h.last_obs().available_actions(h)]
-            if len(action_pool) == 0:
+            i, f = selection(self.params['selection']).select(node, self.params['c'], self.params)
+            a = children.actions[i]
+        if greedy and self.params['log'] >= 2:
+            print("tree history {}".format(node.h))
+            print( [(a, (child.N, child.V)) for a, child in node.children.items() ]  )
+        return (a,f)
+
+    def end_rollout(self, depth, h):
+        """
+        Predicate to test simulations ending criterion 
+        """
+        assert isinstance(h, History)
+        if self.params['gamma']**depth < self.params['epsilon'] or depth >= self.params['max_depth']:
+            #print("max depth")
+            return True
+        elif len(h) > 0 and h.last_obs().is_terminal():
+            #print("terminal obs")
+            return True
+        elif self.timed_out():
+            if self.params['log'] >= 2:
+                print("time out")
+            return True
+        else:
+            return False
+
+    def rollout(self, state, node, depth, policy=None):
+        """
+        This function simulates the process with a defined action policy (random by default), 
+        from the given start state until a depth threshold is met (controlled by the epsilon param)
+        Args:
+            state (POMDPState): the start state
+            node (Node): node with current history h
+            depth (int): current depth in the tree
+            policy (History -> POMDPAction): function that takes a History as argument and return 
+            a POMDPAction
+        Return:
+            float: the final reward of the random playout 
+        """
+        assert isinstance(node, Node)
+        assert isinstance(state, POMDPState)
+
+        s = state.clone()
+        h = node.h.clone()
+        d = depth
+        rewards = []
+        while not self.end_rollout(d, h):
+            # iterative implementation
+            if policy:
+                a = policy(h)
+            else:
+                action_pool = [action for action in h.last_obs().available_actions(h)]
+                if len(action_pool) == 0:
+                    rewards.append(0)
+                    continue
+                a = self.rng.choice(action_pool)
+            o, r = a.do_on(s)
+            rewards.append(float(r))
+            d += 1
+            h.add(a, o)
+        return discount_calc(rewards, self.params['gamma'])[0] if len(rewards) > 0 else 0
+
+    def rollout_batch(self, states, node, depth, proc=None):
+        """
+        Playouts from several start states with the rollout policy of params['rollout'], 
+        batched by the decision process when it supports it.
+
+        Args:
+            states (list): the start states (POMDPState)
+            node (Node): node with current history h
+            depth (int): current depth in the tree
+            proc (DecisionProcess): domain specific knowledge about the pomdp
+
+        Return:
+            list: the final reward of each playout
+        """
+        R = None
+        policy = None
+        if proc is not None:
+            R = proc.rollouts(states, depth, self.params['gamma'], self.params['epsilon'], self.params['max_depth'],
+                policy=self.params['rollout'])
+            policy = proc.rollout_policy(self.params['rollout'])
+        if R is None:
+            R = [self.rollout(s, node, depth, policy) for s in states]
+        return R
+
+    def simulate(self, state, node, proc=None):
+        """
+        Iterative implementation of an MCTS simulation step, adapted to partial observability. This function builds 
+        a whole PO-MCTS starting from the root node, alternating between the following phases.
+
+        Expansion: if the termination criterion is not met, new nodes are created from  currently available actions.
+
+        Selection: select the best node among the children evaluated with their UCB1 value.
+
+        Simulation: simulate a playout starting from the selected node 
+
+        Backpropagation: update statistics about the playouts (in rollout) up to the root.
+
+        Args:
+            state (POMDPState): state sampled either from the initial state distribution or from the belief space
+            node (Node): current root of the tree containing the current history
+            proc (DecisionProcess): domain specific knowledge about the pomdp
+
+        """
+        assert isinstance(node, Node)
+        depth = 0
+        rewards = []
+        root = node
+        # descending down the tree, with the observation obtained when reaching the node
+        fringe = [(node, depth, None)]
+        backprop = [] # climbing up the tree
+        s = state.clone()
+        max_d = 0
+        table = self.transpositions()
+        policy = proc.rollout_policy(self.params['rollout']) if proc is not None else None
+        stats = self.stats
+        while fringe:
+            if stats is not None:
+                t = perf_counter()
+            nod, d, obs = fringe.pop()
+
+            if self.end_rollout(d, nod.h):
                 rewards.append(0)
+                backprop.append((nod, d, s.clone(), obs))
+                if stats is not None:
+                    stats.lap('simulation', t)
                 continue
-            a = random.choice(action_pool)
-        o, r = a.do_on(s)
-        rewards.append(float(r))
-        d += 1
-        h.add(a, o)
-    return discount_calc(rewards, params['gamma'])[0] if len(rewards) > 0 else 0
 
-def simulate(state, node, proc=None):
+            max_d = d if d >= max_d else max_d
+
+            if not root.is_intree(nod.h):
+                # Expansion
+                nod.create_children()
+                nod.inTree = True
+                backprop.append((nod, d, s.clone(), obs))
+                if stats is not None:
+                    t = stats.lap('expansion', t)
+                if self.params['batch'] > 1:
+                    # the current state, completed with particles of the node
+                    particles = self.rng.sample(tuple(nod.B), min(len(nod.B), self.params['batch'] - 1))
+                    particles += [s] * (self.params['batch'] - len(particles))
+                    R = self.rollout_batch(particles, nod, d, proc)
+                    rewards.append(float(sum(R)) / len(R))
+                else:
+                    rewards.append(self.rollout(s, nod, d, policy))
+                if stats is not None:
+                    stats.lap('rollout', t)
+                    stats.rollouts += max(self.params['batch'], 1)
+                continue
+            backprop.append((nod, d, s.clone(), obs))
+            if stats is not None:
+                t = stats.lap('simulation', t)
+
+            # Selection
+            a,u = self.UCB1_action_selection(nod)
+            if stats is not None:
+                t = stats.lap('selection', t)
+
+            # Simulation
+            o, r = a.do_on(s)
+            hao = nod.h.clone()
+            rewards.append(float(r))
+            if nod.children[a].inTree:
+                fringe.append((nod.children[a], d+1, o))
+            else:
+                nod.children[a] = create_node(hao, a, o, nod.index, nod.B.capacity, nod)
+                if table is not None:
+                    table.share(nod, nod.children[a])
+                fringe.append((nod.children[a], d+1, o))
+            if stats is not None:
+                stats.lap('simulation', t)
+
+        # Backpropagation
+        if stats is not None:
+            t = perf_counter()
+            stats.depth += max_d
+            stats.max_depth = max(stats.max_depth, max_d)
+        # discounted return from each depth, accumulated from the leaf up
+        gamma = self.params['gamma']
+        returns = [0.0] * (len(rewards) + 1)
+        for d in range(len(rewards) - 1, -1, -1):
+            returns[d] = rewards[d] + gamma * returns[d+1]
+        for i in range(1, len(backprop)+1):
+            nod, d, s, obs = backprop[-i] # parent
+            nod_a = backprop[-i + 1][0] # simulated child 
+            R = returns[d]
+            # only add s to the belief space if its observation match the one of the node
+            # (the particle of the root was sampled from its belief)
+            if obs is not None and nod.h.last_obs() == obs:
+                nod.B.append(s, rng=self.rng)
+
+            if nod_a.shared is not None:
+                TranspositionTable.update(nod_a, R)
+            else:
+                nod_a.update(R)
+        if stats is not None:
+            stats.lap('backprop', t)
+
+
+    def run(self, root, proc, max_iter, deadline_ns=None, callback=None):
+        """
+        Run simulations from the root until max_iter, the timeout or the deadline is reached, 
+        or until the callback asks to stop.
+
+        Args:
+            root (Node): current root of the tree
+            proc (DecisionProcess): model of domain knowledge of the pomdp
+            max_iter (int): maxium number of iterations
+            deadline_ns (int): deadline in monotonic nanoseconds (see clock_ns)
+            callback (Snapshot -> bool): called every params['snapshot_every'] simulations, 
+            the search stops if it returns True
+
+        Return:
+            int: number of simulations performed
+        """
+        ite = 0
+        every = self.params['snapshot_every']
+        self.deadline_ns = deadline_ns
+        self.__expired = False
+        self.__ticks = self.params['check_every']
+
+        # search
+        with self.activate():
+            while ite < max_iter and not self.timed_out():
+                s = proc.initial_belief()
+                if len(root.h) > 1:
+                    s = root.B.sample(self.rng)
+                self.simulate(s, root , proc)
+                ite+=1   
+                if callback is not None and ite % every == 0 and callback(self.snapshot(root, ite)):
+                    break
+        self.deadline_ns = None
+        return ite
+
+    def parallel_run(self, root, proc, max_iter, workers, deadline_ns=None):
+        """
+        Root-parallel search: each worker builds its own tree from the history and 
+        belief of the root, within the same timeout. The statistics of the children 
+        of the root are then merged, weighting values by visits.
+
+        Args:
+            root (Node): current root of the tree
+            proc (DecisionProcess): model of domain knowledge of the pomdp
+            max_iter (int): maxium number of iterations per worker
+            workers (int): number of worker processes
+            deadline_ns (int): deadline in monotonic nanoseconds (see clock_ns)
+
+        Return:
+            (Node, int): new root holding the merged children and total number of simulations
+        """
+        belief = tuple(root.B)
+        worker_params = {k: v for k, v in self.params.items() if k != 'root'}
+        args = [(root.h, proc, max_iter, worker_params, belief, seed, deadline_ns) 
+            for seed in self.seeds.spawn(workers)]
+        results = _pool(workers).map(_search_worker, args)
+
+        merged = Node(root.a, root.h, root.V, root.N, belief, capacity=root.B.capacity)
+        stats = dict()
+        ite = 0
+        for n, children in results:
+            ite += n
+            for a, (N, V, B) in children.items():
+                sN, sV, sB = stats.get(a, (0, 0.0, []))
+                stats[a] = (sN + N, sV + N*V, sB + B)
+        for a, (N, NV, B) in stats.items():
+            V = NV / N if N > 0 else 0
+            merged.children[a] = Node(a, None, V, N, B, merged.index, root.B.capacity, merged)
+            merged.N += N
+        merged.inTree = True
+        return merged, ite
+
+    def search(self, h, proc, max_iter, clean=True, workers=1, deadline_ns=None, callback=None):
+        """
+        This function implements the UCT algorithm.
+
+        Args:
+            h (History): history in the current root of the tree
+            proc (DecisionProcess): model of domain knowledge of the pomdp
+            max_iter (int): maxium number of iterations
+            clean (bool): toggle to reset the tree
+            workers (int): number of processes searching in parallel from the root
+            deadline_ns (int): deadline in monotonic nanoseconds (see clock_ns), on top of 
+            params['timeout']
+            callback (Snapshot -> bool): called every params['snapshot_every'] simulations 
+            with the progress of the search, which stops if it returns True 
+            (not supported with several workers)
+
+        Return:
+            POMDPAction: the optimal action
+        """
+        assert isinstance(h, History)
+        assert isinstance(proc, DecisionProcess)
+        with self.activate():
+            return self.__search(h, proc, max_iter, clean, workers, deadline_ns, callback)
+
+    def __search(self, h, proc, max_iter, clean, workers, deadline_ns, callback):
+        # init search vars
+        self.params['start_time'] = self.clock()
+        stats = self.stats = SearchStats() if self.params['instrument'] else None
+        if stats is not None:
+            methods = proc.instrumented_methods()
+            install(methods, _recording)
+            start = perf_counter()
+            self.recording = stats
+            try:
+                a = self.__search_tree(h, proc, max_iter, clean, workers, deadline_ns, callback)
+            finally:
+                self.recording = None
+                uninstall(methods)
+            stats.elapsed = perf_counter() - start
+            return a
+        return self.__search_tree(h, proc, max_iter, clean, workers, deadline_ns, callback)
+
+    def __search_tree(self, h, proc, max_iter, clean, workers, deadline_ns, callback):
+        if clean:
+            # new tree rooted at h, without the statistics shared by the previous one
+            root = self.params['root'] = Node(h.last_action(), h, 0, 0, list(), capacity=self.params['K'])
+            if self.table is not None:
+                self.table.clear()
+        elif h.last_action() != POMDPAction():
+            root = self.params['root'].children[h.last_action()]
+        else:
+            root = self.params['root']
+        if root is not self.params['root']:
+            # release the previous root and the siblings of the new one
+            root.reindex()
+            self.params['root'] = root
+
+        if self.params['reuse'] and root.inTree and root.h == h:
+            # the subtree was built from the real action-observation: 
+            # keep it along with its statistics
+            if self.params['log'] >= 1:
+                print("reused subtree: {} node(s)".format(len(root.index)))
+        else:
+            # root should have history given as args but B from previous root
+            root.h = h.clone()
+            # children of the current root must be regenerated, to 
+            # consider the last real action-observation obtained
+            root.inTree = False
+
+        if len(root.B) == 0 and len(h) > 1:
+            proc.empty_belief(root.B, h)
+
+        if self.params['log'] >= 1:
+            print("current root: {}, len(h): {}".format(h.actions[0], len(h)))    
+        stats = self.stats
+        if stats is not None:
+            stats.root_belief = len(root.B)
+        if workers > 1:
+            root, ite = self.parallel_run(root, proc, max_iter, workers, deadline_ns)
+        else:
+            ite = self.run(root, proc, max_iter, deadline_ns, callback)
+
+        # greedy action selection
+        a = self.UCB1_action_selection(root, greedy=True)[0]
+        self.params['root'] = root
+        child = root.children[a]
+
+        self.iterations = ite
+
+        # particle reinvigoration
+        if stats is not None:
+            t = perf_counter()
+        proc.invigoration(child.B, ite)
+        if stats is not None:
+            stats.lap('invigoration', t)
+            stats.iterations = ite
+            stats.tree_size = self.tree_size()
+            stats.next_belief = len(child.B)
+        if self.params['log'] >= 1:
+            print("next belief size: {}".format(len(child.B)))
+        return a
+
+
+# default context, used by the module-level functions outside of a search
+_default = POMCP()
+params = _default.params
+_active = ContextVar('pomcp', default=_default)
+
+def active():
+    """
+    Return:
+        POMCP: the context of the search running in the current thread or task, 
+        the default context otherwise
     """
-    Iterative implementation of an MCTS simulation step, adapted to partial observability. This function builds 
-    a whole PO-MCTS starting from the root node, alternating between the following phases.
+    return _active.get()
 
-    Expansion: if the termination criterion is not met, new nodes are created from  currently available actions.
+def _recording():
+    """
+    Return:
+        SearchStats: stats of the instrumented search running in the current thread 
+        or task, None otherwise
+    """
+    return _active.get().recording
 
-    Selection: select the best node among the children evaluated with their UCB1 value.
+def UCB1_action_selection(node, greedy=False):
+    """
+    see POMCP.UCB1_action_selection, in the active context
+    """
+    return active().UCB1_action_selection(node, greedy)
 
-    Simulation: simulate a playout starting from the selected node 
+def end_rollout(depth, h):
+    """
+    see POMCP.end_rollout, in the active context
+    """
+    return active().end_rollout(depth, h)
 
-    Backpropagation: update statistics about the playouts (in rollout) up to the root.
+def rollout(state, node, depth, policy=None):
+    """
+    see POMCP.rollout, in the active context
+    """
+    return active().rollout(state, node, depth, policy)
 
-    Args:
-        state (POMDPState): state sampled either from the initial state distribution or from the belief space
-        node (Node): current root of the tree containing the current history
-        proc (DecisionProcess): domain specific knowledge about the pomdp
-    
+def rollout_batch(states, node, depth, proc=None):
     """
-    assert isinstance(node, Node)
-    depth = 0
-    rewards = []
-    root = node
-    fringe = [(node, depth)] # descending down the tree
-    backprop = [] # climbing up the tree
-    s = state.clone()
-    max_d = 0
-    while fringe:
-        nod, d = fringe.pop()
-        
-
-        if end_rollout(d, nod.h):
-            rewards.append(0)
-            backprop.append((nod, d, s.clone()))
-            continue
-
-        max_d = d if d >= max_d else max_d
-
-        if not root.is_intree(nod.h):
-            # Expansion
-            nod.create_children()
-            nod.inTree = True
-            backprop.append((nod, d, s.clone()))
-            rewards.append(rollout(s, nod, d))
-            continue
-        backprop.append((nod, d, s.clone()))
-
-        # Selection
-        a,u = UCB1_action_selection(nod)
-
-        # Simulation
-        o, r = a.do_on(s)
-        hao = nod.h.clone()
-        rewards.append(float(r))
-        if nod.children[a].inTree:
-            fringe.append((nod.children[a], d+1))
-        else:
-            nod.children[a] = create_node(hao, a, o)
-            fringe.append((nod.children[a], d+1))
-    
-    # Backpropagation
-    for i in range(1, len(backprop)+1):
-        nod, d, s = backprop[-i] # parent
-        nod_a = backprop[-i + 1][0] # simulated child 
-        R = discount_calc(rewards[d::], params['gamma'])[0]
-        # only add s to the belief space if its observation match the real observation
-        sc = state.clone()
-        o = nod.h.last_obs()
-        for i in range(1, d):
-            act = nod.h.actions[i]
-            o, tmp = act.do_on(sc)
-        if nod.h.last_obs() == o:
-            nod.B.append(s)
-            
-        nod_a.N += 1
-        nod_a.V += (R - nod_a.V) / nod_a.N 
-    
-
-def search(h, proc, max_iter, clean=True):
+    see POMCP.rollout_batch, in the active context
     """
-    This function implements the UCT algorithm.
+    return active().rollout_batch(states, node, depth, proc)
 
-    Args:
-        h (History): history in the current root of the tree
-        proc (DecisionProcess): model of domain knowledge of the pomdp
-        max_iter (int): maxium number of iterations
-        clean (bool): toggle to reset the tree
+def simulate(state, node, proc=None):
+    """
+    see POMCP.simulate, in the active context
+    """
+    return active().simulate(state, node, proc)
 
-    Return:
-        POMDPAction: the optimal action
+def run(root, proc, max_iter, deadline_ns=None, callback=None):
     """
-    assert isinstance(h, History)
-    assert isinstance(proc, DecisionProcess)
-    # init global vars
-    params['start_time'] = time.time()
-    if clean:
-        params['root'] = Node(h.last_action(), h, 0, 0, list())
-    
-    root = params['root'].children[h.last_action()] if h.last_action() != POMDPAction() else params['root']
-
-    # root should have history given as args but B from previous root
-    root.h = h.clone()
-    # at each call to search, children of the current root must be regenerated, to 
-    # consider the last real action-observation obtained
-    root.inTree = False
-
-    if params['log'] >= 1:
-        print("current root: {}, len(h): {}".format(h.actions[0], len(h)))    
-    ite = 0
-    # time out
-    def time_remaining():
-        return ite < max_iter and (time.time() - params['start_time']) < params['timeout']
-    
-    # search
-    while time_remaining():
-        s = proc.initial_belief()
-        if len(root.h) > 1:
-            s = random.choice(tuple(root.B))
-        simulate(s, root , proc)
-        ite+=1   
-
-    # greedy action selection
-    a = UCB1_action_selection(root, greedy=True)[0]
-    params['root'] = root
-    child = root.children[a]
-
-    # particle reinvigoration
-    proc.invigoration(child.B, ite)
-    if params['log'] >= 1:
-        print("next belief size: {}".format(len(child.B)))
-    return a
+    see POMCP.run, in the active context
+    """
+    return active().run(root, proc, max_iter, deadline_ns, callback)
 
+def search(h, proc, max_iter, clean=True, workers=1, deadline_ns=None, callback=None):
+    """
+    see POMCP.search, in the active context
+    """
+    return active().search(h, proc, max_iter, clean, workers, deadline_ns, callback)
@@ -0,0 +1,172 @@
+"""
+Strategies selecting the child to descend to during the simulations of POMCP, 
+scored at once over the statistics arrays of the children (see tree.Children).
+The strategy of a search is set by params['selection'].
+"""
+from abc import ABCMeta, abstractmethod
+import math
+import numpy as np
+
+# natural logarithm of the numbers of visits met so far, by number of visits, 
+# up to LOG_TABLE entries
+LOG_TABLE = 1 << 16
+_log = [-math.inf]
+
+def log(n):
+    """
+    Return:
+        float: math.log(n) for n > 0, from a table grown on demand for the first 
+        LOG_TABLE numbers
+    """
+    try:
+        return _log[n]
+    except IndexError:
+        if n >= LOG_TABLE:
+            return math.log(n)
+        _log.extend(math.log(i) for i in range(len(_log), min(2 * n + 1, LOG_TABLE)))
+        return _log[n]
+
+def value_range(params):
+    """
+    Return:
+        float: width of the range of returns, R_hi - R_lo (1 if empty)
+    """
+    return (params['R_hi'] - params['R_lo']) or 1.0
+
+class Selection(metaclass=ABCMeta):
+    """
+    Selection strategy, scoring the children of a node from their statistics. 
+
+    Attributes:
+        unvisited (bool): children never visited are selected first, in order, without 
+        scoring, and so are all the children of a node never visited
+    """
+    unvisited = True
+
+    @abstractmethod
+    def scores(self, children, N, c, params):
+        """
+        Args:
+            children (Children): children of the node
+            N (int): number of visits of the node
+            c (float): exploration constant
+            params (dict): parameters of the search
+
+        Return:
+            np.ndarray: score of each child, by action id
+        """
+        pass
+
+    @abstractmethod
+    def score(self, children, i, N, c, params):
+        """
+        Return:
+            float: score of the child i, computed with math (see scores)
+        """
+        pass
+
+    def select(self, node, c, params):
+        """
+        Return:
+            (int, float): action id of the best child of the node and its score
+        """
+        children = node.children
+        N = node.N
+        if self.unvisited:
+            if N <= 0:
+                return 0, math.inf
+            i = children.first_unvisited()
+            if i is not None:
+                return i, math.inf
+        i = int(np.argmax(self.scores(children, N, c, params)))
+        return i, self.score(children, i, N, c, params)
+
+class UCB1(Selection):
+    """
+    UCB1, V + c sqrt(log N / n)
+
+    https://homes.di.unimi.it/~cesabian/Pubblicazioni/ml-02.pdf
+    """
+    def scores(self, children, N, c, params):
+        k = len(children)
+        return children.V[:k] + c * np.sqrt(log(N) / children.N[:k])
+
+    def score(self, children, i, N, c, params):
+        return float(children.V[i]) + c * math.sqrt(log(N) / int(children.N[i]))
+
+class UCB1Tuned(Selection):
+    """
+    UCB1-tuned, V + c sqrt(log N / n min(1/4, var + sqrt(2 log N / n))), where var is the 
+    variance of the returns of the child scaled to [0, 1] by R_lo and R_hi. 
+
+    https://homes.di.unimi.it/~cesabian/Pubblicazioni/ml-02.pdf
+    """
+    def scores(self, children, N, c, params):
+        k = len(children)
+        n = children.N[:k]
+        l = log(N) / n
+        var = children.M2[:k] / n / value_range(params) ** 2
+        return children.V[:k] + c * np.sqrt(l * np.minimum(0.25, var + np.sqrt(2 * l)))
+
+    def score(self, children, i, N, c, params):
+        n = int(children.N[i])
+        l = log(N) / n
+        var = float(children.M2[i]) / n / value_range(params) ** 2
+        return float(children.V[i]) + c * math.sqrt(l * min(0.25, var + math.sqrt(2 * l)))
+
+class PUCT(Selection):
+    """
+    PUCT, V + c P sqrt(N) / (1 + n), where the prior P of a child is its initial value 
+    V_init scaled to [0, 1] by R_lo and R_hi, plus one, normalized over the children:
+    uniform without domain knowledge. Children never visited are scored as the others.
+
+    http://mlanctot.info/files/papers/ISAIM2010-Rosin.pdf
+    """
+    unvisited = False
+
+    def priors(self, children, params):
+        """
+        Return:
+            np.ndarray: prior of each child, by action id
+        """
+        k = len(children)
+        x = 1 + np.minimum(np.maximum((children.P[:k] - params['R_lo']) / value_range(params), 0), 1)
+        return x / x.sum()
+
+    def select(self, node, c, params):
+        children = node.children
+        k = len(children)
+        P = self.priors(children, params)
+        u = c * math.sqrt(node.N)
+        i = int(np.argmax(children.V[:k] + u * P / (1 + children.N[:k])))
+        return i, float(children.V[i]) + u * float(P[i]) / (1 + int(children.N[i]))
+
+    def scores(self, children, N, c, params):
+        k = len(children)
+        return children.V[:k] + c * math.sqrt(N) * self.priors(children, params) / (1 + children.N[:k])
+
+    def score(self, children, i, N, c, params):
+        p = float(self.priors(children, params)[i])
+        return float(children.V[i]) + c * math.sqrt(N) * p / (1 + int(children.N[i]))
+
+# strategies by name, for params['selection']
+SELECTIONS = {
+    'ucb1': UCB1(),
+    'ucb1-tuned': UCB1Tuned(),
+    'puct': PUCT()
+}
+
+def selection(strategy):
+    """
+    Args:
+        strategy (str or Selection): name of a strategy in SELECTIONS, or a strategy
+
+    Return:
+        Selection: the strategy
+    """
+    if isinstance(strategy, Selection):
+        return strategy
+    try:
+        return SELECTIONS[strategy]
+    except KeyError:
+        raise ValueError("unknown selection strategy {}, expected one of {}".format(strategy, sorted(SELECTIONS)))
@@ -0,0 +1,164 @@
+"""
+Opt-in instrumentation of a search (see params['instrument']): counters and 
+monotonic timers of the phases of POMCP and of the hot methods of the domain. 
+When instrumentation is off, searches only test that their stats are None; the domain
+methods are hooked for the duration of the instrumented searches only.
+"""
+from functools import wraps
+from time import perf_counter
+import threading
+import json
+
+class SearchStats(object):
+    """
+    Counters and timers of one search.
+
+    Attributes:
+        iterations (int): number of simulations
+        rollouts (int): number of playouts
+        depth (int): sum of the depths reached in the tree by each simulation
+        max_depth (int): deepest depth reached in the tree
+        tree_size (int): number of nodes in the tree at the end of the search
+        root_belief (int): number of particles of the root at the start of the search
+        next_belief (int): number of particles of the chosen child after invigoration
+        elapsed (float): duration of the search in seconds
+        phases (dict): seconds spent in each phase of the search, by name (see PHASES)
+        calls (dict): number of calls and seconds spent in each instrumented domain method, by label
+    """
+    PHASES = ('selection', 'simulation', 'expansion', 'rollout', 'backprop', 'invigoration')
+
+    def __init__(self):
+        self.iterations = 0
+        self.rollouts = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.tree_size = 0
+        self.root_belief = 0
+        self.next_belief = 0
+        self.elapsed = 0.0
+        self.phases = dict.fromkeys(self.PHASES, 0.0)
+        self.calls = dict()
+
+    def lap(self, phase, start):
+        """
+        Add the time since start to the phase.
+
+        Return:
+            float: the current time, start of the next lap
+        """
+        now = perf_counter()
+        self.phases[phase] += now - start
+        return now
+
+    def call(self, label, seconds):
+        """
+        Count a call of an instrumented domain method.
+        """
+        c = self.calls.get(label)
+        if c is None:
+            c = self.calls[label] = [0, 0.0]
+        c[0] += 1
+        c[1] += seconds
+
+    @property
+    def rollouts_per_sec(self):
+        return self.rollouts / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def average_depth(self):
+        return self.depth / self.iterations if self.iterations else 0.0
+
+    def to_dict(self):
+        """
+        Return:
+            dict: the stats, with derived rates and the time out of any phase under 'other'
+        """
+        phases = dict(self.phases)
+        phases['other'] = max(0.0, self.elapsed - sum(self.phases.values()))
+        return {
+            'iterations': self.iterations,
+            'rollouts': self.rollouts,
+            'rollouts_per_sec': self.rollouts_per_sec,
+            'average_depth': self.average_depth,
+            'max_depth': self.max_depth,
+            'tree_size': self.tree_size,
+            'root_belief': self.root_belief,
+            'next_belief': self.next_belief,
+            'elapsed': self.elapsed,
+            'phases': phases,
+            'calls': {label: {'count': n, 'time': t} for label, (n, t) in self.calls.items()}
+        }
+
+    def to_json(self, **kwargs):
+        """
+        Return:
+            str: the stats as JSON (see to_dict), kwargs go to json.dumps
+        """
+        return json.dumps(self.to_dict(), **kwargs)
+
+# methods already hooked, by (class, method name)
+# (class, method name) -> [number of searches using the hook, attribute it replaced]
+_hooked = dict()
+_lock = threading.Lock()
+# the method was inherited, not defined by the class
+_INHERITED = object()
+
+def _timed(method, label, current):
+    @wraps(method)
+    def timed(*args, **kwargs):
+        stats = current()
+        if stats is None:
+            return method(*args, **kwargs)
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            stats.call(label, perf_counter() - start)
+    return timed
+
+def install(methods, current):
+    """
+    Hook the given methods to time their calls, until uninstall is called with the same 
+    methods. Each call is timed into the stats returned by current, if any, so 
+    that searches running at the same time only count their own calls. Hooks are 
+    installed once per method and counted: they are removed when the last search 
+    using them uninstalls them.
+
+    Args:
+        methods (list): (class, method name, label) of the methods to time 
+        (see DecisionProcess.instrumented_methods)
+        current (callable): returns the SearchStats of the caller, None if it is not instrumented
+    """
+    with _lock:
+        for cls, name, label in methods:
+            hook = _hooked.get((cls, name))
+            if hook is not None:
+                hook[0] += 1
+                continue
+            # an inherited method may already be hooked in a base class
+            method = getattr(cls, name)
+            method = getattr(method, '__wrapped__', method)
+            _hooked[(cls, name)] = [1, cls.__dict__.get(name, _INHERITED)]
+            setattr(cls, name, _timed(method, label, current))
+
+def uninstall(methods):
+    """
+    Release the hooks of the given methods (see install), and restore the methods that 
+    no search times anymore.
+
+    Args:
+        methods (list): (class, method name, label) of the methods given to install
+    """
+    with _lock:
+        for cls, name, label in methods:
+            hook = _hooked.get((cls, name))
+            if hook is None:
+                continue
+            hook[0] -= 1
+            if hook[0] > 0:
+                continue
+            del _hooked[(cls, name)]
+            if hook[1] is _INHERITED:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, hook[1])
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+
+class Entry(object):
+    """
+    Statistics shared by the nodes of a same transposition.
+
+    Attributes:
+        N (int): number of visits
+        V (float): estimation of the Q(h,a) value
+        M2 (float): sum of the squared deviations of the returns from V
+    """
+    __slots__ = ('N', 'V', 'M2')
+
+    def __init__(self, N, V, M2=0.0):
+        self.N = N
+        self.V = V
+        self.M2 = M2
+
+    def variance(self):
+        """
+        Return:
+            float: variance of the returns of the entry, 0 before its first visit
+        """
+        return self.M2 / self.N if self.N else 0.0
+
+class TranspositionTable(object):
+    """
+    Statistics and beliefs shared by nodes whose histories are equivalent, according
+    to POMDPObservation.transposition_key.
+
+    - key of the action after the parent -> Entry: N and V of the nodes reached by 
+      equivalent actions from equivalent histories. Returns of all these nodes are averaged in the
+      entry, and its value and variance are written through to the nodes on creation and 
+      after each backpropagation.
+    - key of the node -> Belief: particles of the nodes with equivalent histories.
+
+    The table holds at most capacity items and evicts the least recently used ones.
+    Nodes keep what they hold, eviction only stops the sharing.
+
+    Attributes:
+        capacity (int): maximum number of items
+        hits (int): number of nodes that found an item to share
+        misses (int): number of nodes that did not
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self):
+        self.items.clear()
+
+    def __get(self, key, default):
+        """
+        Return:
+            the item of key, set to default if there is none
+        """
+        item = self.items.get(key)
+        if item is not None:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item
+        self.misses += 1
+        self.items[key] = default
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+        return default
+
+    def share(self, parent, node):
+        """
+        Share the statistics and the belief of a new node with those of its
+        transpositions.
+
+        Args:
+            parent (Node): parent of the node
+            node (Node): node just created, whose history ends with its action and observation
+        """
+        key = parent.h.last_obs().transposition_key(parent.h, node.a)
+        if key is not None:
+            entry = self.__get(key, Entry(node.N, node.V))
+            node.V = entry.V
+            node.M2 = entry.variance() * node.N
+            node.shared = entry
+        key = node.h.last_obs().transposition_key(node.h)
+        if key is not None:
+            node.B = self.__get(key, node.B)
+
+    @staticmethod
+    def update(node, R):
+        """
+        Backpropagate the return R in the entry of the node and copy its value to the node.
+        The node keeps its own number of visits, so that exploration in UCB1 stays relative
+        to the visits of its parent. Its M2 is scaled to these visits, so that the variance
+        seen by UCB1-tuned (M2 / N) is the one of the entry.
+        """
+        entry = node.shared
+        entry.N += 1
+        delta = R - entry.V
+        entry.V += delta / entry.N
+        entry.M2 += delta * (R - entry.V)
+        node.N += 1
+        node.V = entry.V
+        node.M2 = entry.variance() * node.N
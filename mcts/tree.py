@@ -1,6 +1,9 @@
 from mdp.pomdp import POMDPAction, POMDPObservation
 from mdp.history import History
+from bisect import bisect
+from itertools import accumulate
 import numpy as np
+import random
 
 def n_init(h, a):
     """
@@ -26,85 +29,355 @@ def v_init(h,a):
     o = h.last_obs()
     return o.V_init(h,a)
 
-def create_node(h, a, o):
+def create_node(h, a, o, index=None, capacity=None, parent=None):
     """
     Args: 
         h (History): history prior to the node
         a (POMDPAction): next action (not in history)
         o (POMDPObservation): next observation (not in history)
+        index (dict): history-to-node index of the tree the node belongs to (optional)
+        capacity (int): maximum number of particles of the node (optional)
+        parent (Node): parent of the node (optional)
 
     Return:
         Node: a new tree node whose attributes value comes from domain knowledge
     """
     assert isinstance(h, History)
     h.add(a, o)
-    n = Node(a, h, v_init(h,a), n_init(h,a), list())
+    n = Node(a, h, v_init(h,a), n_init(h,a), list(), index, capacity, parent)
     #n.inTree = True
     return n
 
-class Belief(set):
-    def append(self, a):
-        # for retrocompatibility
-        self.add(a)
+class Belief(object):
+    """
+    Collection of particles (states) with a fixed capacity. Once full, particles are 
+    inserted by reservoir sampling, so that the belief remains a uniform sample of 
+    all the particles appended so far.
+
+    Particles can be given a weight, in which case sampling is proportional to weights.
+
+    Attributes:
+        capacity (int): maximum number of particles, None if unbounded
+        seen (int): number of particles appended so far
+    """
+    __slots__ = ('capacity', 'seen', 'particles', 'weights', '__weighted', '__cumulated')
+
+    def __init__(self, particles=(), capacity=None):
+        self.capacity = capacity
+        self.seen = 0
+        self.particles = []
+        self.weights = []
+        self.__weighted = False
+        self.__cumulated = None
+        for p in particles:
+            self.append(p)
+
+    def __len__(self):
+        return len(self.particles)
+
+    def __iter__(self):
+        return iter(self.particles)
+
+    def __contains__(self, particle):
+        return particle in self.particles
+
+    def append(self, particle, weight=1.0, rng=random):
+        """
+        Insert a particle. When the belief is full, it replaces a particle chosen 
+        uniformly at random with probability capacity / seen.
+        """
+        self.seen += 1
+        if self.capacity is None or len(self.particles) < self.capacity:
+            self.particles.append(particle)
+            self.weights.append(weight)
+        else:
+            j = rng.randrange(self.seen)
+            if j >= self.capacity:
+                return
+            self.particles[j] = particle
+            self.weights[j] = weight
+        self.__weighted = self.__weighted or weight != 1.0
+        self.__cumulated = None
+
+    # for retrocompatibility
+    add = append
+
+    def sample(self, rng=random):
+        """
+        Return:
+            POMDPState: a particle, drawn uniformly (in O(1)) or proportionally to weights
+        """
+        if not self.__weighted:
+            return self.particles[rng.randrange(len(self.particles))]
+        if self.__cumulated is None:
+            self.__cumulated = list(accumulate(self.weights))
+        x = rng.random() * self.__cumulated[-1]
+        return self.particles[min(bisect(self.__cumulated, x), len(self.particles) - 1)]
+
+# statistics of nodes without children, shared
+_NO_VISITS = np.zeros(0, dtype=np.int64)
+_NO_VALUES = np.zeros(0, dtype=np.float64)
+
+class Children(dict):
+    """
+    Children of a node, by action. The statistics N and V of the children are stored
+    in arrays indexed by the id of their action, which is its rank in the dict, so 
+    that the selection among children is vectorized (see mcts.selection).
+
+    Attributes:
+        N (np.ndarray): number of visits of each child, by action id
+        V (np.ndarray): value of each child, by action id
+        P (np.ndarray): initial value of each child (V_init), by action id
+        M2 (np.ndarray): sum of the squared deviations of the returns from V, by action id
+        actions (list): actions, by id
+        unvisited (int): no child before this id has N == 0
+    """
+    __slots__ = ('N', 'V', 'P', 'M2', 'actions', 'unvisited')
+
+    def __init__(self, size=0):
+        dict.__init__(self)
+        self.N = np.zeros(size, dtype=np.int64) if size else _NO_VISITS
+        self.V = np.zeros(size, dtype=np.float64) if size else _NO_VALUES
+        self.P = np.zeros(size, dtype=np.float64) if size else _NO_VALUES
+        self.M2 = np.zeros(size, dtype=np.float64) if size else _NO_VALUES
+        self.actions = []
+        self.unvisited = 0
+
+    def __setitem__(self, a, node):
+        old = self.get(a)
+        if old is not None:
+            i = old._slot
+            old._detach()
+        else:
+            i = len(self)
+            if i == len(self.N):
+                grow = max(i, 4)
+                self.N = np.concatenate((self.N, np.zeros(grow, dtype=np.int64)))
+                self.V = np.concatenate((self.V, np.zeros(grow, dtype=np.float64)))
+                self.P = np.concatenate((self.P, np.zeros(grow, dtype=np.float64)))
+                self.M2 = np.concatenate((self.M2, np.zeros(grow, dtype=np.float64)))
+            self.actions.append(a)
+            self.P[i] = node.V
+        # the statistics of the node move to the arrays
+        self.N[i] = node.N
+        self.V[i] = node.V
+        self.M2[i] = 0.0
+        if self.N[i] == 0 and i < self.unvisited:
+            self.unvisited = i
+        node._stats = self
+        node._slot = i
+        dict.__setitem__(self, a, node)
+
+    def first_unvisited(self):
+        """
+        Return:
+            int: id of the first child never visited, None if all of them were
+        """
+        i = self.unvisited
+        N = self.N
+        k = len(self)
+        while i < k and N[i] != 0:
+            i += 1
+        self.unvisited = i
+        return i if i < k else None
 
 class Node(object):
     """
     Each node T(h) is defined by the tuple <N(h), V(h), B(h)>
     inTree attribute is set to False when the node is initially constructed, 
     as its history does not contain its last action-observation yet. 
+
+    The N and V of a child are stored by its parent (see Children). The history of a child 
+    created by create_children is the one of its parent, it is only copied when accessed.
     
     Attributes: 
         a (POMDPAction): action performed to reach the node
         h (History): history to reach the node
+        parent (Node): parent of the node, None for a root
         N (int): number of visits 
         V (float): estimation of the Q(h,a) value of the node
-        B (list): collection of K particles (states), representing the current belief of the system
-        children (dict): collection of child-node, sorted by actions
+        M2 (float): sum of the squared deviations of the returns from V, 0 for a root
+        B (Belief): collection of K particles (states), representing the current belief of the system
+        children (Children): collection of child-node, sorted by actions
         inTree (bool): set to True if the history of the node is up to date 
+        index (dict): history -> node map of the nodes in the tree, shared by all 
+        the nodes of a same tree. Nodes are registered when inTree is set.
+        shared (Entry): value shared with transpositions of the node, if any
     """
-    def __init__(self, a, h, V, N, B):
-        assert isinstance(h, History)
+    __slots__ = ('a', 'parent', '_h', '_N', '_V', '_stats', '_slot', 'B', 'children', 
+        'index', 'shared', '_key', '_inTree')
+
+    def __init__(self, a, h, V, N, B, index=None, capacity=None, parent=None):
+        assert h is None or isinstance(h, History)
+        assert h is not None or parent is not None
         assert isinstance(a, POMDPAction)
-        self.h = h 
+        self._h = h 
+        self.parent = parent
         self.a = a
-        self.V = V 
-        self.N = N 
-        self.B = Belief()
-        for e in B:
-            self.B.add(e)
-        self.children = dict()
+        self._V = V 
+        self._N = N 
+        self._stats = None
+        self._slot = 0
+        self.B = Belief(B, capacity)
+        self.children = Children()
+        self.index = index if index is not None else dict()
+        # statistics shared with transpositions (see mcts.transposition)
+        self.shared = None
+        self._key = None
         self.inTree = False
 
+    @property
+    def h(self):
+        if self._h is None:
+            self._h = self.parent.h.clone()
+        return self._h
+
+    @h.setter
+    def h(self, value):
+        self._h = value
+
+    @property
+    def N(self):
+        if self._stats is None:
+            return self._N
+        return int(self._stats.N[self._slot])
+
+    @N.setter
+    def N(self, value):
+        stats = self._stats
+        if stats is None:
+            self._N = value
+        else:
+            stats.N[self._slot] = value
+            if value == 0 and self._slot < stats.unvisited:
+                stats.unvisited = self._slot
+
+    @property
+    def V(self):
+        if self._stats is None:
+            return self._V
+        return float(self._stats.V[self._slot])
+
+    @V.setter
+    def V(self, value):
+        if self._stats is None:
+            self._V = value
+        else:
+            self._stats.V[self._slot] = value
+
+    @property
+    def M2(self):
+        if self._stats is None:
+            return 0.0
+        return float(self._stats.M2[self._slot])
+
+    @M2.setter
+    def M2(self, value):
+        if self._stats is not None:
+            self._stats.M2[self._slot] = value
+
+    def update(self, R):
+        """
+        Backpropagate the return R: one more visit, and the running mean and 
+        variance (for the children of a node) of the returns.
+        """
+        stats = self._stats
+        if stats is None:
+            self._N += 1
+            self._V += (R - self._V) / self._N
+            return
+        i = self._slot
+        n = int(stats.N[i]) + 1
+        v = float(stats.V[i])
+        delta = R - v
+        v += delta / n
+        stats.N[i] = n
+        stats.V[i] = v
+        stats.M2[i] += delta * (R - v)
+
+    def _detach(self):
+        """
+        Take back the statistics and the history of the node from its parent, 
+        which releases it.
+        """
+        if self._h is None:
+            self._h = self.parent.h.clone()
+        if self._stats is not None:
+            self._N, self._V = self.N, self.V
+            self._stats = None
+        self.parent = None
+
+    @property
+    def inTree(self):
+        return self._inTree
+
+    @inTree.setter
+    def inTree(self, value):
+        self._inTree = value
+        self._unregister()
+        if value:
+            # snapshot of the history, as self.h can still be updated afterwards
+            self._key = self.h.clone()
+            self.index[self._key] = self
+
+    def _unregister(self):
+        if self._key is not None and self.index.get(self._key) is self:
+            del self.index[self._key]
+        self._key = None
+
+    def _discard_subtree(self):
+        """
+        Remove all the descendants of the node from the index
+        """
+        fringe = list(self.children.values())
+        while fringe:
+            node = fringe.pop()
+            node._unregister()
+            fringe.extend(node.children.values())
+
+    def reindex(self):
+        """
+        Make the node the root of a new index, containing only the nodes 
+        of its subtree. Nodes outside the subtree are released.
+        """
+        self._detach()
+        index = dict()
+        fringe = [self]
+        while fringe:
+            node = fringe.pop()
+            node.index = index
+            if node._inTree:
+                node._key = node.h.clone()
+                index[node._key] = node
+            fringe.extend(node.children.values())
+
     def create_children(self):
         """
         Initialize children nodes with respect to available actions
         for the current history. 
         """
-        o = self.h.observs[0]
-        assert(str(self.h.actions[-1]) == '(empty)')
-        self.children = dict() # empty (otherwise, could explore actions already done)
-        for a in o.available_actions():
-            # updated history 
-            ha = self.h.clone()
-            self.children.update(  {a: Node(a, ha, v_init(ha, a), n_init(ha, a), list() )} )
+        h = self.h
+        o = h.last_obs()
+        assert(str(h.actions[-1]) == '(empty)')
+        self._discard_subtree()
+        actions = list(o.available_actions())
+        # empty (otherwise, could explore actions already done)
+        children = self.children = Children(len(actions))
+        for a in actions:
+            children[a] = Node(a, None, v_init(h, a), n_init(h, a), list(), self.index, self.B.capacity, self)
         
     def find(self, h):
         """
-        Explore the tree in BFS and stop the search as soon as the size of histories 
-        in the tree become larger than len(h)
+        Look up the history h in the index of the tree. 
+
+        Return:
+            Node: the node of the tree whose history is h, None if there is none
         """     
         assert isinstance(h, History)
-        fringe = [self]
-        while fringe:
-            node = fringe.pop()
-            if len(node.h) < len(h):
-                for a in node.children:
-                    fringe.insert(0, node.children[a])
-            elif len(node.h) > len(h):
-                return None
-            else:
-                if node.h == h and node.inTree:
-                    return node
+        node = self.index.get(h)
+        if node is not None and node.inTree:
+            return node
+        return None
 
     def is_intree(self, h):
         """
@@ -1,41 +1,110 @@
 from mdp.pomdp import POMDPAction, POMDPObservation
 
+class _Link(object):
+    """
+    Immutable action-observation pair of a history, chained to the prefix it extends.
+    Histories sharing a prefix share its links, and each link caches the hash of
+    the history it ends.
+    """
+    __slots__ = ('parent', 'action', 'observ', 'length', 'hash', 'actions', 'observs')
+
+    def __init__(self, parent, action, observation):
+        self.parent = parent
+        self.action = action
+        self.observ = observation
+        self.length = parent.length + 1 if parent is not None else 1
+        self.hash = None
+        # newest-first tuples, built on demand
+        self.actions = None
+        self.observs = None
+
+
 class History(object):
     """
+    Sequence of action-observation pairs, stored as a persistent linked list so that
+    add and clone are O(1).
 
+    Attributes:
+        actions (tuple): actions of the history, the last one first
+        observs (tuple): observations of the history, the last one first
     """
     def __init__(self):
-        self.actions = list()
-        self.observs = list()
-    
+        self._tip = None
+
     def __hash__(self):
-        t = tuple([(a,o) for a,o in zip(self.actions, self.observs)])
-        return hash(t)
+        tip = self._tip
+        if tip is None:
+            return hash(())
+        if tip.hash is None:
+            # compute the missing prefix hashes, oldest first
+            pending = []
+            link = tip
+            while link is not None and link.hash is None:
+                pending.append(link)
+                link = link.parent
+            h = link.hash if link is not None else hash(())
+            for link in reversed(pending):
+                h = hash((h, link.action, link.observ))
+                link.hash = h
+        return tip.hash
 
     def __eq__(self, other):
-        return self.actions == other.actions and self.observs == other.observs
-        
+        if not isinstance(other, History):
+            return False
+        a, b = self._tip, other._tip
+        # walk back until both histories share the same prefix
+        while a is not b:
+            if a is None or b is None or a.length != b.length:
+                return False
+            if a.hash is not None and b.hash is not None and a.hash != b.hash:
+                return False
+            if a.action != b.action or a.observ != b.observ:
+                return False
+            a, b = a.parent, b.parent
+        return True
+
     def __str__(self):
         s = ''
+        actions, observs = self.actions, self.observs
         for i in range(len(self)):
-            s += '\n[{}] a: {} o:{}\n'.format(i, self.actions[i], self.observs[i])
+            s += '\n[{}] a: {} o:{}\n'.format(i, actions[i], observs[i])
         return s
 
 
     def __len__(self):
-        return len(self.actions)
+        return self._tip.length if self._tip is not None else 0
+
+    @property
+    def actions(self):
+        return self.__materialize()[0]
+
+    @property
+    def observs(self):
+        return self.__materialize()[1]
+
+    def __materialize(self):
+        tip = self._tip
+        if tip is None:
+            return (), ()
+        if tip.actions is None:
+            actions, observs = [], []
+            link = tip
+            while link is not None:
+                actions.append(link.action)
+                observs.append(link.observ)
+                link = link.parent
+            tip.actions = tuple(actions)
+            tip.observs = tuple(observs)
+        return tip.actions, tip.observs
 
     def clone (self):
         """
         Return:
             History: clone of the current history
         """
-        # clone in reverse order
+        # links are immutable, the clone simply shares them
         h = History()
-        for a,o in zip(self.actions, self.observs):
-            h.add(a,o)
-        h.actions = h.actions[::-1]
-        h.observs = h.observs[::-1]
+        h._tip = self._tip
         return h
 
     def add(self, action, observation):
@@ -44,16 +113,18 @@ class History(object):
         """
         assert isinstance(action, POMDPAction)
         assert isinstance(observation, POMDPObservation)
-        self.actions.insert(0, action)
-        self.observs.insert(0, observation)
-        assert self.actions[0] == action
-    
+        self._tip = _Link(self._tip, action, observation)
+
     def last_action(self):
-        a = self.actions[0]
+        if self._tip is None:
+            raise IndexError("empty history")
+        a = self._tip.action
         assert isinstance(a, POMDPAction)
         return a
-    
+
     def last_obs(self):
-        o = self.observs[0]
+        if self._tip is None:
+            raise IndexError("empty history")
+        o = self._tip.observ
         assert isinstance(o, POMDPObservation)
-        return o
\ No newline at end of file
+        return o
@@ -6,6 +6,9 @@ class POMDPObservation(metaclass=ABCMeta):
 
     This class has to be extended regarding the application.
     """
+    # subclasses may define slots
+    __slots__ = ()
+
     @abstractmethod
     def available_actions(self, h = None):
         """
@@ -45,6 +48,23 @@ class POMDPObservation(metaclass=ABCMeta):
         return 0
     
     
+    def transposition_key(self, h, a=None):
+        """
+        Key of the history h ending with the current observation, for transpositions
+        (see mcts.transposition). Histories with equal keys must lead to the same belief.
+        Given an action a, key of the action after h: equal keys must have the same 
+        Q(h,a) value, which allows symmetric histories to share statistics.
+        Can override this function when different histories are equivalent.
+
+        Args:
+            h (History): history ending with the current observation
+            a (POMDPAction): next action (optional)
+
+        Return:
+            hashable key, None if h has no transposition
+        """
+        return None
+
     def is_terminal(self):
         """
         Return:
@@ -138,11 +158,76 @@ class DecisionProcess(metaclass=ABCMeta):
         domain knowledge. 
 
         Args:
-            B (set): current belief space approximated by an unweighted set of states (particles) 
+            B (Belief): current belief space approximated by a set of states (particles) 
             nSim(int): number of simulations
         """
         pass
 
+    def empty_belief(self, B, h):
+        """
+        Fill in an empty belief space from the history alone, when the search starts 
+        from a node that was never simulated (for instance after actions chosen 
+        without search). Does nothing by default.
+
+        Args:
+            B (Belief): empty belief space of the node
+            h (History): history of the node
+        """
+        pass
+
+    def seed(self, seed=None):
+        """
+        Reseed the random generators owned by the process, if any. Workers of a parallel
+        search reseed their copy of the process. Does nothing by default.
+
+        Args:
+            seed: None, int or np.random.SeedSequence (see mdp.seeding)
+        """
+        pass
+
+    def instrumented_methods(self):
+        """
+        Hot methods of the domain, timed by instrumented searches (see mcts.stats). 
+        Can override this function to list them.
+
+        Return:
+            list: (class, method name, label) of each method
+        """
+        return []
+
+    def rollout_policy(self, name):
+        """
+        Rollout policy of the given name. Can override this function to provide 
+        policies informed by domain knowledge. 
+
+        Args:
+            name (str): name of the policy, 'uniform' for uniformly random actions
+
+        Return:
+            callable (History -> POMDPAction): the policy, None for uniformly random actions
+        """
+        if name != 'uniform':
+            raise ValueError("unknown rollout policy {}".format(name))
+        return None
+
+    def rollouts(self, states, depth, gamma, epsilon, max_depth, policy='uniform'):
+        """
+        Batched playouts. Can override this function to simulate all the states 
+        at once rather than one after the other.
+
+        Args:
+            states (list): start states (POMDPState), left untouched
+            depth (int): current depth in the tree
+            gamma (float): reward discount factor
+            epsilon (float): history discount factor
+            max_depth (int): max depth
+            policy (str): name of the rollout policy (see rollout_policy)
+
+        Return:
+            list: the discounted return of each playout, or None if not supported
+        """
+        return None
+
     @abstractmethod
     def initial_belief(self):
         """
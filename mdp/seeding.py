@@ -0,0 +1,41 @@
+"""
+Seeds of the random generators. A seed is either None (fresh entropy), an int or a
+np.random.SeedSequence, from which independent seeds are spawned for the workers of
+a search or the games of an experiment.
+"""
+import random
+import numpy as np
+
+
+def sequence(seed=None):
+    """
+    Return:
+        np.random.SeedSequence: the seed sequence of the given seed
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+def spawn(seed, n):
+    """
+    Return:
+        list: n independent np.random.SeedSequence derived from the seed
+    """
+    return sequence(seed).spawn(n)
+
+def python_rng(seed=None):
+    """
+    Return:
+        random.Random: generator of the given seed, an int seed gives the same
+        stream as random.seed(seed)
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        seed = int.from_bytes(seed.generate_state(4).tobytes(), 'little')
+    return random.Random(seed)
+
+def numpy_rng(seed=None):
+    """
+    Return:
+        np.random.Generator: generator of the given seed
+    """
+    return np.random.default_rng(seed)
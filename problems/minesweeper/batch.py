@@ -0,0 +1,114 @@
+"""
+Playouts of a batch of Minesweeper states, advanced all at once as
+(boards x cells) NumPy arrays.
+"""
+import numpy as np
+from .globals import MINE, UNCOV
+from .topology import topology
+from .policy import POLICIES
+
+def unpack(x, n):
+    """
+    Return:
+        np.ndarray: the first n bits of the integer x as a bool array
+    """
+    b = np.frombuffer(x.to_bytes((n + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(b, bitorder='little')[:n].astype(bool)
+
+def stack(states):
+    """
+    Args:
+        states (list): State or BitState of a same board size
+
+    Return:
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray): mines, hints and revealed cells
+        of each state as (boards x cells) arrays, and whether each board is generated
+    """
+    b = states[0].board
+    n = b.h * b.w
+    N = len(states)
+    mines = np.zeros((N, n), dtype=bool)
+    hints = np.zeros((N, n), dtype=np.int8)
+    revealed = np.zeros((N, n), dtype=bool)
+    generated = np.zeros(N, dtype=bool)
+    for k, s in enumerate(states):
+        board = s.board
+        generated[k] = not board.firstmove
+        if hasattr(board, 'revealed'):
+            # bitboard
+            mines[k] = unpack(board.mines, n)
+            revealed[k] = unpack(board.revealed, n)
+            packed = np.frombuffer(board.hints.to_bytes((n + 1) // 2, 'little'), dtype=np.uint8)
+            hints[k, 0::2] = packed[:(n + 1) // 2] & 15
+            hints[k, 1::2] = packed[:n // 2] >> 4
+        else:
+            for i, (r, c) in enumerate(board.topology.cells):
+                v = board.minefield[r][c]
+                mines[k, i] = v is MINE
+                hints[k, i] = v if isinstance(v, int) else 0
+                revealed[k, i] = board.knowledge[r][c] != UNCOV
+    return mines, hints, revealed, generated
+
+def rollouts(states, depth, gamma, epsilon, max_depth, rng, policy=POLICIES['uniform']):
+    """
+    Playouts of all the states at once, following the rollout policy (uniformly random 
+    by default). A playout stops under the same conditions as mcts.pomcp.end_rollout: 
+    a mine is probed, only mines remain, gamma**d < epsilon or d >= max_depth.
+
+    Args:
+        states (list): State or BitState of a same board size, left untouched
+        depth (int): current depth in the tree
+        gamma (float): reward discount factor
+        epsilon (float): history discount factor
+        max_depth (int): max depth
+        rng (np.random.Generator): random generator
+        policy (Policy): rollout policy (see policy.POLICIES)
+
+    Return:
+        np.ndarray: the discounted return of each playout
+    """
+    b = states[0].board
+    m = b.m
+    t = topology(b.h, b.w)
+    A = t.adjacency
+    mines, hints, revealed, generated = stack(states)
+    N, n = mines.shape
+    rows = np.arange(N)
+    empty = (hints == 0) & ~mines
+    alive = ~(revealed & mines).any(axis=1) & ((~revealed).sum(axis=1) > m)
+    returns = np.zeros(N)
+    discount = 1.0
+    d = depth
+    while alive.any() and gamma**d >= epsilon and d < max_depth:
+        # the policy only sees the hints of revealed cells
+        a = policy.choose(np.where(revealed, hints, 0), revealed, m, t, rng)
+
+        # boards are generated on the first probe, which is never a mine
+        first = alive & ~generated
+        if first.any():
+            k = np.flatnonzero(first)
+            keys = rng.random((len(k), n))
+            keys[np.arange(len(k)), a[k]] = -1
+            placed = np.argpartition(-keys, m - 1, axis=1)[:, :m]
+            mines[k] = False
+            mines[k[:, None], placed] = True
+            hints[k] = (mines[k].astype(np.float32) @ A).astype(np.int8)
+            empty[k] = (hints[k] == 0) & ~mines[k]
+            generated[k] = True
+
+        hit = mines[rows, a] & alive
+        region = np.zeros((N, n), dtype=bool)
+        region[rows[alive], a[alive]] = True
+        # flood fill from the probed empty cells
+        while True:
+            grown = region | ((region & empty).astype(np.float32) @ A > 0)
+            if (grown == region).all():
+                break
+            region = grown
+        gained = (region & ~revealed).sum(axis=1)
+        returns += discount * np.where(hit, 0, gained)
+        revealed |= region
+        alive &= ~hit & ((~revealed).sum(axis=1) > m)
+        discount *= gamma
+        d += 1
+    return returns
@@ -0,0 +1,130 @@
+import random
+from .globals import MINE, UNCOV, NOTHING
+from .topology import topology
+
+def popcount(x):
+    return bin(x).count('1')
+
+def bits(x):
+    """
+    Yields indices of the bits set in x, lowest first
+    """
+    while x:
+        low = x & -x
+        yield low.bit_length() - 1
+        x ^= low
+
+class BitBoard(object):
+    """
+    Minesweeper board stored as integer bitmasks, cell (r, c) being the bit r * w + c.
+
+    Attributes:
+        mines (int): cells containing a mine
+        revealed (int): cells probed by the player
+        empty (int): cells that are neither a mine nor adjacent to one
+        hints (int): number of adjacent mines of each cell, packed by 4 bits
+    """
+    def __init__(self, height, width, mines, rng=None):
+        self.m = mines
+        self.h = height # rows
+        self.w = width  # cols
+        self.firstmove = True
+        self.topology = topology(height, width)
+        # generator placing the mines (random.Random), the random module if None
+        self.rng = rng
+        self.mines = 0
+        self.revealed = 0
+        self.empty = 0
+        self.hints = 0
+
+    def place_mines(self, mines):
+        """
+        Set the mines of the board and compute hints accordingly
+        """
+        self.mines = mines
+        hints = 0
+        empty = 0
+        neighbours = self.topology.neighbour_masks
+        for i in range(self.topology.n):
+            if not (mines >> i) & 1:
+                n = popcount(neighbours[i] & mines)
+                if n > 0:
+                    hints |= n << (4 * i)
+                else:
+                    empty |= 1 << i
+        self.hints = hints
+        self.empty = empty
+        self.firstmove = False
+
+    def generate_board(self, first):
+        """
+        randomly put mines on the minefield, except on the cell first
+        """
+        cells = [i for i in range(self.topology.n) if i != first]
+        mines = 0
+        for i in (self.rng or random).sample(cells, self.m):
+            mines |= 1 << i
+        self.place_mines(mines)
+
+    def value(self, i):
+        """
+        Return:
+            value of the cell i, as in the minefield of a Board
+        """
+        if (self.mines >> i) & 1:
+            return MINE
+        n = (self.hints >> (4 * i)) & 15
+        return n if n > 0 else NOTHING
+
+    def reveal(self, r, c):
+        """
+        Probe the cell (r, c) and reveal empty regions connected to it.
+        If it is the first action, the board is generated such that the cell (r, c)
+        is not a mine.
+
+        Return:
+            int: mask of the newly revealed cells
+        """
+        i = r * self.w + c
+        if self.firstmove:
+            self.generate_board(i)
+        cell = 1 << i
+        region = cell
+        if self.empty & cell:
+            # flood fill: grow the region around its empty cells until it is stable
+            while True:
+                grown = self.topology.dilate(region & self.empty) | region
+                if grown == region:
+                    break
+                region = grown
+        new = region & ~self.revealed
+        self.revealed |= region
+        return new
+
+    @property
+    def knowledge(self):
+        return [[ self.value(r * self.w + c) if (self.revealed >> (r * self.w + c)) & 1 else UNCOV
+            for c in range(self.w)] for r in range(self.h)]
+
+    @property
+    def minefield(self):
+        return [[ self.value(r * self.w + c) for c in range(self.w)] for r in range(self.h)]
+
+    def win(self):
+        if self.revealed & self.mines:
+            return False
+        return popcount(self.revealed) == self.topology.n - self.m
+
+    def clone(self):
+        b = BitBoard.__new__(BitBoard)
+        b.m = self.m
+        b.h = self.h
+        b.w = self.w
+        b.firstmove = self.firstmove
+        b.topology = self.topology
+        b.rng = self.rng
+        b.mines = self.mines
+        b.revealed = self.revealed
+        b.empty = self.empty
+        b.hints = self.hints
+        return b
@@ -1,6 +1,8 @@
 import os
 import random
 from .globals import FMOVE, UNCOV, MINE, NOTHING
+from .topology import topology
+from .symmetry import transform
 import numpy as np
 
 def array2D(row, col, elem):
@@ -21,18 +23,15 @@ def symmetries(matrix):
         yield (np.fliplr(r), i, True)
 
 def symm_coord(r,c, matrix, nr=0, flip=False):
-    m = array2D(len(matrix), len(matrix[0]), 0)
-    m[r][c] = 1
-    m = np.rot90(m, k=nr)
-    m = np.fliplr(m) if flip else m
-    #return tuple(a for a in np.argwhere(np.array(m)==1)[0])
-    for i in range(len(m)):
-        for j in range(len(m[0])):
-            if m[i][j] == 1:
-                return (i,j)
+    """
+    Return:
+        (int, int): coordinates of the cell (r,c) once the matrix is rotated nr times
+        and mirrored if flip (see symmetries)
+    """
+    return transform(len(matrix), len(matrix[0]), nr, flip).cell(r, c)
 
 class Board(object):
-    def __init__(self, height, width, mines):
+    def __init__(self, height, width, mines, rng=None):
         self.m = mines
         self.h = height # rows
         self.w = width  # cols
@@ -44,34 +43,28 @@ class Board(object):
         self.knowledge = array2D(height, width, UNCOV)
         # count of unvisited cells
         self.nUncov = self.h * self.w
+        # neighbourhoods, shared by all the boards of this size
+        self.topology = topology(height, width)
+        # generator placing the mines (random.Random), the random module if None
+        self.rng = rng
 
 
     def neighbourhood(self, x, y):
         """
-        Yields coordinates (r,c) for neighbours of the cell (x,y)
+        Return:
+            tuple: coordinates (r,c) of the neighbours of the cell (x,y)
         """
-        l = []
-        l.append((x,y-1)) # n
-        l.append((x+1,y-1)) # ne
-        l.append((x+1,y)) # e
-        l.append((x+1,y+1)) # se
-        l.append((x,y+1)) # s
-        l.append((x-1,y+1)) # sw
-        l.append((x-1,y)) # w
-        l.append((x-1,y-1)) # nw
-        for r,c in l:
-            if r in range(self.h) and c in range(self.w):
-                yield (r,c)
-        
+        return self.topology.around[x][y]
 
     def __place_mines(self):
         """
         randomly put mines on the minefield
         """
+        rng = self.rng or random
         placed = 0
         while placed < self.m:
-            x = random.randint(0, self.h - 1)
-            y = random.randint(0, self.w - 1)
+            x = rng.randint(0, self.h - 1)
+            y = rng.randint(0, self.w - 1)
             if self.minefield[x][y] is not MINE and self.minefield[x][y] is not FMOVE :
                 # first move should never be a mine
                 self.minefield[x][y] = MINE
@@ -79,17 +72,16 @@ class Board(object):
     
     def __mine_near(self, x, y):
         count = 0
-        for r,c in self.neighbourhood(x, y):
+        for r,c in self.topology.around[x][y]:
             if self.minefield[r][c] is MINE:
                 count += 1
         return count 
 
     def __hints(self):
-        for i in range(self.h):
-            for j in range(self.w):
-                if self.minefield[i][j] is not MINE:
-                    mine_near = self.__mine_near(i,j)
-                    self.minefield[i][j] = mine_near if mine_near > 0 else NOTHING
+        for i, j in self.topology.cells:
+            if self.minefield[i][j] is not MINE:
+                mine_near = self.__mine_near(i,j)
+                self.minefield[i][j] = mine_near if mine_near > 0 else NOTHING
 
     def generate_board(self):
         self.__place_mines()
@@ -167,7 +159,13 @@ class Board(object):
         return count == self.m
 
     def clone(self):
-        b = Board(self.h, self.w, self.m)
+        # no need to allocate the matrices of a new board
+        b = Board.__new__(Board)
+        b.m = self.m
+        b.h = self.h
+        b.w = self.w
+        b.topology = self.topology
+        b.rng = self.rng
         b.minefield = [list(col) for col in self.minefield]
         b.knowledge = [list(col) for col in self.knowledge]
         b.nUncov = self.nUncov
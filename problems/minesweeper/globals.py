@@ -13,6 +13,11 @@ SIX = 6
 SEVEN = 7
 EIGHT = 9
 
+# byte code of the cell values that are not hints (hints are coded by themselves)
+CODES = {NOTHING: 0, UNCOV: 10, MINE: 11, FMOVE: 12}
+# cell value of each byte code
+VALUES = (NOTHING,) + tuple(range(1, 10)) + (UNCOV, MINE, FMOVE)
+
 def save_obj(obj, name):
     with open('obj/'+ name + '.pkl', 'wb') as f:
         pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
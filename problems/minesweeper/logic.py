@@ -0,0 +1,119 @@
+"""
+Deductions that do not need any search: cells that are certainly safe or
+certainly mined given the revealed hints.
+"""
+from .globals import UNCOV, MINE, NOTHING
+from .topology import topology
+
+class Deducer(object):
+    """
+    Incremental deduction over the hints of a board. Each revealed hint is a
+    constraint (covered neighbours, mines among them). Two rules are applied
+    until nothing changes:
+
+    - single hint: if the mines left equal 0, all the cells are safe; if they equal
+      the number of cells, all the cells are mines
+    - subset: if the cells of a constraint A are included in those of a constraint B,
+      the cells of B outside A hold the difference of their counts
+
+    Only the constraints around newly revealed or newly deduced cells are examined.
+
+    Attributes:
+        safe (set): flat indices of covered cells known to be safe
+        mines (set): flat indices of covered cells known to be mines
+        revealed (set): flat indices of the revealed cells
+    """
+    def __init__(self, height, width):
+        self.topology = topology(height, width)
+        self.reset()
+
+    def reset(self):
+        self.safe = set()
+        self.mines = set()
+        self.revealed = set()
+        # hint of each revealed cell with covered neighbours
+        self.hints = dict()
+
+    def constraint(self, i):
+        """
+        Return:
+            (frozenset, int): cells of the hint i that are not deduced yet and
+            number of mines among them
+        """
+        cells = set()
+        count = self.hints[i]
+        for j in self.topology.neighbours[i]:
+            if j in self.mines:
+                count -= 1
+            elif j not in self.revealed and j not in self.safe:
+                cells.add(j)
+        return frozenset(cells), count
+
+    def update(self, knowledge):
+        """
+        Take into account the cells revealed since the last update, and deduce
+        what can be.
+
+        Args:
+            knowledge (list): knowledge matrix of the board
+        """
+        t = self.topology
+        pending = set()
+        for i, (r, c) in enumerate(t.cells):
+            v = knowledge[r][c]
+            if v == UNCOV or i in self.revealed:
+                continue
+            self.revealed.add(i)
+            self.safe.discard(i)
+            if v == MINE:
+                # lost game, nothing to deduce anymore
+                self.mines.add(i)
+                continue
+            if v != NOTHING:
+                self.hints[i] = v
+                pending.add(i)
+            pending.update(j for j in t.neighbours[i] if j in self.hints)
+        self.__propagate(pending)
+
+    def __learn(self, cells, mine, pending):
+        for j in cells:
+            if mine:
+                self.mines.add(j)
+            else:
+                self.safe.add(j)
+            pending.update(k for k in self.topology.neighbours[j] if k in self.hints)
+
+    def __propagate(self, pending):
+        t = self.topology
+        while pending:
+            i = pending.pop()
+            cells, count = self.constraint(i)
+            if not cells:
+                continue
+            # single hint
+            if count == 0 or count == len(cells):
+                self.__learn(cells, count > 0, pending)
+                continue
+            # subset, with the hints sharing a cell with i
+            around = {k for j in cells for k in t.neighbours[j] if k in self.hints and k != i}
+            for k in around:
+                other, n = self.constraint(k)
+                if other and cells < other:
+                    rest, left = other - cells, n - count
+                elif other and other < cells:
+                    rest, left = cells - other, count - n
+                else:
+                    continue
+                if left == 0 or left == len(rest):
+                    self.__learn(rest, left > 0, pending)
+                    pending.add(i)
+                    break
+
+    def next_safe(self):
+        """
+        Return:
+            (int, int): coordinates of a covered cell known to be safe, None if there is none
+        """
+        for i in sorted(self.safe - self.revealed):
+            return self.topology.cells[i]
+        return None
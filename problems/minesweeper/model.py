@@ -1,39 +1,113 @@
 from problems.minesweeper.board import Board
+from problems.minesweeper.bitboard import BitBoard, popcount, bits
+from problems.minesweeper import batch
+from problems.minesweeper.policy import POLICIES, policy
+from problems.minesweeper.solver import Solver, probabilities
+from problems.minesweeper.topology import topology
+from problems.minesweeper.symmetry import canonical_code, encode
+import numpy as np
 import random
 import math
-from problems.minesweeper.globals import UNCOV, MINE, NOTHING
+import weakref
+from problems.minesweeper.globals import UNCOV, MINE, NOTHING, CODES, VALUES
 from mdp.pomdp import POMDPState, POMDPObservation, POMDPAction, DecisionProcess
-from mcts.pomcp import params
+from mdp import seeding
+from mcts.pomcp import active
 
 class Observation(POMDPObservation):
     """
-    Observations for Minesweeper consist of the knowledge matrix
+    Observations for Minesweeper consist of the knowledge matrix, stored as one byte 
+    per cell (see symmetry.encode). Observations are interned: equal observations are 
+    the same object as long as one of them is alive, and what is derived from them 
+    (hash, terminal flag, available actions) is computed once.
+
+    Attributes:
+        code (bytes): code of the knowledge matrix, row by row
+        h (int): number of rows
+        w (int): number of columns
+        m (int): number of mines
+        covered (int): number of covered cells
     """
-    def __init__(self, knowledge, mines):
-        self.K = knowledge
-        self.m = mines
-        self.__t = tuple([ tuple(row) for row in self.K ])
-    
+    __slots__ = ('code', 'h', 'w', 'm', 'covered', '__hash', '__terminal', '__actions', 
+        '__canonical', '__weakref__')
+    __pool = weakref.WeakValueDictionary()
+
+    def __new__(cls, knowledge, mines):
+        return cls.from_code(encode(knowledge), len(knowledge), len(knowledge[0]), mines)
+
+    @classmethod
+    def from_code(cls, code, height, width, mines):
+        """
+        Return:
+            Observation: the interned observation of the given code
+        """
+        key = (code, width, mines)
+        o = cls.__pool.get(key)
+        if o is None:
+            o = object.__new__(cls)
+            o.code = code
+            o.h = height
+            o.w = width
+            o.m = mines
+            o.covered = code.count(CODES[UNCOV])
+            o.__hash = hash(key)
+            o.__terminal = CODES[MINE] in code or o.covered == mines
+            o.__actions = None
+            o.__canonical = None
+            cls.__pool[key] = o
+        return o
+
+    @classmethod
+    def of(cls, state):
+        """
+        Return:
+            Observation: what the player sees of a State or a BitState
+        """
+        b = state.board
+        if isinstance(b, BitBoard):
+            n = b.h * b.w
+            # hints are coded by themselves, NOTHING by 0
+            packed = np.frombuffer(b.hints.to_bytes((n + 1) // 2, 'little'), dtype=np.uint8)
+            code = np.empty(n, dtype=np.uint8)
+            code[0::2] = packed[:(n + 1) // 2] & 15
+            code[1::2] = packed[:n // 2] >> 4
+            code[batch.unpack(b.mines, n)] = CODES[MINE]
+            code[~batch.unpack(b.revealed, n)] = CODES[UNCOV]
+            return cls.from_code(code.tobytes(), b.h, b.w, b.m)
+        return cls(b.knowledge, b.m)
+
+    def __reduce__(self):
+        # unpickled observations are interned as well
+        return (Observation.from_code, (self.code, self.h, self.w, self.m))
+
+    @property
+    def K(self):
+        """
+        list: knowledge matrix, decoded
+        """
+        w = self.w
+        return [[VALUES[v] for v in self.code[r * w:(r + 1) * w]] for r in range(self.h)]
+
     def available_actions(self, h = None):
-        if self.is_terminal():
-            return 
-            yield   # to avoid TypeError
-
-        for row in range(len(self.K)):
-            for col in range(len(self.K[0])):
-                val = self.K[row][col]
-                a = Action(row, col)
-                if val == UNCOV and not (h and a in h.actions):
-                    yield a
+        if self.__actions is None:
+            if self.__terminal:
+                self.__actions = ()
+            else:
+                u = CODES[UNCOV]
+                self.__actions = tuple(Action(i // self.w, i % self.w) for i, v in enumerate(self.code) if v == u)
+        if not h:
+            return iter(self.__actions)
+        return (a for a in self.__actions if a not in h.actions)
     
     def __eq__(self, oth):
+        if self is oth:
+            return True
         if not isinstance(oth, Observation):
             return False 
-        return self.__t == oth.__t and self.m == oth.m
+        return self.code == oth.code and self.w == oth.w and self.m == oth.m
     
     def __hash__(self):
-        t = tuple([ tuple(row) for row in self.K ])
-        return hash((t, self.m)) 
+        return self.__hash
     
     def __str__(self):
         s = ''
@@ -43,39 +117,49 @@ class Observation(POMDPObservation):
         return s 
     
     #__repr__= __str__
+
+    def transposition_key(self, h, a=None):
+        # the belief only depends on the cells revealed so far, whatever the order
+        if a is None:
+            # particles are only shared between boards of the same orientation
+            return self
+        # values are shared between symmetric boards
+        if self.__canonical is None:
+            self.__canonical = canonical_code(self.code, self.h, self.w)
+        code, t = self.__canonical
+        return (code, self.m, t.cell(*a.cell))
+
+    def mine_probabilities(self):
+        """
+        Return:
+            list: exact probability that each cell is a mine given the observation
+            (see solver.Solver.probabilities), None if it cannot be solved
+        """
+        return probabilities(tuple(tuple(row) for row in self.K), self.m)
     
     def is_terminal(self):
-        count = 0
-        for row in self.K:
-            for val in row:
-                if val == MINE:
-                    return True # loss
-                count += 1 if val == UNCOV else 0
-        return count == self.m
+        return self.__terminal
     
     def __is_start_obs(self):
-        for row in self.K:
-            for e in row:
-                if e != UNCOV:
-                    return False
-        return True
+        return self.covered == self.h * self.w
     
     def __is_corner_move(self, h ,a):
         # first move should be corners, to take advantage
         # of the fact that the first move is always safe
-        H = len(self.K)
-        W = len(self.K[0])
+        H = self.h
+        W = self.w
         corners = {Action(0, 0), Action(H-1, 0), Action(H-1, W-1), Action(0, W-1)}
         return self.__is_start_obs() and a in corners
 
     def V_init(self, h , a):
+        params = active().params
         if self.__is_corner_move(h, a) and params['prefs']:
             #print("first move in corner")
             return params['R_hi']
         return 0
     
     def N_init(self, h, a ):
-        if self.__is_corner_move(h,a) and params['prefs']:
+        if self.__is_corner_move(h,a) and active().params['prefs']:
             return 10
         return 0
         
@@ -102,13 +186,13 @@ class Action(POMDPAction):
         return hash(self.cell)
     
     def do_on(self, state):
-        assert isinstance(state, State)
-        init_len = len(state.interior) + len(state.frontier)
+        assert isinstance(state, (State, BitState))
+        init_len = state.n_revealed()
         val = state.probe(self.cell[0], self.cell[1], log=False)
-        after = len(state.interior) + len(state.frontier)
+        after = state.n_revealed()
         # intermediate reward of 1 per probed cell (before landing on a mine)
         r = 0 if val == MINE else after - init_len
-        return (Observation(state.board.knowledge, state.board.m), r)
+        return (Observation.of(state), r)
 
 class State(POMDPState):
     """
@@ -148,6 +232,76 @@ class State(POMDPState):
         for setname in sets:
             setattr(s, setname, set({cell for cell in getattr(self, setname)}) )
         return s
+
+    def n_revealed(self):
+        return len(self.interior) + len(self.frontier)
+
+    def with_mines(self, mines):
+        """
+        Args:
+            mines (int): mask of the mines, cell (r, c) being the bit r * w + c
+
+        Return:
+            State: copy of the state whose covered cells hold the given mines
+        """
+        particle = self.clone()
+        b = particle.board
+        t = b.topology
+        covered = [i for i, (r, c) in enumerate(t.cells) if b.knowledge[r][c] == UNCOV]
+        for i in covered:
+            r, c = t.cells[i]
+            if (mines >> i) & 1:
+                b.minefield[r][c] = MINE
+            else:
+                n = popcount(t.neighbour_masks[i] & mines)
+                b.minefield[r][c] = n if n > 0 else NOTHING
+        particle.__tM = tuple([ tuple(row) for row in b.minefield ])
+        return particle
+
+    def resample(self, rng=random):
+        """
+        Args:
+            rng (random.Random): random generator
+
+        Return:
+            State: copy of the state in which the mines lying in uncovs are moved 
+            at random locations within uncovs
+        """
+        around = self.board.topology.around
+        def mine_near(b, x, y):
+            count = 0
+            for r,c in around[x][y]:
+                if b.minefield[r][c] is MINE:
+                    count += 1
+            return count 
+
+        # we only consider mines in the set of uncovered cells
+        uncov_mines = 0
+        uncov_copy = set({cell for cell in self.uncovs})
+        particle = self.clone()
+        for r,c in uncov_copy:
+            # clear the uncovered minefield of our particle
+            particle.board.minefield[r][c] = NOTHING
+            if self.board.minefield[r][c] == MINE:
+                # count the mines within uncovered cells
+                uncov_mines += 1
+            
+        # we randomly change location of mines in the set of uncovered cells
+        new_locations = set()
+        while len(new_locations) < uncov_mines:
+            rnd_cell = rng.choice(tuple(uncov_copy))
+            if rnd_cell not in new_locations:
+                uncov_copy.discard(rnd_cell)
+                new_locations.add(rnd_cell)
+
+        # place mines at new location and compute hints 
+        for r,c in particle.uncovs:
+            if (r,c) in new_locations:
+                particle.board.minefield[r][c] = MINE
+            else:
+                mn = mine_near(particle.board, r, c)
+                particle.board.minefield[r][c] = mn if mn > 0 else NOTHING
+        return particle
     
     def ___remove_from_uncovs(self, R, C):
         # sets update
@@ -159,8 +313,9 @@ class State(POMDPState):
 
     def __update_fringe(self):
         adj = set()
+        around = self.board.topology.around
         for r,c in self.frontier:
-            adj.update({cell for cell in self.board.neighbourhood(r,c)})
+            adj.update(around[r][c])
 
         for cell in adj:
             if cell in self.uncovs:
@@ -179,7 +334,8 @@ class State(POMDPState):
             #if log:
             #    print("autoprobe")
             self.interior.add((r,c))
-            autoprob = [ cell for cell in self.board.neighbourhood(r,c) ]
+            around = self.board.topology.around
+            autoprob = list(around[r][c])
             done = set()
             while autoprob:
                 R, C = autoprob.pop()
@@ -188,7 +344,7 @@ class State(POMDPState):
                 done.add((R,C))
                 if v is NOTHING:
                     self.interior.add((R,C))
-                    for cell in self.board.neighbourhood(R, C):
+                    for cell in around[R][C]:
                         if cell not in done:
                             autoprob.append(cell)
                 else:
@@ -200,12 +356,105 @@ class State(POMDPState):
         self.__tK = tuple([ tuple(row) for row in self.board.knowledge ])
         return val
 
+class BitState(POMDPState):
+    """
+    State backed by a BitBoard. Clone and hash only copy a few integers, 
+    and the sets of cells of State are derived from the masks on demand.
+    """
+    def __init__(self, board):
+        assert isinstance(board, BitBoard)
+        self.board = board
+
+    def __hash__(self):
+        return hash((self.board.mines, self.board.revealed, self.board.m))
+
+    def __eq__(self, other):
+        return (self.board.mines, self.board.revealed, self.board.m) == \
+            (other.board.mines, other.board.revealed, other.board.m)
+
+    def is_goal(self):
+        return self.board.win()
+
+    def clone(self):
+        return BitState(self.board.clone())
+
+    def __cells(self, mask):
+        w = self.board.w
+        return {(i // w, i % w) for i in bits(mask)}
+
+    def __fringe(self):
+        b = self.board
+        hints = b.revealed & ~b.empty & ~b.mines
+        return b.topology.dilate(hints) & ~b.revealed
+
+    @property
+    def interior(self):
+        return self.__cells(self.board.revealed & self.board.empty)
+
+    @property
+    def frontier(self):
+        return self.__cells(self.board.revealed & ~self.board.empty)
+
+    @property
+    def fringe(self):
+        return self.__cells(self.__fringe())
+
+    @property
+    def uncovs(self):
+        b = self.board
+        return self.__cells(b.topology.full & ~b.revealed & ~self.__fringe())
+
+    def n_revealed(self):
+        b = self.board
+        return popcount(b.revealed & ~b.mines)
+
+    def with_mines(self, mines):
+        """
+        Args:
+            mines (int): mask of the mines
+
+        Return:
+            BitState: copy of the state whose board holds the given mines
+        """
+        particle = self.clone()
+        particle.board.place_mines(mines)
+        return particle
+
+    def resample(self, rng=random):
+        """
+        Args:
+            rng (random.Random): random generator
+
+        Return:
+            BitState: copy of the state in which the mines lying in uncovs are moved 
+            at random locations within uncovs
+        """
+        b = self.board
+        uncovs = b.topology.full & ~b.revealed & ~self.__fringe()
+        particle = self.clone()
+        mines = b.mines & ~uncovs
+        for i in rng.sample(list(bits(uncovs)), popcount(b.mines & uncovs)):
+            mines |= 1 << i
+        particle.board.place_mines(mines)
+        return particle
+
+    def probe(self, r, c, log=True):
+        if log:
+            print((r, c))
+        self.board.reveal(r, c)
+        return self.board.value(r * self.board.w + c)
+
 
 class Minesweeper(DecisionProcess):
-    def __init__(self, h, w, m):
+    def __init__(self, h, w, m, bitboard=False, seed=None):
         self.h = h
         self.w = w
         self.m = m
+        self.bitboard = bitboard
+        # generator of the boards of initial_belief, and of the rollout policies
+        self.rng = None
+        self.np_random = None
+        self.seed(seed)
         # map (h, w, m) -> (R_lo, R_hi)
         self.R = dict()
         self.R.update({
@@ -222,17 +471,75 @@ class Minesweeper(DecisionProcess):
             (9,9,10): (0.0, 60.0),
             (16,16,40): (0.0, 160.0)
         })
-        self.set_params()
 
-    def __empty_belief(self, B, h):
-        # create at least 1 particle that can then be used by the invigoration algorithm,
-        # based on the current observation
-        pass
-    
-    def set_params(self):
+    def __observed_state(self, o):
+        """
+        Return:
+            POMDPState: state showing the observation o, whose covered cells are 
+            still to be filled in (see with_mines)
+        """
+        t = topology(self.h, self.w)
+        if self.bitboard:
+            b = BitBoard(self.h, self.w, self.m)
+            b.firstmove = False
+            u = CODES[UNCOV]
+            for i, v in enumerate(o.code):
+                if v != u:
+                    b.revealed |= 1 << i
+            return BitState(b)
+        K = o.K
+        b = Board(self.h, self.w, self.m)
+        b.knowledge = K
+        # covered cells are overwritten by with_mines
+        b.minefield = [list(row) for row in K]
+        b.firstmove = False
+        b.nUncov = o.covered
+        s = State(b)
+        s.uncovs = set()
+        for r, c in t.cells:
+            v = K[r][c]
+            if v == NOTHING:
+                s.interior.add((r, c))
+            elif v == UNCOV:
+                s.uncovs.add((r, c))
+            elif v != MINE:
+                s.frontier.add((r, c))
+        for r, c in s.frontier:
+            for cell in t.around[r][c]:
+                if cell in s.uncovs:
+                    s.uncovs.discard(cell)
+                    s.fringe.add(cell)
+        return s
+
+    def empty_belief(self, B, h):
+        # boards drawn from the exact posterior of the last observation
+        o = h.last_obs()
+        sampler = Solver(o.K, o.m)
+        if not sampler.consistent():
+            return
+        base = self.__observed_state(o)
+        ctx = active()
+        for _ in range(B.capacity or ctx.params['K']):
+            B.append(base.with_mines(sampler.sample(ctx.rng)), rng=ctx.rng)
+
+    def seed(self, seed=None):
+        rng_seed, np_seed = seeding.spawn(seed, 2)
+        if self.rng is None:
+            self.rng = seeding.python_rng(rng_seed)
+        else:
+            # boards of initial_belief share the generator
+            self.rng.setstate(seeding.python_rng(rng_seed).getstate())
+        self.np_random = seeding.numpy_rng(np_seed)
+
+    def set_params(self, params=None):
         """
         This method is called by the player to initiate parameters values before the search.
+
+        Args:
+            params (dict): parameters of the search context, those of the active context by default
         """
+        if params is None:
+            params = active().params
         
         lo, hi = self.R.get((self.h, self.w, self.m), (0.0, 0.0))
         params.update({
@@ -247,53 +554,46 @@ class Minesweeper(DecisionProcess):
 
     def invigoration(self, B, nSim):
         assert len(B) > 0, "empty belief"
+        ctx = active()
+        params, rng = ctx.params, ctx.rng
         max_to_add = math.floor(nSim/params['K'])
-        init_len = len(B)
-        tries = 0
+        if B.capacity is not None:
+            # a full belief would only replace the new particles
+            max_to_add = min(max_to_add, B.capacity)
+        added = 0
+        particle = B.sample(rng)
+        sampler = None
+        if not particle.board.firstmove:
+            # all the particles of B share the same observation
+            sampler = Solver(particle.board.knowledge, particle.board.m)
+            if not sampler.consistent():
+                sampler = None
+        while added < max_to_add and added < 1000:
+            if sampler is not None:
+                # board drawn from the exact posterior of the observation
+                B.append(particle.with_mines(sampler.sample(rng)), rng=rng)
+            else:
+                # artificial state to add noise in the belief set
+                B.append(B.sample(rng).resample(rng), rng=rng)
+            added += 1
+        if params['log'] >= 2:
+            print("{} state(s) added".format(added))
 
-        def mine_near(b, x, y):
-            count = 0
-            for r,c in b.neighbourhood(x, y):
-                if b.minefield[r][c] is MINE:
-                    count += 1
-            return count 
+    def instrumented_methods(self):
+        return [(cls, name, label) for cls in (State, BitState) 
+            for name, label in (('probe', 'probe'), ('clone', 'clone'), ('__hash__', 'hash'))]
 
-        while len(B) != max_to_add + init_len and tries < 1000:
-            tries += 1 # try at most 100 times
-            rnd = random.choice(tuple(B))
-            # we only consider mines in the set of uncovered cells
-            uncov_mines = 0
-            mines = set()
-            uncov_copy = set({cell for cell in rnd.uncovs})
-            particle = rnd.clone() # artificial state to add noise in the belief set
-            for r,c in uncov_copy:
-                # clear the uncovered minefield of our particle
-                particle.board.minefield[r][c] = NOTHING
-                if rnd.board.minefield[r][c] == MINE:
-                    # count the mines within uncovered cells
-                    mines.add((r,c))
-                    uncov_mines += 1
-                
-            # we randomly change location of mines in the set of uncovered cells
-            new_locations = set()
-            while len(new_locations) < uncov_mines:
-                rnd_cell = random.choice(tuple(uncov_copy))
-                if rnd_cell not in new_locations:
-                    uncov_copy.discard(rnd_cell)
-                    new_locations.add(rnd_cell)
-
-            # place mines at new location and compute hints 
-            for r,c in particle.uncovs:
-                if (r,c) in new_locations:
-                    particle.board.minefield[r][c] = MINE
-                else:
-                    mn = mine_near(particle.board, r, c)
-                    particle.board.minefield[r][c] = mn if mn > 0 else NOTHING
-            
-            B.append(particle)
-        if params['log'] >= 2:
-            print("{} state(s) added".format(len(B) - init_len))
+    def rollout_policy(self, name):
+        p = policy(name)
+        if name == 'uniform':
+            return None
+        return lambda h: Action(*p.cell(h.last_obs(), self.np_random))
+
+    def rollouts(self, states, depth, gamma, epsilon, max_depth, policy='uniform'):
+        return list(batch.rollouts(states, depth, gamma, epsilon, max_depth, self.np_random, POLICIES[policy]))
 
     def initial_belief(self):
-        return State(Board(self.h, self.w, self.m))
+        if self.bitboard:
+            return BitState(BitBoard(self.h, self.w, self.m, self.rng))
+        return State(Board(self.h, self.w, self.m, self.rng))
         
\ No newline at end of file
@@ -1,12 +1,15 @@
-import random
 import os
+import pickle
 from .model import State, Observation, Action, Minesweeper
-from .board import Board, symmetries, symm_coord
-from .globals import MINE, load_obj, save_obj
+from .board import Board
+from .symmetry import canonical, encode, transform
+from .logic import Deducer
+from .globals import MINE, save_obj
 from abc import ABCMeta, abstractmethod
-from mcts.pomcp import search, params
+from mcts.pomcp import POMCP
 from mdp.history import History
 from mdp.pomdp import POMDPAction
+from mdp import seeding
 
 class AbstractPlayer(metaclass=ABCMeta):
     @abstractmethod
@@ -17,37 +20,88 @@ class AbstractPlayer(metaclass=ABCMeta):
     def reset(self):
         pass
 
+    def seed(self, seed=None):
+        """
+        Reseed the random generators of the player.
+
+        Args:
+            seed: None, int or np.random.SeedSequence (see mdp.seeding)
+        """
+        pass
+
+    def stats(self):
+        """
+        Return:
+            dict: statistics of the last game played (reset has been called since)
+        """
+        return dict()
+
 class RandomPlayer(AbstractPlayer):
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self.rng = seeding.python_rng(seed)
+
     def next_action(self, state):
-        return (random.choice(range(state.board.h)), random.choice(range(state.board.w)) )
+        return (self.rng.choice(range(state.board.h)), self.rng.choice(range(state.board.w)) )
     
     def reset(self):
         pass
 
 class MCPlayer(AbstractPlayer):
-    def __init__(self, max_iter, timeout, log=0, pref=True):
+    def __init__(self, max_iter, timeout, log=0, pref=True, bitboard=False, batch=0, workers=1, reuse=False, deduce=False, 
+            transposition=0, selection='ucb1', rollout='uniform', instrument=False, seed=None):
         self.max_iter = max_iter
-        params['timeout']= timeout
-        params['log'] = log
-        if not pref:
-            params["prefs"] = False
+        self.workers = workers
+        self.bitboard = bitboard
+        # search context of the player
+        self.ctx = POMCP(timeout=timeout, log=log, batch=batch, prefs=pref, reuse=reuse, transposition=transposition, 
+            selection=selection, rollout=rollout, instrument=instrument, seed=seed)
         self.h = History()
         self.last_action = POMDPAction()
         self.first = True
+        # safe moves are played without search when deduce is set
+        self.deduce = deduce
+        self.deducer = None
+        # the tree does not follow moves played without search
+        self.stale = False
+        # iterations and max tree size of the current and last game
+        self.game = dict(iterations=0, tree_size=0, deduced=0)
+        self.last_game = dict(self.game)
 
     def next_action(self, state):
         # init domain knowledge
         if self.first:
-            self.dom_kno = Minesweeper(state.board.h, state.board.w, state.board.m)
+            self.dom_kno = Minesweeper(state.board.h, state.board.w, state.board.m, self.bitboard, 
+                self.ctx.seeds.spawn(1)[0])
+            self.dom_kno.set_params(self.ctx.params)
             #self.first = False
         # update history with last action - observation
-        o = Observation(state.board.clone().knowledge, state.board.m)
+        o = Observation.of(state)
         self.h.add(self.last_action, o)
         #print(self.h)
+        if self.deduce:
+            if self.deducer is None:
+                self.deducer = Deducer(state.board.h, state.board.w)
+            self.deducer.update(o.K)
+            cell = self.deducer.next_safe()
+            if cell is not None:
+                # certainly safe: no need to search
+                self.last_action = Action(*cell)
+                self.stale = True
+                self.game['deduced'] += 1
+                return cell
         # launch UCT to select next best action based on current history
-        a = search(self.h.clone(), self.dom_kno, self.max_iter, clean=self.first)
+        a = self.ctx.search(self.h.clone(), self.dom_kno, self.max_iter, clean=self.first or self.stale, workers=self.workers)
         if self.first:
             self.first = False
+        self.stale = False
+        self.game['iterations'] += self.ctx.iterations
+        self.game['tree_size'] = max(self.game['tree_size'], self.ctx.tree_size())
+        if self.ctx.stats is not None:
+            # stats of each search, when instrumented
+            self.game.setdefault('searches', []).append(self.ctx.stats.to_dict())
         self.last_action = a
         assert isinstance(a, Action)
         return a.cell
@@ -56,10 +110,38 @@ class MCPlayer(AbstractPlayer):
         self.h = History()
         self.last_action = POMDPAction()
         self.first = True
+        self.stale = False
+        # the next game may be played on a board of another size
+        self.deducer = None
+        if self.ctx.table is not None:
+            self.ctx.table.clear()
+        self.last_game = self.game
+        self.game = dict(iterations=0, tree_size=0, deduced=0)
 
+    def seed(self, seed=None):
+        self.ctx.seed(seed)
 
+    def stats(self):
+        return dict(self.last_game)
 
 
+
+
+# version of the tables saved by QPlayer
+TABLE_VERSION = 2
+
+class _LegacyObservation(object):
+    """
+    Observation as pickled in the tables of version 1, with the knowledge matrix K 
+    and the number of mines m.
+    """
+
+class _TableUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) == ('problems.minesweeper.model', 'Observation'):
+            return _LegacyObservation
+        return super().find_class(module, name)
+
 class QPlayer(AbstractPlayer):
     """
     This player follows a simplified Q-learning approach. The value function is 
@@ -71,40 +153,61 @@ class QPlayer(AbstractPlayer):
     correct moves. P(s,a) is a value representing the probability the cell probed by 
     action a on a state s does not contains a mine.
     """
-    def __init__(self, ind, sym=True):
+    def __init__(self, ind, sym=True, seed=None):
         # id
         self.ind = ind
-        ## map obs, map action -> value
+        self.sym = sym
+        ## map (canonical knowledge, mines) -> map action -> occurrences
         self.P = dict()
         if os.listdir('obj'):
             if 'P{}.pkl'.format(ind) in os.listdir('obj'):
-                self.P = load_obj("P{}".format(ind))
-        self.sym = sym
+                self.P = self.__load("P{}".format(ind))
         self.first = True
+        self.seed(seed)
 
-    def __sym_update(self, state, cell): 
-        for k,m in zip(symmetries(state.board.knowledge), symmetries(state.board.minefield)):
-            b = Board(len(k), len(k[0]), state.board.m)
-            b.minefield = m[0]
-            b.knowledge = k[0]
-            s = State(b)
-            c = symm_coord(cell[0], cell[1], state.board.knowledge, nr=k[1], flip=k[2])
-            self.__mono_update(s, c)
+    def seed(self, seed=None):
+        self.rng = seeding.python_rng(seed)
 
-    def __mono_update(self, state, cell):
-        o = Observation(state.board.knowledge, state.board.m)
-        actions = self.P.get(o, dict())
-        occurence = actions.get(cell, 0)
-        occurence += 1
-        self.P.update({o:{cell:occurence}})
-        #self.P[o][cell] = occurence
+    def __key(self, knowledge):
+        """
+        Return:
+            (bytes, Transform): key of the knowledge in P, canonical if symmetries are 
+            enabled, and the transform from the board to the key
+        """
+        if self.sym:
+            return canonical(knowledge)
+        return encode(knowledge), transform(len(knowledge), len(knowledge[0]))
 
+    def __load(self, name):
+        """
+        Return:
+            dict: the table P saved under the given name, converted if it was saved 
+            by an older version
+        """
+        with open('obj/' + name + '.pkl', 'rb') as f:
+            table = _TableUnpickler(f).load()
+        if isinstance(table, dict) and table.get('version') == TABLE_VERSION:
+            return table['P']
+        if isinstance(table, dict) and all(isinstance(o, _LegacyObservation) for o in table):
+            # keyed by observation (version 1)
+            P = dict()
+            for o, actions in table.items():
+                code, t = self.__key(o.K)
+                entry = P.setdefault((code, o.m), dict())
+                for cell, n in actions.items():
+                    cell = t.cell(*cell)
+                    entry[cell] = entry.get(cell, 0) + n
+            return P
+        if isinstance(table, dict) and all(isinstance(k, tuple) and isinstance(k[0], bytes) for k in table):
+            # keyed by code, before tables were versioned
+            return table
+        raise ValueError("obj/{}.pkl: unknown table format, train the player again (see train_Qplayer)".format(name))
 
     def update(self, state, cell):
-        if self.sym:
-            self.__sym_update(state,cell)
-        else:
-            self.__mono_update(state, cell)
+        code, t = self.__key(state.board.knowledge)
+        actions = self.P.setdefault((code, state.board.m), dict())
+        cell = t.cell(*cell)
+        actions[cell] = actions.get(cell, 0) + 1
 
 
     def train(self, board):
@@ -115,7 +218,7 @@ class QPlayer(AbstractPlayer):
         state = State(board)
         # first move on a corner
         corners = [(0, 0), (0, board.w-1), (board.h-1, 0), (board.h-1, board.w-1)]
-        r,c = random.choice(corners)
+        r,c = self.rng.choice(corners)
         val = state.probe(r,c, log=False)
         
         #board.draw(board.knowledge)
@@ -134,44 +237,41 @@ class QPlayer(AbstractPlayer):
                 last = True
                 continue
             # probe random cell in valid fringe
-            r,c = random.choice(valid) if len(valid) > 0 else random.choice(tuple(state.uncovs))
+            r,c = self.rng.choice(valid) if len(valid) > 0 else self.rng.choice(tuple(state.uncovs))
             val = state.probe(r, c, log=False)
             #board.draw(board.knowledge)
 
-        save_obj(self.P, "P{}".format(self.ind))
+        save_obj({'version': TABLE_VERSION, 'P': self.P}, "P{}".format(self.ind))
 
     def best_action(self, a_v_map):
-        random.shuffle(a_v_map)
-        return max(a_v_map)
+        """
+        Args:
+            a_v_map (dict): cell -> number of times it was a safe move of the position
+
+        Return:
+            (int, int): the most frequent cell, ties broken at random
+        """
+        best = max(a_v_map.values())
+        return self.rng.choice([a for a, v in a_v_map.items() if v == best])
     
     def reset(self):
-        pass
+        # each game opens on (0, 0), not only the first one of the player
+        self.first = True
 
     def next_action(self, state): 
         if self.first:
             self.first = False
             return (0,0)
-        if not self.sym:
-            s = self.P.get(state, None )
-            if s:
-                return self.best_action(s)
-            else:
-                return random.choice(tuple(state.fringe.union(state.uncovs)))
-        else:
-            for k,m in zip(symmetries(state.board.knowledge), symmetries(state.board.minefield)):
-                b = Board(len(k), len(k[0]), state.board.m)
-                b.minefield = m[0]
-                b.knowledge = k[0]
-                s = State(b)
-                action_pool =  self.P.get(s, None)
-                if action_pool:
-                    return self.best_action(action_pool)
-        
-            return random.choice(tuple(state.fringe.union(state.uncovs)))
+        code, t = self.__key(state.board.knowledge)
+        action_pool = self.P.get((code, state.board.m), None)
+        if action_pool:
+            return t.inverse_cell(*self.best_action(action_pool))
+        # position never seen in training
+        return self.rng.choice(tuple(state.fringe.union(state.uncovs)))
 
 
 def train_Qplayer(rounds, qplayer, h, w, m):
     assert isinstance(qplayer, QPlayer)
     for r in range(rounds):
         #print(r)
-        qplayer.train(Board(h,w,m))
+        qplayer.train(Board(h,w,m, qplayer.rng))
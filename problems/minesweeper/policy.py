@@ -0,0 +1,105 @@
+"""
+Rollout policies of Minesweeper, by name. A policy scores the covered cells of a batch 
+of boards from what the player sees (revealed cells and their hints) and the cell of 
+best score is probed, so that the same code drives the playouts of a single state and
+those of a batch (see batch.rollouts).
+"""
+from abc import ABCMeta, abstractmethod
+import numpy as np
+from .globals import CODES, UNCOV
+from .topology import topology
+
+class Policy(metaclass=ABCMeta):
+    """
+    Rollout policy, choosing the next cell to probe on each board of a batch.
+    """
+    @abstractmethod
+    def keys(self, hints, revealed, m, t, rng):
+        """
+        Args:
+            hints (np.ndarray): (boards x cells) hints of the revealed cells, 0 elsewhere
+            revealed (np.ndarray): (boards x cells) revealed cells
+            m (int): number of mines
+            t (Topology): topology of the boards
+            rng (np.random.Generator): random generator
+
+        Return:
+            np.ndarray: (boards x cells) score of each covered cell, ties broken at random
+        """
+        pass
+
+    def choose(self, hints, revealed, m, t, rng):
+        """
+        Return:
+            np.ndarray: flat index of the cell to probe on each board (see keys)
+        """
+        keys = self.keys(hints, revealed, m, t, rng)
+        keys[revealed] = -np.inf
+        return keys.argmax(axis=1)
+
+    def cell(self, o, rng):
+        """
+        Args:
+            o (Observation): what the player sees of the board
+            rng (np.random.Generator): random generator
+
+        Return:
+            (int, int): cell to probe next
+        """
+        code = np.frombuffer(o.code, dtype=np.uint8)[None, :]
+        revealed = code != CODES[UNCOV]
+        # codes of hints are the hints themselves, NOTHING is 0
+        hints = np.where(revealed & (code < 10), code, 0)
+        i = int(self.choose(hints, revealed, o.m, topology(o.h, o.w), rng)[0])
+        return (i // o.w, i % o.w)
+
+class Uniform(Policy):
+    """
+    Covered cells drawn uniformly at random.
+    """
+    def keys(self, hints, revealed, m, t, rng):
+        return rng.random(revealed.shape)
+
+class FrontierFirst(Policy):
+    """
+    Covered cells next to a revealed cell first, uniformly at random, then the others.
+    """
+    def keys(self, hints, revealed, m, t, rng):
+        near = revealed.astype(np.float32) @ t.adjacency > 0
+        return rng.random(revealed.shape) + near
+
+class LeastMineProbability(Policy):
+    """
+    Covered cell of lowest mine probability, estimated from local hint counts: a revealed
+    hint v with u covered neighbours gives each of them a probability v / u, and a cell 
+    takes the highest of the estimates of its neighbours. Cells next to no hint take the 
+    density of mines among covered cells.
+    """
+    def keys(self, hints, revealed, m, t, rng):
+        N = revealed.shape[0]
+        covered = ~revealed
+        u = covered.astype(np.float32) @ t.adjacency
+        local = np.zeros((N, t.n + 1), dtype=np.float32)
+        np.divide(hints, u, out=local[:, :t.n], where=(hints > 0) & (u > 0))
+        p = local[:, t.padded].max(axis=2)
+        density = m / np.maximum(covered.sum(axis=1), 1)
+        p = np.where(p > 0, p, density[:, None])
+        # ties broken at random, without reordering different estimates
+        return rng.random(revealed.shape) * 1e-6 - p
+
+# policies by name, for params['rollout']
+POLICIES = {
+    'uniform': Uniform(),
+    'frontier': FrontierFirst(),
+    'safest': LeastMineProbability()
+}
+
+def policy(name):
+    """
+    Return:
+        Policy: the policy of the given name (see POLICIES)
+    """
+    try:
+        return POLICIES[name]
+    except KeyError:
+        raise ValueError("unknown rollout policy {}, expected one of {}".format(name, sorted(POLICIES)))
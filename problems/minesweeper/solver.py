@@ -0,0 +1,401 @@
+"""
+Exact reasoning over the mines of a Minesweeper observation.
+
+Each revealed hint is a constraint on its covered neighbours. Covered cells
+adjacent to a hint (the fringe) are split into independent components, cells
+sharing no constraint; the mine configurations of each component are enumerated
+once per constraint signature and cached, up to CACHED_SOLUTIONS configurations in
+all. Remaining covered cells are
+unconstrained: they share the mines left uniformly.
+"""
+import random
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from scipy.special import comb
+from .globals import UNCOV, MINE
+from .topology import topology
+from .bitboard import popcount, bits
+
+# components with more solutions are given up (see Solver.consistent)
+MAX_SOLUTIONS = 1 << 16
+# configurations kept by the cache of solutions, all components together
+CACHED_SOLUTIONS = 1 << 17
+
+def enumerate_solutions(n, constraints):
+    """
+    Enumerate the mine configurations of a component.
+
+    Args:
+        n (int): number of cells of the component, numbered from 0
+        constraints (tuple): (cells, count) pairs, count mines lying among cells
+
+    Return:
+        dict: number of mines -> tuple of configurations (sorted tuples of mined cells),
+        None if there are more than MAX_SOLUTIONS configurations
+    """
+    of_cell = [[] for _ in range(n)]
+    for j, (cells, count) in enumerate(constraints):
+        for i in cells:
+            of_cell[i].append(j)
+    # mines still to place and cells still free in each constraint
+    need = [count for cells, count in constraints]
+    free = [len(cells) for cells, count in constraints]
+    mines = []
+    found = dict()
+    total = 0
+
+    def backtrack(i):
+        nonlocal total
+        if i == n:
+            found.setdefault(len(mines), []).append(tuple(mines))
+            total += 1
+            return total <= MAX_SOLUTIONS
+        for v in (0, 1):
+            ok = True
+            for j in of_cell[i]:
+                need[j] -= v
+                free[j] -= 1
+                ok = ok and 0 <= need[j] <= free[j]
+            if ok:
+                if v:
+                    mines.append(i)
+                go_on = backtrack(i + 1)
+                if v:
+                    mines.pop()
+            for j in of_cell[i]:
+                need[j] += v
+                free[j] += 1
+            if ok and not go_on:
+                return False
+        return True
+
+    if not backtrack(0):
+        return None
+    return {k: tuple(sols) for k, sols in found.items()}
+
+class SolutionCache(object):
+    """
+    Solutions of the components by constraint signature. The cache holds at most 
+    capacity configurations, whatever the number of components, and evicts the 
+    least recently used components.
+
+    Attributes:
+        capacity (int): maximum number of configurations
+        size (int): number of configurations held
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    @staticmethod
+    def weight(sols):
+        """
+        Return:
+            int: number of configurations of the solutions, 1 for a component given up
+        """
+        return sum(len(s) for s in sols.values()) if sols is not None else 1
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def get(self, n, constraints):
+        """
+        Return:
+            dict: the solutions of the component (see enumerate_solutions), enumerated 
+            if they are not in the cache
+        """
+        key = (n, constraints)
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key]
+        sols = enumerate_solutions(n, constraints)
+        with self.lock:
+            if key not in self.items:
+                self.items[key] = sols
+                self.size += self.weight(sols)
+                # the last component is kept even if it is larger than the cache
+                while self.size > self.capacity and len(self.items) > 1:
+                    _, evicted = self.items.popitem(last=False)
+                    self.size -= self.weight(evicted)
+        return sols
+
+_solutions = SolutionCache(CACHED_SOLUTIONS)
+
+def solutions(n, constraints):
+    """
+    Cached enumerate_solutions (see SolutionCache).
+    """
+    return _solutions.get(n, constraints)
+
+@lru_cache(maxsize=4096)
+def mine_counts(n, constraints):
+    """
+    Args:
+        n (int): number of cells of the component, numbered from 0
+        constraints (tuple): (cells, count) pairs, count mines lying among cells
+
+    Return:
+        dict: number of mines -> number of configurations in which each cell is a mine, 
+        None if there are too many configurations (see solutions)
+    """
+    sols = solutions(n, constraints)
+    if sols is None:
+        return None
+    counts = dict()
+    for k, configurations in sols.items():
+        c = [0] * n
+        for configuration in configurations:
+            for i in configuration:
+                c[i] += 1
+        counts[k] = c
+    return counts
+
+def convolve(a, b):
+    """
+    Return:
+        dict: number of mines -> number of configurations of two independent sets
+        of cells, given those of each set
+    """
+    c = dict()
+    for t, n in a.items():
+        for k, m in b.items():
+            c[t + k] = c.get(t + k, 0) + n * m
+    return c
+
+def weighted_choice(weights, rng):
+    """
+    Args:
+        weights (dict): item -> integer weight, with a positive sum
+
+    Return:
+        an item drawn proportionally to its weight, with exact integer arithmetic
+    """
+    x = rng.randrange(sum(weights.values()))
+    for item, w in weights.items():
+        x -= w
+        if x < 0:
+            return item
+
+class Component(object):
+    """
+    Fringe cells linked by constraints.
+
+    Attributes:
+        cells (tuple): flat indices of the cells, in the local order of the solutions
+        solutions (dict): number of mines -> configurations, as tuples of local indices
+        counts (dict): number of mines -> number of configurations
+        signature (tuple): constraints over local indices, key of the caches
+    """
+    def __init__(self, cells, constraints):
+        self.cells = cells
+        local = {cell: i for i, cell in enumerate(cells)}
+        self.signature = tuple(sorted((tuple(sorted(local[c] for c in nb)), count) for nb, count in constraints))
+        self.solutions = solutions(len(cells), self.signature)
+        self.counts = {k: len(s) for k, s in self.solutions.items()} if self.solutions is not None else None
+
+    def mask(self, solution):
+        """
+        Return:
+            int: mask of the mined cells of a configuration
+        """
+        m = 0
+        for i in solution:
+            m |= 1 << self.cells[i]
+        return m
+
+class Solver(object):
+    """
+    Posterior over the mines of a board given what has been revealed.
+
+    Attributes:
+        topology (Topology): topology of the board
+        mines (int): total number of mines
+        known (int): mask of the revealed mines
+        components (list): independent components of the fringe
+        unconstrained (tuple): flat indices of the covered cells outside the fringe
+        totals (dict): mines in the fringe -> number of fringe configurations
+        (None when a component is too large)
+    """
+    def __init__(self, knowledge, mines):
+        h, w = len(knowledge), len(knowledge[0])
+        self.topology = t = topology(h, w)
+        self.mines = mines
+        self.known = 0
+        covered = set()
+        constraints = []
+        for i, (r, c) in enumerate(t.cells):
+            v = knowledge[r][c]
+            if v == UNCOV:
+                covered.add(i)
+            elif v == MINE:
+                self.known |= 1 << i
+        for i, (r, c) in enumerate(t.cells):
+            v = knowledge[r][c]
+            if isinstance(v, int):
+                nb = tuple(j for j in t.neighbours[i] if j in covered)
+                count = v - sum(1 for j in t.neighbours[i] if (self.known >> j) & 1)
+                if nb:
+                    constraints.append((nb, count))
+
+        # union-find of the fringe cells sharing a constraint
+        parent = dict()
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        for nb, count in constraints:
+            for j in nb:
+                parent.setdefault(j, j)
+            root = find(nb[0])
+            for j in nb[1:]:
+                parent[find(j)] = root
+        groups = dict()
+        for nb, count in constraints:
+            groups.setdefault(find(nb[0]), []).append((nb, count))
+
+        self.components = [Component(self.__order(group), group) for group in groups.values()]
+        self.unconstrained = tuple(sorted(covered - set(parent)))
+        self.totals = self.__combine()
+
+    @staticmethod
+    def __order(constraints):
+        """
+        Cells of a component in breadth-first order over constraints, so that
+        constraints are closed early during enumeration
+        """
+        of_cell = dict()
+        for nb, count in constraints:
+            for j in nb:
+                of_cell.setdefault(j, []).append(nb)
+        start = min(of_cell)
+        order = [start]
+        seen = {start}
+        for cell in order:
+            for nb in of_cell[cell]:
+                for j in nb:
+                    if j not in seen:
+                        seen.add(j)
+                        order.append(j)
+        return tuple(order)
+
+    def __combine(self):
+        # prefix[i][t]: configurations of the i first components with t mines
+        prefix = [{0: 1}]
+        for comp in self.components:
+            if comp.counts is None:
+                return None
+            prefix.append(convolve(prefix[-1], comp.counts))
+        self.prefix = prefix
+        return prefix[-1]
+
+    def consistent(self):
+        """
+        Return:
+            bool: whether the sampler can be used, ie the observation admits a board
+            and no component was given up
+        """
+        if self.totals is None:
+            return False
+        left = self.mines - popcount(self.known)
+        return any(0 <= left - t <= len(self.unconstrained) for t in self.totals)
+
+    def sample(self, rng=random):
+        """
+        Draw a board uniformly among those consistent with the observation.
+
+        Return:
+            int: mask of the mines of the board, None if there is none (see consistent)
+        """
+        if not self.consistent():
+            return None
+        left = self.mines - popcount(self.known)
+        U = len(self.unconstrained)
+        weights = {t: n * comb(U, left - t, exact=True) for t, n in self.totals.items() if 0 <= left - t <= U}
+        fringe = weighted_choice(weights, rng)
+        mines = self.known
+        t = fringe
+        for i in range(len(self.components) - 1, -1, -1):
+            comp = self.components[i]
+            before = self.prefix[i]
+            k = weighted_choice({k: c * before[t - k] for k, c in comp.counts.items() if t - k in before}, rng)
+            sols = comp.solutions[k]
+            mines |= comp.mask(sols[rng.randrange(len(sols))])
+            t -= k
+        for j in rng.sample(self.unconstrained, left - fringe):
+            mines |= 1 << j
+        return mines
+
+    def probabilities(self):
+        """
+        Exact probability that each cell is a mine, all the boards consistent with the
+        observation being equally likely. The configurations of each component are 
+        weighted by the number of ways the other components and the unconstrained cells
+        can hold the remaining mines.
+
+        Return:
+            list: (h x w) matrix of probabilities, 0 for revealed cells and 1 for revealed 
+            mines, None if the observation cannot be solved (see consistent)
+        """
+        if not self.consistent():
+            return None
+        t = self.topology
+        left = self.mines - popcount(self.known)
+        U = len(self.unconstrained)
+        # ways to put the mines left outside of the fringe, by number of mines in the fringe
+        outside = {T: comb(U, left - T, exact=True) for T in range(left + 1) if left - T <= U}
+        total = sum(n * outside.get(T, 0) for T, n in self.totals.items())
+
+        P = [[0.0] * t.w for _ in range(t.h)]
+        for i in bits(self.known):
+            r, c = t.cells[i]
+            P[r][c] = 1.0
+
+        # configurations of all the components but one, from prefix and suffix products
+        suffix = [{0: 1}]
+        for comp in reversed(self.components):
+            suffix.append(convolve(suffix[-1], comp.counts))
+        suffix.reverse()
+        for i, comp in enumerate(self.components):
+            others = convolve(self.prefix[i], suffix[i + 1])
+            weights = [0] * len(comp.cells)
+            for k, counts in mine_counts(len(comp.cells), comp.signature).items():
+                w = sum(n * outside.get(T + k, 0) for T, n in others.items())
+                if w:
+                    for j, c in enumerate(counts):
+                        weights[j] += c * w
+            for j, cell in enumerate(comp.cells):
+                r, c = t.cells[cell]
+                P[r][c] = weights[j] / total
+
+        if U > 0:
+            expected = sum(n * outside.get(T, 0) * (left - T) for T, n in self.totals.items())
+            p = expected / (total * U)
+            for cell in self.unconstrained:
+                r, c = t.cells[cell]
+                P[r][c] = p
+        return P
+
+@lru_cache(maxsize=1024)
+def probabilities(knowledge, mines):
+    """
+    Cached Solver.probabilities of an observation.
+
+    Args:
+        knowledge (tuple): knowledge matrix, as a tuple of rows
+        mines (int): number of mines
+
+    Return:
+        tuple: probabilities as a tuple of rows, None if the observation cannot be solved
+    """
+    P = Solver(knowledge, mines).probabilities()
+    return tuple(tuple(row) for row in P) if P is not None else None
@@ -0,0 +1,100 @@
+"""
+Rotations and mirrors of boards, as precomputed permutations of the flat cell
+indices of each board shape.
+"""
+from functools import lru_cache
+from operator import itemgetter
+import numpy as np
+from .globals import CODES
+
+class Transform(object):
+    """
+    Rotation by rotations * 90 degrees (as np.rot90), then left-right mirror if flip.
+
+    Attributes:
+        shape (tuple): (height, width) of the transformed board
+        perm (tuple): perm[j] is the flat index of the cell moved to the flat index j
+        position (tuple): position[i] is the flat index the cell i is moved to
+    """
+    def __init__(self, height, width, rotations, flip):
+        self.rotations = rotations
+        self.flip = flip
+        idx = np.rot90(np.arange(height * width).reshape(height, width), k=rotations)
+        if flip:
+            idx = np.fliplr(idx)
+        self.w = width
+        self.shape = idx.shape
+        self.perm = tuple(int(i) for i in idx.ravel())
+        position = [0] * len(self.perm)
+        for j, i in enumerate(self.perm):
+            position[i] = j
+        self.position = tuple(position)
+        getter = itemgetter(*self.perm)
+        self.__getter = getter if len(self.perm) > 1 else (lambda code: (getter(code),))
+
+    def cell(self, r, c):
+        """
+        Return:
+            (int, int): coordinates of the cell (r, c) once transformed
+        """
+        return divmod(self.position[r * self.w + c], self.shape[1])
+
+    def inverse_cell(self, r, c):
+        """
+        Return:
+            (int, int): coordinates of the cell moved to (r, c) by the transform
+        """
+        return divmod(self.perm[r * self.shape[1] + c], self.w)
+
+    def apply(self, code):
+        """
+        Args:
+            code (bytes): one byte per cell (see encode)
+
+        Return:
+            bytes: code of the transformed board
+        """
+        return bytes(self.__getter(code))
+
+@lru_cache(maxsize=None)
+def transform(height, width, rotations=0, flip=False):
+    return Transform(height, width, rotations % 4, flip)
+
+@lru_cache(maxsize=None)
+def transforms(height, width):
+    """
+    Return:
+        tuple: the transforms that keep the shape of the board, 8 for square boards 
+        and 4 otherwise, identity first
+    """
+    ts = [transform(height, width, k, f) for k in range(4) for f in (False, True)]
+    return tuple(t for t in ts if t.shape == (height, width))
+
+def encode(matrix):
+    """
+    Return:
+        bytes: one byte per cell of a knowledge or minefield matrix, row by row
+    """
+    return bytes(v if isinstance(v, int) else CODES[v] for row in matrix for v in row)
+
+def canonical(matrix):
+    """
+    Canonical form of a board: the smallest code among those of its symmetries, 
+    so that symmetric boards share the same form.
+
+    Return:
+        (bytes, Transform): canonical code and transform that maps the board to it
+    """
+    return canonical_code(encode(matrix), len(matrix), len(matrix[0]))
+
+def canonical_code(code, height, width):
+    """
+    Same as canonical, for a board already encoded
+    """
+    ts = transforms(height, width)
+    best, best_t = code, ts[0]
+    for t in ts[1:]:
+        c = t.apply(code)
+        if c < best:
+            best, best_t = c, t
+    return best, best_t
@@ -0,0 +1,85 @@
+"""
+Neighbourhood structure of a board size, computed once and shared by all the
+boards, states and batches of that size.
+"""
+from functools import lru_cache
+import numpy as np
+
+# (dr, dc) of the neighbours of a cell: n, ne, e, se, s, sw, w, nw
+OFFSETS = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+
+class Topology(object):
+    """
+    Cells of a (height x width) board and their neighbours.
+    Cell (r, c) has the flat index r * w + c, which is also its bit in bitmasks.
+
+    Attributes:
+        n (int): number of cells
+        cells (tuple): (r, c) coordinates of each flat index
+        neighbours (tuple): for each flat index, flat indices of its neighbours
+        around (tuple): around[r][c] holds the (r, c) coordinates of the neighbours of (r, c)
+        full (int): mask of all the cells of the board
+        not_first_col (int): mask of the cells that are not on the first column
+        not_last_col (int): mask of the cells that are not on the last column
+        neighbour_masks (tuple): for each flat index, mask of its neighbours
+        padded (np.ndarray): (cells x 8) flat indices of the neighbours of each cell, 
+        completed with n
+    """
+    def __init__(self, height, width):
+        self.h = height
+        self.w = width
+        self.n = height * width
+        self.cells = tuple((i // width, i % width) for i in range(self.n))
+        self.neighbours = tuple(
+            tuple((r + dr) * width + c + dc for dr, dc in OFFSETS
+                if 0 <= r + dr < height and 0 <= c + dc < width)
+            for r, c in self.cells)
+        self.around = tuple(
+            tuple(tuple(self.cells[j] for j in self.neighbours[r * width + c]) for c in range(width))
+            for r in range(height))
+
+        self.full = (1 << self.n) - 1
+        first_col = 0
+        for r in range(height):
+            first_col |= 1 << (r * width)
+        last_col = first_col << (width - 1)
+        self.not_first_col = self.full & ~first_col
+        self.not_last_col = self.full & ~last_col
+        self.neighbour_masks = tuple(sum(1 << j for j in nb) for nb in self.neighbours)
+        self.padded = np.array([nb + (self.n,) * (len(OFFSETS) - len(nb)) for nb in self.neighbours], 
+            dtype=np.intp).reshape(self.n, len(OFFSETS))
+        self.padded.setflags(write=False)
+        self.__adjacency = None
+
+    def index(self, r, c):
+        return r * self.w + c
+
+    def dilate(self, x):
+        """
+        Return:
+            int: the mask x extended to the neighbours of its cells
+        """
+        x |= ((x << 1) & self.not_first_col) | ((x >> 1) & self.not_last_col)
+        x |= (x << self.w) | (x >> self.w)
+        return x & self.full
+
+    @property
+    def adjacency(self):
+        """
+        np.ndarray: (cells x cells) float32 matrix, A[i, j] = 1 if i and j are neighbours
+        """
+        if self.__adjacency is None:
+            A = np.zeros((self.n, self.n), dtype=np.float32)
+            for i, nb in enumerate(self.neighbours):
+                A[i, list(nb)] = 1
+            A.setflags(write=False)
+            self.__adjacency = A
+        return self.__adjacency
+
+@lru_cache(maxsize=None)
+def topology(height, width):
+    """
+    Return:
+        Topology: the shared topology of (height x width) boards
+    """
+    return Topology(height, width)
@@ -2,12 +2,18 @@ import unittest
 import math
 import time
 from timeit import Timer
-from mcts.tree import Node, create_node
+from mcts.tree import Node, Belief, create_node
+from mcts.transposition import TranspositionTable
+from mcts.selection import SELECTIONS, LOG_TABLE, Selection, log, selection
+from mcts.stats import install, uninstall
+import random
 from mdp.history import History
 from mdp.pomdp import POMDPAction, POMDPObservation, POMDPState, DecisionProcess
 from problems.tiger.model import State, Action, Observation, Tiger, LEFT, RIGHT
 from mcts.pomcp import (UCB1_action_selection, discount_calc, end_rollout, rollout, 
-    params, simulate, search)
+    params, simulate, search, POMCP)
+import threading
+import json
 
 class TestTree(unittest.TestCase):
     def setUp(self):
@@ -51,7 +57,88 @@ class TestTree(unittest.TestCase):
         h2.add(a, o)
         self.assertFalse(root.is_intree(h2))
 
+    def test_children_statistics(self):
+        root = create_node(self.h, self.a, self.o)
+        root.create_children()
+        listen = Action(listen=True)
+        child = root.children[listen]
+        self.assertIs(root, child.parent)
+        self.assertEqual(root.h, child.h)
+        child.N += 3
+        child.V = 2.5
+        i = root.children.actions.index(listen)
+        self.assertEqual((3, 2.5), (root.children.N[i], root.children.V[i]))
+        # a replaced child takes its statistics back
+        new = create_node(child.h.clone(), listen, self.o, parent=root)
+        root.children[listen] = new
+        self.assertEqual((3, 2.5), (child.N, child.V))
+        self.assertIsNone(child.parent)
+        self.assertEqual((new.N, new.V), (root.children.N[i], root.children.V[i]))
+
+    def test_index_discards_children(self):
+        root = create_node(self.h, self.a, self.o)
+        root.inTree = True
+        root.create_children()
+        child = root.children[Action(listen=True)]
+        obs, r = child.a.do_on(self.start.clone())
+        child.h.add(child.a, obs)
+        child.inTree = True
+        self.assertIs(root.find(child.h), child)
+        # regenerated children are not in the tree anymore
+        root.create_children()
+        self.assertIsNone(root.find(child.h))
+        self.assertEqual(1, len(root.index))
+
     
+    def test_belief(self):
+        B = Belief(range(10), capacity=4)
+        self.assertEqual(4, len(B))
+        self.assertEqual(10, B.seen)
+        rng = random.Random(0)
+        for i in range(100):
+            B.append(i, rng=rng)
+        self.assertEqual(4, len(B))
+        self.assertIn(B.sample(rng), list(B))
+        # weighted sampling
+        W = Belief()
+        W.append('a', weight=0.0)
+        W.append('b', weight=1.0)
+        self.assertEqual({'b'}, {W.sample(rng) for i in range(20)})
+
+    def test_transposition(self):
+        class Keyed(Observation):
+            # equivalent histories end with the same observation
+            def transposition_key(self, h, a=None):
+                return self.hear if a is None else (self.hear, a)
+        table = TranspositionTable(3)
+        listen = Action(listen=True)
+        h1 = History()
+        h1.add(self.a, Keyed())
+        h2 = h1.clone()
+        h2.add(listen, Keyed())
+        p1, p2 = create_node(History(), self.a, Keyed()), create_node(h1, listen, Keyed())
+        c1 = p1.children[listen] = create_node(p1.h.clone(), listen, Keyed(LEFT))
+        table.share(p1, c1)
+        c2 = p2.children[listen] = create_node(p2.h.clone(), listen, Keyed(LEFT))
+        table.share(p2, c2)
+        self.assertIsNotNone(c1.shared)
+        self.assertIs(c1.shared, c2.shared)
+        self.assertIs(c1.B, c2.B)
+        N1, N2 = c1.N, c2.N
+        TranspositionTable.update(c1, 10.0)
+        TranspositionTable.update(c2, 0.0)
+        self.assertEqual((N1 + 1, N2 + 1), (c1.N, c2.N))
+        self.assertEqual(c2.V, c1.shared.V)
+        # the node sees the variance of the returns of the entry, for its own visits
+        self.assertGreater(c1.shared.M2, 0)
+        self.assertAlmostEqual(c1.shared.variance(), c2.M2 / c2.N)
+        # least recently used items are evicted
+        self.assertEqual(2, len(table))
+        c3 = create_node(p1.h.clone(), Action(direction=LEFT), Keyed(RIGHT))
+        table.share(p1, c3)
+        self.assertEqual(3, len(table))
+        self.assertNotIn((Keyed().hear, listen), table.items)
+
     def test_pref_actions(self):
         self.h.add(self.a, self.o)
         a = Action(listen=True)
@@ -64,6 +151,54 @@ class TestTree(unittest.TestCase):
         self.assertEqual(12, node.V)
         self.assertEqual(5, node.N)
 
+class TestSelection(unittest.TestCase):
+    def setUp(self):
+        self.root = create_node(History(), POMDPAction(), Observation())
+        self.root.inTree = True
+        self.root.create_children()
+        self.params = dict(params, R_lo=0, R_hi=10)
+
+    def test_log(self):
+        for n in [1, 2, 7, 1000, LOG_TABLE - 1, LOG_TABLE, 10 ** 9]:
+            self.assertEqual(math.log(n), log(n))
+        self.assertRaises(TypeError, Selection)
+
+    def test_unvisited(self):
+        children = self.root.children
+        self.root.N = 3
+        for i, a in enumerate(children.actions):
+            self.assertEqual((i, math.inf), SELECTIONS['ucb1'].select(self.root, 2, self.params))
+            children[a].N = 1
+        self.assertIsNone(children.first_unvisited())
+        # a child visited again from scratch
+        children[children.actions[1]].N = 0
+        self.assertEqual(1, children.first_unvisited())
+
+    def test_scores(self):
+        children = self.root.children
+        self.root.N = 20
+        for i, a in enumerate(children.actions):
+            for R in range(i + 2):
+                children[a].update(float(R))
+        for name in ['ucb1', 'ucb1-tuned', 'puct']:
+            strategy = selection(name)
+            scores = strategy.scores(children, self.root.N, 2, self.params)
+            for i in range(len(children)):
+                self.assertAlmostEqual(scores[i], strategy.score(children, i, self.root.N, 2, self.params))
+            i, f = strategy.select(self.root, 2, self.params)
+            self.assertEqual(max(scores), scores[i])
+            self.assertAlmostEqual(f, scores[i])
+        # variance of the returns 0, 1 and 2
+        self.assertAlmostEqual(2 / 3, children.M2[1] / children.N[1])
+        self.assertRaises(ValueError, selection, 'ucb2')
+
+    def test_search(self):
+        for name in SELECTIONS:
+            ctx = POMCP(gamma=0.5, epsilon=0.1, timeout=5, max_depth=100, c=2, log=0, seed=0, selection=name)
+            a = ctx.search(self.root.h, Tiger(), 50)
+            self.assertIsInstance(a, Action)
+            self.assertEqual(50, ctx.root.N)
+
 class TestPOMCP(unittest.TestCase):
     def setUp(self):
         self.pomdp = Tiger()
@@ -153,6 +288,24 @@ class TestPOMCP(unittest.TestCase):
         self.assertEqual(len(root.children), 3)
         self.assertEqual(root.N, 1)
 
+    def test_simulate_belief(self):
+        params.update({
+            'start_time': time.time(),
+            'gamma': 0.5,
+            'epsilon': 0.1,
+            'max_depth': 100,
+            'timeout': 3,
+            'c': 2
+        })
+        for i in range(20):
+            simulate(self.start, self.root)
+        # the tiger never moves: every particle is the start state
+        self.assertEqual(0, len(self.root.B))
+        for a, child in self.root.children.items():
+            self.assertGreater(len(child.B), 0)
+            for s in child.B:
+                self.assertEqual(self.start, s)
+
     def test_simulate_iteration_fulltree(self):
         self.root.N = 2
         self.root.V = 4/3
@@ -231,3 +384,141 @@ class TestPOMCP(unittest.TestCase):
         a = search(self.root.h,self.pomdp, 100)
         self.assertTrue(isinstance(a, POMDPAction))
 
+    def test_parallel_search(self):
+        params.update({
+            'gamma': 0.5,
+            'epsilon': 0.26 ,    # depth 2 
+            'timeout': 5,
+            'max_depth': 100,
+            'c': 2
+        })
+        a = search(self.root.h, self.pomdp, 20, workers=2)
+        self.assertTrue(isinstance(a, POMDPAction))
+        # merged statistics of both trees
+        self.assertEqual(3, len(params['root'].children))
+        self.assertGreaterEqual(sum(c.N for c in params['root'].children.values()), 40)
+
+    def test_search_reuse(self):
+        ctx = POMCP(gamma=0.5, epsilon=0.1, timeout=5, max_depth=100, c=2, log=0, seed=0, reuse=True)
+        ctx.search(self.root.h, self.pomdp, 100)
+        # next move: the tree contains the real action-observation
+        child = max(ctx.root.children.values(), key=lambda c: c.N)
+        children = dict(child.children)
+        N = child.N
+        self.assertTrue(child.inTree)
+        ctx.search(child.h.clone(), self.pomdp, 10, clean=False)
+        self.assertIs(child, ctx.root)
+        self.assertEqual(N + 10, child.N)
+        for a, c in children.items():
+            self.assertIs(c, child.children[a])
+
+    def test_search_transpositions(self):
+        ctx = POMCP(gamma=0.5, epsilon=0.1, timeout=5, max_depth=100, c=2, log=0, seed=0, transposition=10)
+        table = ctx.transpositions()
+        table.items['previous game'] = Belief()
+        ctx.search(self.root.h, self.pomdp, 10, clean=False)
+        self.assertIn('previous game', table.items)
+        # a new tree does not share anything with the previous one
+        ctx.search(self.root.h, self.pomdp, 10, clean=True)
+        self.assertIs(table, ctx.table)
+        self.assertEqual(0, len(table))
+
+    def test_search_empty_belief(self):
+        # clean search from a history that was never simulated
+        class Filled(Tiger):
+            def empty_belief(self, B, h):
+                B.append(State(LEFT))
+                B.append(State(RIGHT))
+        ctx = POMCP(gamma=0.5, epsilon=0.1, timeout=5, max_depth=100, c=2, log=0, seed=0)
+        h = self.listen_child.h.clone()
+        a = ctx.search(h, Filled(), 20, clean=True)
+        self.assertIsInstance(a, Action)
+        self.assertEqual(h, ctx.root.h)
+        self.assertEqual(20, ctx.root.N)
+
+    def test_search_instrument(self):
+        class Timed(Tiger):
+            def instrumented_methods(self):
+                return [(State, 'clone', 'clone')]
+        ctx = POMCP(gamma=0.5, epsilon=0.1, timeout=5, max_depth=100, c=2, log=0, seed=0)
+        ctx.search(self.root.h, Timed(), 20)
+        self.assertIsNone(ctx.stats)
+        ctx.params['instrument'] = True
+        ctx.search(self.root.h, Timed(), 20)
+        stats = json.loads(ctx.stats.to_json())
+        self.assertEqual(20, stats['iterations'])
+        self.assertEqual(ctx.tree_size(), stats['tree_size'])
+        self.assertGreater(stats['rollouts'], 0)
+        self.assertGreater(stats['calls']['clone']['count'], 0)
+        self.assertAlmostEqual(stats['elapsed'], sum(stats['phases'].values()))
+        # the hook is removed at the end of the search
+        self.assertFalse(hasattr(State.clone, '__wrapped__'))
+        # calls out of the search, or from searches that are not instrumented, are not counted
+        count = ctx.stats.calls['clone'][0]
+        State(LEFT).clone()
+        POMCP(gamma=0.5, epsilon=0.1, timeout=5, max_depth=100, c=2, log=0, seed=0).search(self.root.h, Timed(), 20)
+        self.assertEqual(count, ctx.stats.calls['clone'][0])
+        # concurrent instrumented searches, the hook is installed once and removed by the last one
+        contexts = [POMCP(gamma=0.5, epsilon=0.1, timeout=5, max_depth=100, c=2, log=0, seed=i, instrument=True) 
+            for i in range(2)]
+        threads = [threading.Thread(target=c.search, args=(self.root.h.clone(), Timed(), 20)) for c in contexts]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for c in contexts:
+            self.assertGreater(c.stats.calls['clone'][0], 0)
+        self.assertFalse(hasattr(State.clone, '__wrapped__'))
+
+    def test_hooks(self):
+        class Listener(State):
+            pass
+        clone = State.clone
+        methods = [(State, 'clone', 'clone'), (Listener, 'clone', 'clone')]
+        install(methods, lambda: None)
+        install(methods[:1], lambda: None)
+        self.assertIs(clone, State.clone.__wrapped__)
+        self.assertIs(clone, Listener.clone.__wrapped__)
+        uninstall(methods)
+        # still used by a search, the inherited method is restored
+        self.assertIs(clone, State.clone.__wrapped__)
+        self.assertNotIn('clone', Listener.__dict__)
+        uninstall(methods[:1])
+        self.assertIs(clone, State.clone)
+
+    def test_search_deadline(self):
+        ctx = POMCP(gamma=0.5, epsilon=0.1, timeout=100, max_depth=100, c=2, log=0, seed=0)
+        start = time.monotonic_ns()
+        ctx.search(self.root.h, self.pomdp, 100000000, deadline_ns=start + 500000000)
+        self.assertAlmostEqual(0.5, (time.monotonic_ns() - start) / 1e9, delta=0.3)
+
+    def test_search_callback(self):
+        ctx = POMCP(gamma=0.5, epsilon=0.1, timeout=100, max_depth=100, c=2, log=0, seed=0, snapshot_every=100)
+        snapshots = []
+        def callback(snapshot):
+            snapshots.append(snapshot)
+            return snapshot.iterations >= 300
+        a = ctx.search(self.root.h, self.pomdp, 100000000, callback=callback)
+        self.assertEqual([100, 200, 300], [snap.iterations for snap in snapshots])
+        self.assertEqual(300, ctx.root.N)
+        self.assertEqual(3, len(snapshots[-1].visits))
+        self.assertEqual(a, ctx.best_action())
+
+    def test_contexts(self):
+        ctx = [POMCP(gamma=0.5, epsilon=0.26, timeout=5, max_depth=100, c=c, log=0, seed=c) for c in (1, 2)]
+        root = params['root']
+        actions = [None, None]
+        def proc(i):
+            actions[i] = ctx[i].search(self.root.h, self.pomdp, 50)
+        threads = [threading.Thread(target=proc, args=(i,)) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for i in range(2):
+            self.assertTrue(isinstance(actions[i], POMDPAction))
+            self.assertEqual(i + 1, ctx[i].params['c'])
+            self.assertEqual(50, ctx[i].root.N)
+        self.assertIsNot(ctx[0].root, ctx[1].root)
+        # the default context is left untouched
+        self.assertIs(root, params['root'])
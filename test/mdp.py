@@ -1,9 +1,28 @@
 import unittest
 from problems.minesweeper.board import Board
 from problems.minesweeper.globals import UNCOV, ONE
-from problems.minesweeper.model import State, Action, Observation
+from problems.minesweeper.model import State, BitState, Action, Observation
+from problems.minesweeper.bitboard import BitBoard
+from problems.minesweeper import batch
+from problems.minesweeper.topology import topology
+from problems.minesweeper.solver import Solver, SolutionCache
+from problems.minesweeper.logic import Deducer
+from problems.minesweeper.symmetry import canonical, transforms
+from problems.minesweeper.policy import POLICIES, Policy
+from problems.minesweeper.model import Minesweeper
+from problems.minesweeper.player import MCPlayer, QPlayer, train_Qplayer
+from problems.minesweeper.play import play_minesweeper
+from mcts.pomcp import POMCP
+from mcts import pomcp
+from problems.minesweeper.globals import MINE, NOTHING
+import random
+import pickle
+import os
+import tempfile
+import numpy as np
 from mdp.pomdp import POMDPAction, POMDPObservation, POMDPState
 from mdp.history import History
+from mdp import seeding
 
 class TestPOMDP(unittest.TestCase):
     def setUp(self):
@@ -26,6 +45,16 @@ class TestPOMDP(unittest.TestCase):
         self.assertEqual(1, r)
         self.assertTrue(o.is_terminal())
 
+    def test_params(self):
+        # the process only sets the parameters of the context it is given
+        default = dict(pomcp.params)
+        proc = Minesweeper(9, 9, 10)
+        self.assertEqual(default, pomcp.params)
+        ctx = POMCP()
+        proc.set_params(ctx.params)
+        self.assertEqual(16, ctx.params['K'])
+        self.assertEqual(default, pomcp.params)
+
     def test_available_actions(self):
         a = Action(1, 1)
         o,r = a.do_on(self.s)
@@ -36,6 +65,362 @@ class TestPOMDP(unittest.TestCase):
         self.assertIn(Action(1, 0), l)
         self.assertIn(Action(0, 1), l)
 
+class TestBitState(unittest.TestCase):
+    def setUp(self):
+        # mines on the diagonal of a 5x5 board
+        self.b = Board(5, 5, 2)
+        self.b.minefield[3][3] = '*'
+        self.b.minefield[4][4] = '*'
+        self.b._Board__hints()
+        self.b.firstmove = False
+        self.s = State(self.b)
+        self.bb = BitBoard(5, 5, 2)
+        self.bb.place_mines((1 << 18) | (1 << 24))
+        self.bs = BitState(self.bb)
+
+    def test_flood_fill(self):
+        for a in [Action(0, 0), Action(4, 3), Action(3, 3)]:
+            o, r = a.do_on(self.s)
+            bo, br = a.do_on(self.bs)
+            self.assertEqual(o, bo)
+            self.assertEqual(r, br)
+            self.assertEqual(self.s.fringe, self.bs.fringe)
+            self.assertEqual(self.s.uncovs, self.bs.uncovs)
+        self.assertTrue(bo.is_terminal())
+
+    def test_clone(self):
+        s = self.bs.clone()
+        Action(0, 0).do_on(s)
+        self.assertNotEqual(s, self.bs)
+        self.assertEqual(self.bs, self.bs.clone())
+        self.assertEqual(hash(self.bs), hash(self.bs.clone()))
+
+    def test_resample(self):
+        Action(0, 4).do_on(self.bs)
+        p = self.bs.resample()
+        self.assertEqual(self.bs.board.knowledge, p.board.knowledge)
+        self.assertEqual(2, bin(p.board.mines).count('1'))
+
+    def test_batch_rollouts(self):
+        Action(0, 0).do_on(self.s)
+        Action(0, 0).do_on(self.bs)
+        rng = np.random.default_rng(0)
+        R = batch.rollouts([self.s, self.bs], 1, 1.0, 0.0, 25, rng)
+        # 2 covered safe cells: (3, 4) and (4, 3)
+        for r in R:
+            self.assertIn(r, [0, 1, 2])
+        # terminal states
+        Action(3, 3).do_on(self.bs)
+        R = batch.rollouts([self.bs, self.bs.clone()], 2, 1.0, 0.0, 25, rng)
+        self.assertEqual([0, 0], list(R))
+
+class TestTopology(unittest.TestCase):
+    def test_neighbours(self):
+        t = topology(3, 4)
+        self.assertIs(t, topology(3, 4))
+        self.assertEqual(set(t.around[0][0]), {(0,1), (1,0), (1,1)})
+        self.assertEqual(len(t.around[1][1]), 8)
+        self.assertEqual(set(t.neighbours[t.index(2, 3)]), {t.index(1,2), t.index(1,3), t.index(2,2)})
+        for i in range(t.n):
+            self.assertEqual(t.dilate(1 << i) & ~(1 << i), t.neighbour_masks[i])
+        A = t.adjacency
+        self.assertTrue((A == A.T).all())
+        self.assertEqual(A.sum(), sum(len(nb) for nb in t.neighbours))
+
+class TestSolver(unittest.TestCase):
+    def test_sample_uniform(self):
+        # the mine is next to the hint, anywhere
+        solver = Solver([[ONE, UNCOV], [UNCOV, UNCOV]], 1)
+        rng = random.Random(0)
+        counts = dict()
+        for _ in range(3000):
+            m = solver.sample(rng)
+            counts[m] = counts.get(m, 0) + 1
+        self.assertEqual(set(counts), {1 << 1, 1 << 2, 1 << 3})
+        for n in counts.values():
+            self.assertAlmostEqual(n / 3000, 1 / 3, delta=0.05)
+
+    def test_sample_consistent(self):
+        s = State(Board(9, 9, 10, random.Random(1)))
+        for r, c in [(0,0), (8,8), (0,8), (8,0), (4,4)]:
+            if s.board.knowledge[r][c] == UNCOV and s.board.minefield[r][c] is not MINE:
+                Action(r, c).do_on(s)
+        # covered cells are left to sample
+        self.assertFalse(s.is_goal())
+        solver = Solver(s.board.knowledge, 10)
+        self.assertTrue(solver.consistent())
+        for _ in range(100):
+            m = solver.sample()
+            self.assertIsNotNone(m)
+            p = s.with_mines(m)
+            b = p.board
+            self.assertEqual(sum(row.count(MINE) for row in b.minefield), 10)
+            self.assertEqual(b.knowledge, s.board.knowledge)
+            for r in range(9):
+                for c in range(9):
+                    if b.knowledge[r][c] != UNCOV:
+                        self.assertEqual(b.minefield[r][c], b.knowledge[r][c])
+                    if b.minefield[r][c] is not MINE:
+                        n = sum(1 for R, C in b.neighbourhood(r, c) if b.minefield[R][C] is MINE)
+                        self.assertEqual(b.minefield[r][c], n if n > 0 else NOTHING)
+
+    def test_solution_cache(self):
+        # 1 cell among 4, then 2 among 4: 4 and 6 configurations
+        one, two = (((0, 1, 2, 3), 1),), (((0, 1, 2, 3), 2),)
+        cache = SolutionCache(8)
+        self.assertEqual(4, len(cache.get(4, one)[1]))
+        self.assertIs(cache.get(4, one), cache.get(4, one))
+        self.assertEqual((1, 4), (len(cache), cache.size))
+        # bounded by the number of configurations, not of components
+        self.assertEqual(6, len(cache.get(4, two)[2]))
+        self.assertEqual((1, 6), (len(cache), cache.size))
+        self.assertNotIn((4, one), cache.items)
+
+    def test_probabilities(self):
+        P = Observation([[ONE, UNCOV, UNCOV, UNCOV]], 2).mine_probabilities()
+        self.assertEqual(P, ((0.0, 1.0, 0.5, 0.5),))
+        # against the enumeration of all the boards
+        from itertools import combinations
+        random.seed(3)
+        for _ in range(5):
+            s = State(Board(4, 4, 4))
+            Action(0, 0).do_on(s)
+            k = s.board.knowledge
+            P = Solver(k, 4).probabilities()
+            counts = [0] * 16
+            boards = 0
+            for mines in combinations([i for i in range(16) if k[i // 4][i % 4] == UNCOV], 4):
+                near = lambda r, c: sum(1 for R, C in s.board.neighbourhood(r, c) if R * 4 + C in mines)
+                if all(near(r, c) == (k[r][c] if k[r][c] != NOTHING else 0) for r in range(4) for c in range(4) if k[r][c] != UNCOV):
+                    boards += 1
+                    for i in mines:
+                        counts[i] += 1
+            for i in range(16):
+                self.assertAlmostEqual(P[i // 4][i % 4], counts[i] / boards)
+
+    def test_inconsistent(self):
+        self.assertFalse(Solver([[ONE, UNCOV], [UNCOV, UNCOV]], 0).consistent())
+        self.assertIsNone(Solver([[ONE, UNCOV], [UNCOV, UNCOV]], 0).sample())
+
+class TestDeducer(unittest.TestCase):
+    def test_single_hint(self):
+        d = Deducer(2, 3)
+        d.update([[ONE, UNCOV, UNCOV], [NOTHING, NOTHING, ONE]])
+        # (0,0) sees only (0,1)
+        self.assertEqual(d.mines, {1})
+        self.assertEqual(d.safe, {2})
+        self.assertEqual(d.next_safe(), (0, 2))
+
+    def test_subset(self):
+        d = Deducer(2, 3)
+        # (1,0) has one mine in {(0,0), (0,1)}, (1,1) one in {(0,0), (0,1), (0,2)}
+        d.update([[UNCOV, UNCOV, UNCOV], [ONE, ONE, UNCOV]])
+        self.assertIn(2, d.safe)
+        self.assertNotIn(0, d.safe | d.mines)
+
+    def test_sound(self):
+        random.seed(2)
+        for _ in range(20):
+            s = State(Board(9, 9, 10))
+            d = Deducer(9, 9)
+            Action(4, 4).do_on(s)
+            while not s.is_goal():
+                d.update(s.board.knowledge)
+                for i in d.safe:
+                    self.assertIsNot(s.board.minefield[i // 9][i % 9], MINE)
+                for i in d.mines:
+                    self.assertIs(s.board.minefield[i // 9][i % 9], MINE)
+                cell = d.next_safe()
+                if cell is None:
+                    break
+                Action(*cell).do_on(s)
+
+class TestSymmetry(unittest.TestCase):
+    def test_canonical(self):
+        K = [[ONE, UNCOV, UNCOV], [NOTHING, ONE, UNCOV]]
+        self.assertEqual(4, len(transforms(2, 3)))
+        self.assertEqual(8, len(transforms(3, 3)))
+        code, t = canonical(K)
+        for s in transforms(2, 3):
+            k = [list(row) for row in np.array(K, dtype=object)[np.unravel_index(s.perm, (2, 3))].reshape(2, 3)]
+            self.assertEqual(code, canonical(k)[0])
+        for r in range(2):
+            for c in range(3):
+                self.assertEqual((r, c), t.inverse_cell(*t.cell(r, c)))
+
+    def test_transposition_key(self):
+        o = Observation([[ONE, UNCOV], [UNCOV, UNCOV]], 1)
+        mirror = Observation([[UNCOV, ONE], [UNCOV, UNCOV]], 1)
+        h = History()
+        self.assertEqual(o.transposition_key(h, Action(1, 1)), mirror.transposition_key(h, Action(1, 0)))
+        self.assertNotEqual(o.transposition_key(h, Action(1, 1)), mirror.transposition_key(h, Action(1, 1)))
+        # beliefs are not shared between orientations
+        self.assertNotEqual(o.transposition_key(h), mirror.transposition_key(h))
+
+class TestPolicy(unittest.TestCase):
+    def setUp(self):
+        # (0,0) sees one mine among its 3 neighbours, (2,2) is far from hints
+        self.o = Observation([[ONE, UNCOV, UNCOV], [UNCOV, UNCOV, UNCOV], [UNCOV, UNCOV, UNCOV]], 1)
+        self.h = History()
+        self.h.add(Action(0, 0), self.o)
+
+    def test_cell(self):
+        rng = np.random.default_rng(0)
+        for name, policy in POLICIES.items():
+            for _ in range(20):
+                r, c = policy.cell(self.o, rng)
+                self.assertNotEqual((0, 0), (r, c))
+        # 1/3 next to the hint, 1/8 elsewhere
+        self.assertNotIn(POLICIES['safest'].cell(self.o, rng), [(0, 1), (1, 0), (1, 1)])
+        self.assertIn(POLICIES['frontier'].cell(self.o, rng), [(0, 1), (1, 0), (1, 1)])
+        self.assertRaises(ValueError, Minesweeper(3, 3, 1).rollout_policy, 'greedy')
+        self.assertRaises(TypeError, Policy)
+
+    def test_rollouts(self):
+        random.seed(2)
+        rng = np.random.default_rng(0)
+        s = State(Board(5, 5, 3))
+        Action(0, 0).do_on(s)
+        bs = BitState(BitBoard(5, 5, 3))
+        Action(2, 2).do_on(bs)
+        for name, policy in POLICIES.items():
+            R = batch.rollouts([s, bs, s.clone()], 0, 1.0, 0.0, 25, rng, policy)
+            for r, state in zip(R, [s, bs, s]):
+                self.assertLessEqual(r, 25 - 3 - state.n_revealed())
+                self.assertGreaterEqual(r, 0)
+
+    def test_search(self):
+        random.seed(0)
+        proc = Minesweeper(4, 4, 2)
+        for name in POLICIES:
+            for b in (0, 4):
+                ctx = POMCP(log=0, timeout=10, seed=0, rollout=name, batch=b, prefs=False)
+                proc.set_params(ctx.params)
+                h = History()
+                h.add(POMDPAction(), Observation(Board(4, 4, 2).knowledge, 2))
+                self.assertIsInstance(ctx.search(h, proc, 100), Action)
+
+class TestObservation(unittest.TestCase):
+    def test_interned(self):
+        K = [[ONE, UNCOV], [NOTHING, MINE]]
+        o = Observation(K, 1)
+        self.assertIs(o, Observation([list(row) for row in K], 1))
+        self.assertIsNot(o, Observation(K, 2))
+        self.assertEqual(K, o.K)
+        self.assertTrue(o.is_terminal())
+        self.assertIs(o, pickle.loads(pickle.dumps(o)))
+
+    def test_bitstate(self):
+        random.seed(3)
+        s = BitState(BitBoard(4, 5, 3))
+        for a in [Action(0, 0), Action(3, 4), Action(2, 2)]:
+            o, r = a.do_on(s)
+            self.assertIs(o, Observation(s.board.knowledge, 3))
+        self.assertEqual(set(o.available_actions()),
+            {Action(r, c) for r in range(4) for c in range(5) if o.K[r][c] == UNCOV} if not o.is_terminal() else set())
+
+class TestMCPlayer(unittest.TestCase):
+    def test_board_sizes(self):
+        # the same player on boards of different sizes
+        player = MCPlayer(30, 10, pref=False, deduce=True, seed=0)
+        for h, w, m in [(5, 5, 3), (2, 5, 3), (5, 5, 3)]:
+            b = Board(h, w, m, seeding.python_rng(h))
+            state = State(b)
+            o = Observation.of(state)
+            while not o.is_terminal():
+                cell = player.next_action(state)
+                if player.deducer is not None:
+                    self.assertEqual(h * w, player.deducer.topology.n)
+                if player.last_action == Action(*cell) and player.stale:
+                    # deduced cells are certainly safe
+                    self.assertIsNot(MINE, b.minefield[cell[0]][cell[1]])
+                o, r = Action(*cell).do_on(state)
+            player.reset()
+
+class TestQPlayer(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.TemporaryDirectory()
+        os.chdir(self.dir.name)
+        os.mkdir('obj')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_table(self):
+        p = QPlayer('t', seed=0)
+        train_Qplayer(3, p, 4, 4, 2)
+        self.assertTrue(p.P)
+        self.assertEqual(p.P, QPlayer('t').P)
+
+    def test_legacy_table(self):
+        # table keyed by observations, as pickled by the first version
+        class Pickler(pickle.Pickler):
+            def reducer_override(self, obj):
+                if isinstance(obj, Observation):
+                    return Observation, (), {'K': obj.K, 'm': obj.m}
+                return NotImplemented
+        K = [[ONE, UNCOV], [UNCOV, UNCOV]]
+        table = {Observation(K, 1): {(1, 1): 2}, Observation([list(reversed(row)) for row in K], 1): {(1, 0): 1}}
+        with open('obj/Pold.pkl', 'wb') as f:
+            Pickler(f).dump(table)
+        p = QPlayer('old')
+        self.assertEqual(1, len(p.P))
+        # both symmetric observations merged, on the same cell
+        self.assertEqual([3], [n for actions in p.P.values() for n in actions.values()])
+        p.first = False
+        s = State(Board(2, 2, 1))
+        s.board.knowledge = K
+        self.assertEqual((1, 1), p.next_action(s))
+        with open('obj/Pbad.pkl', 'wb') as f:
+            pickle.dump([1], f)
+        self.assertRaises(ValueError, QPlayer, 'bad')
+
+    def test_next_action(self):
+        p = QPlayer('t', seed=0)
+        s = State(Board(2, 2, 1))
+        # every game opens on (0, 0)
+        for _ in range(2):
+            self.assertEqual((0, 0), p.next_action(s))
+            p.reset()
+        # ties between the most frequent cells are broken at random
+        self.assertEqual({(0, 1), (1, 0)}, {p.best_action({(0, 1): 2, (1, 0): 2, (1, 1): 1}) for _ in range(50)})
+
+class TestSeeding(unittest.TestCase):
+    def test_boards(self):
+        for board in (Board, BitBoard):
+            states = []
+            for _ in range(2):
+                b = board(5, 5, 3, seeding.python_rng(1))
+                s = State(b) if board is Board else BitState(b)
+                Action(2, 2).do_on(s)
+                states.append(s)
+            self.assertEqual(states[0], states[1])
+        self.assertEqual(random.Random(4).random(), seeding.python_rng(4).random())
+        a, b = seeding.spawn(0, 2)
+        self.assertNotEqual(seeding.python_rng(a).random(), seeding.python_rng(b).random())
+
+    def test_search(self):
+        trees = []
+        for _ in range(2):
+            ctx = POMCP(log=0, timeout=10, seed=0, prefs=False)
+            proc = Minesweeper(4, 4, 2, seed=1)
+            proc.set_params(ctx.params)
+            h = History()
+            h.add(POMDPAction(), Observation(Board(4, 4, 2).knowledge, 2))
+            a = ctx.search(h, proc, 100)
+            trees.append((a, {b: (c.N, c.V) for b, c in ctx.root.children.items()}))
+        self.assertEqual(trees[0], trees[1])
+
+    def test_games(self):
+        games = []
+        for _ in range(2):
+            player = MCPlayer(50, 10, pref=False, seed=3)
+            games.append([play_minesweeper(player, Board(5, 5, 3, seeding.python_rng(i)))
+                for i in range(3)])
+        self.assertEqual(games[0], games[1])
+
 class TestHistory(unittest.TestCase):
     def setUp(self):
         self.b = Board(4, 5, 3)
@@ -61,5 +446,24 @@ class TestHistory(unittest.TestCase):
         self.h.add(a, o)
         h  = self.h.clone()
         self.assertEqual(h, self.h)
+        self.assertEqual(hash(h), hash(self.h))
+        # the clone is not affected by later updates
+        a2 = Action(3, 4)
+        o2, r2 = a2.do_on(self.s)
+        h.add(a2, o2)
+        self.assertEqual(1, len(self.h))
+        self.assertNotEqual(h, self.h)
+        self.assertEqual((a2, a), h.actions)
+        self.assertEqual((o2, o), h.observs)
+
+    def test_eq_unshared(self):
+        a = Action(1, 0)
+        o,r = a.do_on(self.s)
+        h = History()
+        self.h.add(a, o)
+        h.add(a, o)
+        self.assertEqual(h, self.h)
+        self.assertEqual(hash(h), hash(self.h))
+        self.assertEqual({h: 1}[self.h], 1)
         
     
\ No newline at end of file